@@ -0,0 +1,124 @@
+import asyncio
+import urllib.parse
+from cachelib import SimpleCache
+from backend import config
+from backend.async_upstream import AsyncUpstreamClient
+from backend.crawler import AsyncCatalogCrawler, CrawlError
+from backend.decoding import decode_privacyspy, response_json
+from backend.logos import LogoService
+from backend.data_metrics import (merge_site_list, privacyspy_icon, tosdr_error,
+                                  tosdr_record, tosdr_search_id)
+from backend.service_index import ServiceIndex
+
+
+# async variant of the Controller upstream methods, for bulk refreshes that
+# re-score thousands of services on one event loop. The parsing is shared with
+# Controller, which stays the sync api the dashboard callbacks use
+class AsyncController:
+
+    def __init__(self, client=None, privacyspy=None, concurrency=32, logos=None):
+        '''
+        client: (AsyncUpstreamClient) defaults to a new pooled client
+        privacyspy: (list) already loaded privacyspy data, fetched by load() otherwise
+        concurrency: (int) max lookups in flight in the *_many methods
+        logos: (LogoService) checks logos the way the dashboard does, with its own
+               in memory verdicts by default as there is no app cache here
+        '''
+        self.client = client or AsyncUpstreamClient()
+        self.logos = logos or LogoService(store=SimpleCache(threshold=100000))
+        self.privacyspy = privacyspy or []
+        self.concurrency = concurrency
+        self.crawl_stats = None
+        self.service_index = ServiceIndex()
+
+    async def load(self):
+        self.privacyspy = await self.get_privacyspy_data() or []
+        return self
+
+    async def get_privacyspy_data(self):
+        try:
+            ps_response = await self.client.get(config.PRIVACYSPY_URL)
+        except self.client.errors:
+            return None
+
+        if ps_response.status_code != 200:
+            return None
+
+        return decode_privacyspy(ps_response.content)
+
+    async def get_tosdr_data(self, search):
+        '''
+        search: (str)
+        '''
+        if not search:
+            return None
+
+        # names from the crawled listing skip the search round trip
+        search_id = self.service_index.resolve(search)
+        if search_id is None:
+            search_url = config.TOSDR_SEARCH_URL + urllib.parse.urlencode({'query': search})
+
+            try:
+                tosdr_search = await self.client.get(search_url)
+            except self.client.errors:
+                return None
+
+            if tosdr_search.status_code != 200:
+                return tosdr_error(tosdr_search.status_code)
+
+            services = response_json(tosdr_search)['services']
+            if len(services) == 0:
+                return 'No points available...'
+
+            search_id = tosdr_search_id(services, search)
+
+        service_url = config.TOSDR_SERVICE_URL + urllib.parse.urlencode({'id': search_id})
+
+        try:
+            tosdr_service = await self.client.get(service_url)
+        except self.client.errors:
+            return None
+
+        if tosdr_service.status_code != 200:
+            return tosdr_error(tosdr_service.status_code, service=True)
+
+        return tosdr_record(response_json(tosdr_service))
+
+    async def get_site_list(self, **crawler_options):
+        crawler = AsyncCatalogCrawler(config.TOSDR_SERVICE_URL, client=self.client, **crawler_options)
+
+        try:
+            services = await crawler.crawl()
+        except CrawlError:
+            return None
+
+        self.crawl_stats = crawler.stats
+        self.service_index = ServiceIndex(services)
+
+        return merge_site_list(services, self.privacyspy)
+
+    # same check as Controller.get_site_image, run off the loop as LogoService is sync
+    async def get_site_image(self, privacyspy_data, tosdr_data):
+        if isinstance(tosdr_data, dict) and await asyncio.to_thread(self.logos.check, tosdr_data['image']):
+            return tosdr_data['image']
+
+        return privacyspy_icon(privacyspy_data)
+
+    # runs get_tosdr_data for many searches with at most `concurrency` in flight
+    async def get_tosdr_many(self, searches):
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(search):
+            async with slots:
+                return await self.get_tosdr_data(search)
+
+        return await asyncio.gather(*(fetch(search) for search in searches))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,77 @@
+import asyncio
+import urllib.parse
+import httpx
+from backend.upstream import UpstreamClient, RETRY_STATUSES
+
+
+# asyncio counterpart of UpstreamClient: same timeouts, retries, backoff and
+# per host caps, but hundreds of requests in flight cost coroutines, not threads
+class AsyncUpstreamClient(UpstreamClient):
+
+    errors = (httpx.HTTPError,)
+
+    # httpcore scans every pooled connection per request, so the pool stays small
+    # and extra coroutines queue for a connection instead of opening more
+    def open_session(self, pool_size):
+        connect_timeout, read_timeout = self.timeout
+        self.session = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            follow_redirects=True,
+        )
+        self.pool_size = pool_size
+        self.opened = 0
+
+    # counts new tcp connections through httpcore's trace hook
+    async def trace(self, event, info):
+        if event == 'connection.connect_tcp.complete':
+            self.opened += 1
+
+    # waiting here is cheap, waiting inside httpcore's pool queue is not
+    def slots(self, host):
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(min(self.host_limit, self.pool_size))
+        return self.host_slots[host]
+
+    async def request(self, method, url, retries=None, **kwargs):
+        retries = self.retries if retries is None else retries
+        extensions = {**kwargs.pop('extensions', {}), 'trace': self.trace}
+        slots = self.slots(urllib.parse.urlsplit(url).netloc)
+
+        for attempt in range(retries + 1):
+            self.count('requests')
+            response = None
+            error = None
+
+            async with slots:
+                try:
+                    response = await self.session.request(method, url, extensions=extensions, **kwargs)
+                except httpx.TransportError as exc:
+                    error = exc
+
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt == retries:
+                break
+
+            self.count('retries')
+            await asyncio.sleep(self.delay(attempt, response))
+
+        if error is not None:
+            self.count('errors')
+            raise error
+
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request('HEAD', url, **kwargs)
+
+    def connections(self):
+        return self.opened
+
+    async def aclose(self):
+        await self.session.aclose()
@@ -0,0 +1,951 @@
+# Benchmarks for the backend, run against local stubs so numbers are repeatable
+# To run one, from the root directory run: python -m backend.benchmarks <name>
+
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from backend import config
+from backend.crawler import CatalogCrawler
+from backend.stubs import (StubServer, catalog_handler, make_catalog_pages, make_named_products,
+                           make_products, upstream_handler)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# spawns the dashboard and returns seconds until it serves its first request
+def time_to_first_request(env, timeout=120):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', f"import dashboard; dashboard.app.run(port={port}, debug=False)"],
+        cwd=config.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        return None
+    finally:
+        process.terminate()
+        process.wait()
+
+
+# serial crawl (old behaviour: one page at a time, 1 req/sec) vs the pooled crawler
+def bench_crawl(pages=20, latency=0.1):
+    catalog = make_catalog_pages(pages)
+
+    with StubServer(catalog_handler(catalog), latency=latency) as stub:
+        url = stub.url + '/service/v3?'
+
+        for label, workers, rate in [('serial', 1, 1), ('parallel', 8, 20)]:
+            crawler = CatalogCrawler(url, workers=workers, rate=rate)
+            crawler.crawl()
+            stats = crawler.stats
+            print(f"{label:>10}: {stats.pages} pages in {stats.elapsed:.2f}s "
+                  f"({stats.pages_per_sec:.1f} pages/sec)")
+
+
+# cold start of the dashboard with slow upstreams, blocking vs background startup
+def bench_startup(pages=10, latency=0.3):
+    handler = upstream_handler(make_catalog_pages(pages), make_products(500))
+
+    # interpreter start plus importing dash/plotly, the floor for any startup mode
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', "import dash, plotly.graph_objects, dash_bootstrap_components"], check=True)
+    print(f"{'imports':>10}: {time.perf_counter() - start:.2f}s")
+
+    with StubServer(handler, latency=latency) as stub, tempfile.TemporaryDirectory() as data_dir:
+        for mode in ['blocking', 'background']:
+            env = dict(os.environ, SSM_TOSDR_API=stub.url, SSM_PRIVACYSPY_API=stub.url,
+                       SSM_DATA_DIR=data_dir, SSM_STARTUP=mode)
+            elapsed = time_to_first_request(env)
+            print(f"{mode:>10}: first request served after {elapsed:.2f}s")
+
+
+# one gunicorn-like worker: its own flask app and cache, looking up random sites
+def cache_worker(backend, cache_dir, url, keys, lookups, seed):
+    import requests
+    from flask import Flask
+    from flask_caching import Cache
+    from backend import cache_setup
+
+    config.CACHE_DIR = cache_dir
+    worker_cache = Cache()
+    worker_cache.init_app(Flask(__name__), config=cache_setup.cache_config(backend))
+
+    @worker_cache.memoize(timeout=300)
+    def lookup(key):
+        return requests.get(f"{url}/service/v3?page={key}").json()
+
+    rng = random.Random(seed)
+    for _ in range(lookups):
+        lookup(rng.randint(1, keys))
+
+
+# upstream requests and hit ratio as workers scale, per process cache vs shared backends
+def bench_shared_cache(backends=('simple', 'filesystem', 'sqlite'), worker_counts=(1, 2, 4, 8),
+                       keys=20, lookups=100):
+    catalog = make_catalog_pages(keys, per_page=20)
+    context = multiprocessing.get_context('spawn')
+
+    with StubServer(catalog_handler(catalog)) as stub:
+        for backend in backends:
+            for workers in worker_counts:
+                before = stub.count()
+
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    processes = [
+                        context.Process(target=cache_worker, args=(backend, cache_dir, stub.url, keys, lookups, seed))
+                        for seed in range(workers)
+                    ]
+                    for process in processes:
+                        process.start()
+                    for process in processes:
+                        process.join()
+
+                upstream = stub.count() - before
+                total = workers * lookups
+                print(f"{backend:>10} x{workers}: {upstream:4d} upstream requests for {total:4d} lookups "
+                      f"(hit ratio {1 - upstream / total:.2%})")
+
+
+# the lookup get_privacyspy_info did before the index, kept for comparison
+def linear_lookup(data, search):
+    from rapidfuzz import fuzz
+
+    company = ''
+    for product in data:
+        if search.lower() == product['name'].lower():
+            company = product
+            break
+        elif search.lower().split()[0] in product['name'].lower():
+            fuzzy = fuzz.ratio(search.lower(), product['name'].lower())
+            fuzzy1 = fuzz.partial_ratio(search.lower(), product['name'].lower())
+            if fuzzy >= 51 and fuzzy1 >= 87:
+                company = product
+                break
+
+    if company:
+        while company['parent']:
+            for product in data:
+                if company['parent'] == product['slug']:
+                    company = product
+                    break
+
+    return company or None
+
+
+def lookup_queries(products, count, seed=0):
+    # a third exact names, a third related names, a third sites privacyspy does not cover
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        product = rng.choice(products)
+        if i % 3 == 0:
+            queries.append(product['name'])
+        elif i % 3 == 1:
+            queries.append(product['name'].split()[0] + ' Online')
+        else:
+            queries.append(f"Unlisted Site {i}")
+    return queries
+
+
+# lookups/sec over a privacyspy sized product list, linear scan vs the index
+def bench_privacyspy_lookup(products=450, queries=3000):
+    from backend.data_metrics import Controller
+
+    data = make_named_products(products)
+    searches = lookup_queries(data, queries)
+
+    controller = Controller(load=False)
+    start = time.perf_counter()
+    controller.privacyspy = data
+    print(f"index build: {(time.perf_counter() - start) * 1000:.2f}ms for {products} products")
+
+    for label, lookup in [('linear', lambda search: linear_lookup(data, search)),
+                          ('indexed', controller.find_product)]:
+        start = time.perf_counter()
+        for search in searches:
+            lookup(search)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>10}: {queries / elapsed:,.0f} lookups/sec")
+
+
+# the per product fuzzy loop get_privacyspy_info ran before the batched matcher
+def loop_match(search, names):
+    from rapidfuzz import fuzz
+
+    first = search.split()[0]
+    for i, name in enumerate(names):
+        if first in name:
+            if fuzz.ratio(search, name) >= 51 and fuzz.partial_ratio(search, name) >= 87:
+                return i
+    return None
+
+
+# fuzzy matching throughput, python loop vs batched rapidfuzz.process.cdist
+def bench_fuzzy_match(products=450, queries=3000):
+    from backend.data_metrics import Controller
+
+    data = make_named_products(products)
+    names = [product['name'].lower() for product in data]
+    searches = [search.lower() for search in lookup_queries(data, queries) if search.lower() not in names]
+
+    controller = Controller(load=False)
+    controller.privacyspy = data
+
+    start = time.perf_counter()
+    for search in searches:
+        loop_match(search, names)
+    loop_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for search in searches:
+        controller.find_product(search)
+    single_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    controller.find_products(searches)
+    bulk_elapsed = time.perf_counter() - start
+
+    print(f"{len(searches)} fuzzy searches over {products} products")
+    print(f"{'loop':>10}: {len(searches) / loop_elapsed:,.0f} searches/sec")
+    print(f"{'bucketed':>10}: {len(searches) / single_elapsed:,.0f} searches/sec")
+    print(f"{'bulk cdist':>10}: {len(searches) / bulk_elapsed:,.0f} searches/sec")
+
+
+# bare requests.get per call vs the pooled upstream client
+def bench_upstream(calls=300):
+    import requests
+    from backend.upstream import UpstreamClient
+
+    with StubServer(lambda *args: (200, {'ok': True}, {})) as stub:
+        url = stub.url + '/ping'
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            requests.get(url)
+        print(f"{'bare':>10}: {calls / (time.perf_counter() - start):,.0f} requests/sec")
+
+        client = UpstreamClient()
+        start = time.perf_counter()
+        for _ in range(calls):
+            client.get(url)
+        print(f"{'pooled':>10}: {calls / (time.perf_counter() - start):,.0f} requests/sec, {client.stats()}")
+
+
+# bulk tosdr lookups, thread pool on the sync client vs one event loop on the async client
+def bench_async(lookups=500, latency=0.1, concurrency=200, pool_size=32):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    from backend.async_controller import AsyncController
+    from backend.async_upstream import AsyncUpstreamClient
+    from backend.data_metrics import tosdr_record, tosdr_search_id
+    from backend.stubs import make_service, tosdr_handler
+    from backend.upstream import UpstreamClient
+
+    services = [make_service(i, f"Site {i}") for i in range(1, lookups + 1)]
+    searches = [service['name'] for service in services]
+
+    with StubServer(tosdr_handler(services), latency=latency) as stub:
+        urls = dict(TOSDR_SEARCH_URL=stub.url + '/search/v5?', TOSDR_SERVICE_URL=stub.url + '/service/v3?')
+
+        # same two round trips get_tosdr_data makes, without the memo cache
+        client = UpstreamClient(host_limit=concurrency, pool_size=concurrency)
+
+        def lookup(search):
+            found = client.get(urls['TOSDR_SEARCH_URL'] + f"query={search}").json()['services']
+            service = client.get(urls['TOSDR_SERVICE_URL'] + f"id={tosdr_search_id(found, search)}")
+            return tosdr_record(service.json())
+
+        for workers in (pool_size, concurrency):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lookup, searches))
+            print(f"{'threads':>10} x{workers}: {lookups} lookups in {time.perf_counter() - start:.2f}s, "
+                  f"{workers} client threads")
+
+        async def run():
+            async with AsyncController(AsyncUpstreamClient(host_limit=concurrency, pool_size=pool_size),
+                                       concurrency=concurrency) as controller:
+                with patch.multiple('backend.config', **urls):
+                    start = time.perf_counter()
+                    await controller.get_tosdr_many(searches)
+                    elapsed = time.perf_counter() - start
+                print(f"{'asyncio':>10} x{concurrency}: {lookups} lookups in {elapsed:.2f}s, "
+                      f"1 client thread, {controller.client.stats()}")
+
+        asyncio.run(run())
+
+
+# lookup payloads shaped like get_privacyspy_info and get_tosdr_data results
+def make_lookup_payload(i, rng, points=60):
+    privacyspy = [{
+        'company': f"Site {i}",
+        'policy_score': rng.randint(0, 10),
+        'icon': f"site-{i}.png",
+        'rubric': [{'question': f"Question {q}", 'value': 'good', 'notes': ['note ' * 20],
+                    'citations': ['citation ' * 30]} for q in range(20)],
+        'sources': [f"https://site{i}.com/privacy"],
+    }]
+    tosdr = {
+        'name': f"Site {i}",
+        'rating': rng.choice('ABCDE'),
+        'image': f"https://s3.tosdr.org/logos/{i}.png",
+        'documents': [{'name': 'Privacy Policy', 'url': f"https://site{i}.com/privacy"}],
+        'points': [{'case': {'title': f"Point {p}", 'description': 'description ' * 40,
+                             'classification': 'neutral'}} for p in range(points)],
+    }
+    return privacyspy, tosdr
+
+
+# flask-caching memoize (repr of every argument) vs memoize_by keys built from the fields read
+def bench_memo_keys(sites=2000):
+    import pickle
+    from unittest.mock import patch
+    from flask import Flask
+    from backend.cache_setup import cache, cache_config
+    from backend.data_metrics import Controller
+
+    app = Flask(__name__)
+    cache.init_app(app, config={**cache_config('simple', timeout=0), 'CACHE_THRESHOLD': sites * 10})
+    controller = Controller(load=False)
+    rng = random.Random(0)
+    payloads = [make_lookup_payload(i, rng) for i in range(sites)]
+    methods = ['overall_privacy_score', 'get_site_image', 'get_policy_urls']
+
+    def cache_size():
+        entries = cache.cache._cache
+        return len(entries), sum(len(pickle.dumps((key, value))) for key, value in entries.items())
+
+    with app.app_context(), patch('backend.logos.logos.check', return_value=True), \
+            patch('backend.logos.logos.local_url', side_effect=lambda url: url):
+        for label in ('memoize', 'memoize_by'):
+            cache.clear()
+            calls = []
+            for name in methods:
+                memo = getattr(Controller, name)
+                if label == 'memoize':
+                    memo = cache.memoize(timeout=86400)(memo.uncached)
+                    make_key = lambda *args, memo=memo: memo.make_cache_key(memo.uncached, controller, *args)
+                else:
+                    make_key = memo.make_key
+                calls.append((memo, make_key))
+
+            start = time.perf_counter()
+            for make_key in [make_key for _, make_key in calls]:
+                for payload in payloads:
+                    make_key(*payload)
+            key_elapsed = time.perf_counter() - start
+
+            for memo, _ in calls:
+                for payload in payloads:
+                    memo(controller, *payload)
+            entries, size = cache_size()
+
+            print(f"{label:>10}: {key_elapsed / (sites * len(methods)) * 1e6:.1f}us per key, "
+                  f"{entries} entries, {size / 1024:.0f} KiB cached")
+
+
+# upstream bandwidth of a full refresh, cold vs warm from the snapshot store
+def bench_snapshots(pages=50, products=450):
+    from backend.snapshots import SnapshotStore
+
+    catalog = make_catalog_pages(pages)
+    dump = make_named_products(products)
+
+    for etags in (True, False):
+        with tempfile.TemporaryDirectory() as tmp, StubServer(upstream_handler(catalog, dump, etags=etags)) as stub:
+            store = SnapshotStore(os.path.join(tmp, 'snapshots.sqlite'))
+
+            for label in ('cold', 'warm'):
+                start = time.perf_counter()
+                store.fetch('privacyspy', stub.url + '/api/v2/products.json')
+                CatalogCrawler(stub.url + '/service/v3?', workers=8, rate=1000, snapshots=store).crawl()
+                elapsed = time.perf_counter() - start
+                transfer = store.take_transfer()
+
+                print(f"{'etags' if etags else 'diffing':>8} {label}: {transfer['bytes'] / 1024:,.0f} KiB in "
+                      f"{transfer['requests']} requests, {transfer['not_modified']} not modified, "
+                      f"{transfer['changed']} changed, {transfer['unchanged']} unchanged, {elapsed:.2f}s")
+
+            start = time.perf_counter()
+            SnapshotStore(store.path).load('privacyspy')
+            print(f"{'':>8} restart: privacyspy loaded from snapshot in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+# request latency across ttl boundaries, plain memo vs stale-while-revalidate
+def bench_swr(keys=20, threads=8, duration=4.0, ttl=1, latency=0.2):
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    from cachelib import SimpleCache
+    from backend.memo import memoize_by, memoize_swr
+    from backend.singleflight import SingleFlight
+
+    class Upstream:
+        def __init__(self):
+            self.calls = 0
+
+        def lookup(self, key):
+            self.calls += 1
+            time.sleep(latency)
+            return key
+
+    class Plain(Upstream):
+        lookup = memoize_by(lambda key: (key,), timeout=ttl)(Upstream.lookup)
+
+    class Revalidating(Upstream):
+        lookup = memoize_swr(lambda key: (key,), timeout=ttl)(Upstream.lookup)
+
+    for label, source in (('memoize_by', Plain()), ('memoize_swr', Revalidating())):
+        store = SimpleCache(threshold=keys * 10)
+        with patch('backend.memo.cache', store), patch('backend.memo.flights', SingleFlight(store)):
+            for key in range(keys):
+                source.lookup(key)
+            source.calls = 0
+
+            def client(seed):
+                rng = random.Random(seed)
+                latencies = []
+                end = time.perf_counter() + duration
+                while time.perf_counter() < end:
+                    start = time.perf_counter()
+                    source.lookup(rng.randrange(keys))
+                    latencies.append(time.perf_counter() - start)
+                    time.sleep(0.005)
+                return latencies
+
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                latencies = sorted(sum(pool.map(client, range(threads)), []))
+
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{label:>12}: p50 {p50:.2f}ms, p99 {p99:.2f}ms over {len(latencies)} calls, "
+              f"{source.calls} upstream calls")
+
+
+# dropdown payloads, whole catalog in the layout vs server side typeahead
+def bench_typeahead(sites=5000, queries=2000):
+    import json
+    from dash import dcc
+    from plotly.utils import PlotlyJSONEncoder
+    from backend.search import SiteIndex
+
+    names = [product['name'] for product in make_named_products(sites)]
+    rng = random.Random(0)
+    typed = [name.lower()[:rng.randint(1, 5)] for name in rng.choices(names, k=queries)]
+
+    def size(value):
+        return len(json.dumps(value, cls=PlotlyJSONEncoder))
+
+    def response(options):
+        return {'multi': True, 'response': {'site-dropdown': {'options': options}}}
+
+    start = time.perf_counter()
+    index = SiteIndex(names)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [index.search(query) for query in typed]
+    per_query = (time.perf_counter() - start) / queries
+
+    print(f"{sites} sites, index built in {build * 1000:.0f}ms, {per_query * 1e6:.0f}us per search")
+    print(f"{'catalog':>10}: layout dropdown {size(dcc.Dropdown(id='site-dropdown', options=names)) / 1024:,.1f} KiB, "
+          f"catalog refresh {size(response(names)) / 1024:,.1f} KiB")
+    print(f"{'typeahead':>10}: layout dropdown {size(dcc.Dropdown(id='site-dropdown', options=[])) / 1024:,.1f} KiB, "
+          f"search response {sum(size(response(r)) for r in results) / queries / 1024:,.2f} KiB on average")
+
+
+# comparison dropdown on a main site change, resending the catalog vs typeahead
+def bench_comparison(sites=5000, changes=200):
+    import json
+    from backend.search import SiteIndex
+
+    names = [product['name'] for product in make_named_products(sites)]
+    index = SiteIndex(names)
+    rng = random.Random(0)
+    picked = rng.choices(names, k=changes)
+
+    def respond(options):
+        return json.dumps({'multi': True, 'response': {'comparison-dropdown': {'options': options}}})
+
+    start = time.perf_counter()
+    before = [respond([s for s in names if s != site]) for site in picked]
+    before_elapsed = (time.perf_counter() - start) / changes
+
+    # a site change now only flips disabled, options come from searches typed afterwards
+    start = time.perf_counter()
+    after = [respond(index.search(site.lower()[:3], exclude=site)) for site in picked]
+    after_elapsed = (time.perf_counter() - start) / changes
+    toggle = json.dumps({'multi': True, 'response': {'comparison-dropdown': {'disabled': False}}})
+
+    print(f"{'rebuild':>10}: {sum(map(len, before)) / changes / 1024:,.1f} KiB per site change, "
+          f"{before_elapsed * 1000:.2f}ms")
+    print(f"{'typeahead':>10}: {len(toggle)} bytes per site change, "
+          f"{sum(map(len, after)) / changes / 1024:,.2f} KiB per search, {after_elapsed * 1000:.2f}ms")
+
+
+# imports the dashboard app with its data under data_dir and no reachable upstream
+def import_dashboard(data_dir):
+    from unittest.mock import patch
+
+    dead = f"http://127.0.0.1:{free_port()}"
+    settings = dict(DATA_DIR=data_dir, CACHE_BACKEND='simple', STARTUP_MODE='background',
+                    SNAPSHOT_PATH=os.path.join(data_dir, 'snapshots.sqlite'),
+                    SCORES_PATH=os.path.join(data_dir, 'scores.sqlite'),
+                    PRIVACYSPY_URL=dead + '/api/v2/products.json', TOSDR_SERVICE_URL=dead + '/service/v3?',
+                    TOSDR_SEARCH_URL=dead + '/search/v5?')
+
+    with patch.multiple('backend.config', **settings):
+        import dashboard
+    return dashboard
+
+
+# a large tosdr service and privacyspy rubric shaped like the real payloads
+def make_render_payload(points=300, questions=40):
+    privacyspy, tosdr = make_lookup_payload(1, random.Random(0), points=points)
+    categories = ['Handling', 'Transparency', 'Collection']
+    privacyspy += [{'question': f"Question {i}?", 'category': categories[i % 3], 'option': 'Yes',
+                    'percent': 50, 'total_points': 10, 'score': 5, 'citations': ['citation ' * 30]}
+                   for i in range(questions)]
+    for i, point in enumerate(tosdr['points']):
+        point['case']['classification'] = ['good', 'neutral', 'bad', 'blocker'][i % 4]
+    policies = {f"Policy {i}": f"https://site1.com/policy/{i}" for i in range(6)}
+    return privacyspy, tosdr, policies
+
+
+# building the points, rubric and policy sections per selection vs the render cache
+def bench_render(points=300, repeats=50):
+    from plotly.io.json import to_json_plotly
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        dashboard = import_dashboard(data_dir)
+        privacyspy, tosdr, policies = make_render_payload(points)
+        sections = [('points', tosdr, dashboard.make_points_accordion),
+                    ('rubric', privacyspy, dashboard.make_rubric_accordion),
+                    ('policies', policies, dashboard.policy_links)]
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            payload = [to_json_plotly(make(data)) for _, data, make in sections]
+        built = (time.perf_counter() - start) / repeats
+        print(f"{'build':>10}: {built * 1000:.2f}ms per selection, {sum(map(len, payload)) / 1024:,.1f} KiB "
+              f"({len(tosdr['points'])} points, {len(privacyspy) - 1} rubric questions)")
+
+        for section, data, make in sections:
+            dashboard.renders.render(section, data, make)
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            payload = [to_json_plotly(dashboard.renders.render(*section)) for section in sections]
+        cached = (time.perf_counter() - start) / repeats
+        print(f"{'cached':>10}: {cached * 1000:.2f}ms per selection, {sum(map(len, payload)) / 1024:,.1f} KiB")
+
+        # what expanding sends later, the hidden points of the biggest classification and one description
+        classification, points = max(dashboard.group_points(tosdr).items(), key=lambda kv: len(kv[1]))
+        shown = dashboard.POINTS_SHOWN
+        more = to_json_plotly(dashboard.make_point_items(points[shown:], classification, shown))
+        detail = to_json_plotly(dashboard.make_point_items(points[:shown], classification, 0, f"{classification}-0"))
+        print(f"{'on demand':>10}: view more {len(more) / 1024:,.1f} KiB ({len(points) - shown} points), "
+              f"opening a point {len(detail) / 1024:,.1f} KiB")
+
+
+
+
+# cold tosdr lookups of dropdown names, search/v5 first vs the crawled service index
+def bench_service_index(services=10000, lookups=200, latency=0.02):
+    from unittest.mock import patch
+    from backend.data_metrics import Controller
+    from backend.service_index import ServiceIndex
+    from backend.stubs import make_service, tosdr_handler
+
+    listing = [make_service(i, f"Site {i}") for i in range(1, services + 1)]
+    searches = [service['name'].title() for service in listing[::services // lookups]][:lookups]
+
+    start = time.perf_counter()
+    index = ServiceIndex(listing)
+    print(f"{'build':>10}: {(time.perf_counter() - start) * 1000:.0f}ms for {len(index):,} services")
+
+    hosts = [f"www.{service['urls'][0]}" for service in listing]
+    start = time.perf_counter()
+    for host in hosts:
+        index.resolve(host)
+    print(f"{'domains':>10}: {len(hosts) / (time.perf_counter() - start):,.0f} resolves/sec")
+
+    with StubServer(tosdr_handler(listing, points=0), latency=latency) as stub, \
+            patch.multiple('backend.config', TOSDR_SEARCH_URL=stub.url + '/search/v5?',
+                           TOSDR_SERVICE_URL=stub.url + '/service/v3?'):
+        for label, service_index in [('search', ServiceIndex()), ('index', index)]:
+            controller = Controller(load=False)
+            controller.service_index = service_index
+            before = stub.count()
+
+            start = time.perf_counter()
+            for search in searches:
+                Controller.get_tosdr_data.uncached(controller, search)
+            elapsed = time.perf_counter() - start
+
+            calls = (stub.count() - before) / len(searches)
+            print(f"{label:>10}: {calls:.1f} upstream calls and {elapsed / len(searches) * 1000:.1f}ms per cold lookup")
+
+
+# the merge get_site_list did before the compiled blocklist and token set, kept for comparison
+def legacy_merge_site_list(services, privacyspy_data):
+    from backend.data_metrics import FILTERED_SITES
+
+    response = []
+    for search in services:
+        if any(site.lower() in search['name'].lower() for site in FILTERED_SITES):
+            continue
+        if search['slug'] and search['rating'] != 'N/A':
+            response.append(search['name'].title())
+
+    for product in privacyspy_data or []:
+        name = product['name'] if product['slug'] else ''
+        if any(name.lower().split()[0] in res.lower() for res in response):
+            continue
+        elif name.lower() in FILTERED_SITES:
+            continue
+        else:
+            response.append(product['name'].title()) if product['slug'] else ''
+
+    response.sort()
+    return response
+
+
+# synthetic listing, one service in 50 blocklisted and one in 20 unrated
+def make_merge_catalog(services, seed=0):
+    from backend.data_metrics import FILTERED_SITES
+
+    listing = []
+    for i, product in enumerate(make_named_products(services, seed=seed)):
+        name = f"{product['name']} {FILTERED_SITES[i % len(FILTERED_SITES)]}" if i % 50 == 0 else product['name']
+        listing.append({'id': i, 'name': name, 'slug': product['slug'], 'rating': 'N/A' if i % 20 == 0 else 'C',
+                        'urls': [f"{product['slug']}.com"]})
+    return listing
+
+
+# site list merge time from 10k to 100k services, products a tenth of the listing
+def bench_merge(sizes=(10000, 25000, 50000, 100000), legacy_limit=25000):
+    from backend.data_metrics import merge_site_list
+
+    for size in sizes:
+        services = make_merge_catalog(size)
+        products = make_named_products(size // 10, seed=1)
+
+        start = time.perf_counter()
+        merged = merge_site_list(services, products)
+        elapsed = time.perf_counter() - start
+        line = f"{size:>10,}: {elapsed * 1000:,.0f}ms, {len(merged):,} sites"
+
+        # quadratic, only run where it finishes in reasonable time
+        if size <= legacy_limit:
+            start = time.perf_counter()
+            legacy = legacy_merge_site_list(services, products)
+            line += f", legacy {(time.perf_counter() - start) * 1000:,.0f}ms ({len(legacy):,} sites)"
+        print(line)
+
+
+# resident memory of this process in bytes
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# one worker holding the privacyspy dump, as the raw dicts or as a ProductStore built
+# from the full decode or from the streamed one,
+# resident memory also counts allocator pages the full json decode leaves behind
+def product_worker(mode, path, data_dir, traced, queue):
+    import gc
+    import tracemalloc
+    from backend.data_metrics import privacyspy_record
+    from backend.decoding import decode_privacyspy
+    from backend.product_store import ProductStore
+
+    gc.collect()
+    if traced:
+        tracemalloc.start()
+    base = current_rss()
+
+    if mode == 'streamed':
+        with open(path, 'rb') as f:
+            data = ProductStore(decode_privacyspy(f.read()), data_dir)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+    if mode == 'store':
+        data = ProductStore(data, data_dir)
+    gc.collect()
+
+    if traced:
+        queue.put(tracemalloc.get_traced_memory())
+        return
+
+    held = current_rss() - base
+    start = time.perf_counter()
+    for product in data:
+        privacyspy_record(product, product['name'])
+    queue.put((held, (time.perf_counter() - start) / len(data)))
+
+
+# resident memory per worker for the privacyspy data, raw dump vs the compact store
+def bench_products(products=450):
+    from backend.stubs import make_full_products
+
+    context = multiprocessing.get_context('spawn')
+
+    def run(*args):
+        queue = context.Queue()
+        process = context.Process(target=product_worker, args=(*args, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        return result
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        path = os.path.join(data_dir, 'products.json')
+        with open(path, 'w') as f:
+            json.dump(make_full_products(products), f)
+        print(f"{'dump':>10}: {os.path.getsize(path) / 2 ** 20:.1f} MiB, {products} products")
+
+        for mode in ['raw', 'store', 'streamed']:
+            held, lookup = run(mode, path, data_dir, False)
+            kept, peak = run(mode, path, data_dir, True)
+            print(f"{mode:>10}: {held / 2 ** 20:.1f} MiB resident per worker, {kept / 2 ** 20:.1f} MiB python heap "
+                  f"kept (peak {peak / 2 ** 20:.1f}), {lookup * 1000:.3f}ms per privacyspy_record")
+
+
+
+# decoding the privacyspy dump and a listing page, time and python heap peak
+def bench_decode(products=450, repeats=3):
+    import gc
+    import tracemalloc
+    from backend import decoding
+    from backend.stubs import make_full_products
+
+    body = json.dumps(make_full_products(products)).encode()
+    page = json.dumps(make_catalog_pages(1)[1]).encode()
+    print(f"{'dump':>10}: {len(body) / 2 ** 20:.1f} MiB, {products} products")
+
+    modes = [('json', json.loads), ('streamed', decoding.decode_privacyspy)]
+    if decoding.orjson is not None:
+        modes.insert(1, ('orjson', decoding.orjson.loads))
+
+    for label, decode in modes:
+        gc.collect()
+        elapsed = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decode(body)
+            elapsed.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        data = decode(body)
+        kept, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del data
+        print(f"{label:>10}: {min(elapsed) * 1000:.0f}ms, peak {peak / 2 ** 20:.1f} MiB, kept {kept / 2 ** 20:.1f} MiB")
+
+    for label, decode in [('json', json.loads), ('loads', decoding.loads)]:
+        start = time.perf_counter()
+        for _ in range(repeats * 1000):
+            decode(page)
+        elapsed = (time.perf_counter() - start) / (repeats * 1000)
+        print(f"{label:>10}: {elapsed * 1000:.3f}ms per listing page")
+
+# the gauge figure as update_dashboard built it before the template
+def build_gauge(score, name):
+    import plotly.graph_objects as go
+
+    fig = go.Figure(go.Indicator(
+        mode='gauge+number',
+        value=score,
+        title={'text': f"{name.title()} Policy Score"},
+        gauge={
+            'axis': {'range': [0, 10], 'tickvals': [0, 2, 5, 8, 10],
+                     'ticktext': ['Abysmal', 'Bad', 'Tolerable', 'Good', 'Excellent']},
+            'bar': {'color': "black"},
+            'steps': [
+                {'range': [0, 2], 'color': 'red'},
+                {'range': [2, 5], 'color': 'orange'},
+                {'range': [5, 8], 'color': 'yellow'},
+                {'range': [8, 10], 'color': 'green'}
+            ],
+        }
+    ))
+    fig.update_layout(paper_bgcolor="rgba(0,0,0,0)", font=dict(color='white'))
+    return fig
+
+
+# building and serializing a gauge per callback, plotly figure vs the patched template
+def bench_gauge(repeats=500):
+    from plotly.io.json import to_json_plotly
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        dashboard = import_dashboard(data_dir)
+        scores = [(i % 100) / 10 for i in range(repeats)]
+
+        for label, make in [('go.Figure', build_gauge), ('template', dashboard.gauge_figure)]:
+            start = time.perf_counter()
+            for score in scores:
+                make(score, 'example')
+            built = (time.perf_counter() - start) / repeats
+
+            start = time.perf_counter()
+            for score in scores:
+                payload = to_json_plotly(make(score, 'example'))
+            total = (time.perf_counter() - start) / repeats
+            print(f"{label:>10}: build {built * 1000:.3f}ms, build+serialize {total * 1000:.3f}ms, "
+                  f"{len(payload) / 1024:,.1f} KiB")
+
+        same = json.loads(to_json_plotly(build_gauge(5, 'example'))) == \
+            json.loads(to_json_plotly(dashboard.gauge_figure(5, 'example')))
+        print(f"{'':>10}  same figure json: {same}")
+
+# private and proportional set size of a process from smaps_rollup, in bytes
+def process_memory(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return fields['Private_Clean'] + fields['Private_Dirty'], fields['Pss']
+
+
+def worker_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+# repo settings plus a hook that marks each worker once the app is loaded in it
+PRELOAD_CONFIG = """
+exec(open({config!r}).read())
+
+def post_worker_init(worker):
+    open(os.path.join({ready!r}, str(os.getpid())), 'w').close()
+"""
+
+
+# gunicorn with n workers: seconds to the first response and until every worker
+# has the app, then memory per worker and for master plus workers
+def run_gunicorn(env, workers, ready_dir, timeout=300):
+    port = free_port()
+    config_path = os.path.join(ready_dir, 'gunicorn.conf.py')
+    with open(config_path, 'w') as f:
+        f.write(PRELOAD_CONFIG.format(config=os.path.join(config.BASE_DIR, 'gunicorn.conf.py'), ready=ready_dir))
+
+    env = dict(env, SSM_WORKERS=str(workers), SSM_BIND=f"127.0.0.1:{port}", SSM_REFRESH_INTERVAL='0')
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', config_path, 'dashboard:server'],
+        cwd=config.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        first = None
+        while first is None and time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        first = time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+
+        while len(os.listdir(ready_dir)) - 1 < workers and time.perf_counter() - start < timeout:
+            time.sleep(0.02)
+        everyone = time.perf_counter() - start
+
+        # a few requests per worker so each has served something before measuring
+        for _ in range(workers * 3):
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=10) as response:
+                response.read()
+
+        pids = worker_pids(process.pid)
+        memory = [process_memory(pid) for pid in pids]
+        uss = sum(private for private, _ in memory) / len(memory)
+        pss = sum(proportional for _, proportional in memory) / len(memory)
+        total = sum(proportional for _, proportional in memory) + process_memory(process.pid)[1]
+        return first, everyone, uss, pss, total
+    finally:
+        process.terminate()
+        process.wait()
+        for name in os.listdir(ready_dir):
+            os.remove(os.path.join(ready_dir, name))
+
+
+# startup and memory for 2-16 gunicorn workers, each worker loading the catalog
+# itself vs the master loading it once with preload
+def bench_preload(worker_counts=(2, 4, 8, 16), pages=200, products=450):
+    from backend.stubs import make_full_products
+
+    handler = upstream_handler(make_catalog_pages(pages), make_full_products(products))
+
+    with StubServer(handler) as stub, tempfile.TemporaryDirectory() as data_dir, \
+            tempfile.TemporaryDirectory() as ready_dir:
+        env = dict(os.environ, SSM_TOSDR_API=stub.url, SSM_PRIVACYSPY_API=stub.url, SSM_DATA_DIR=data_dir,
+                   SSM_STARTUP='preload', SSM_CACHE='simple')
+
+        # the catalog as python -m backend.refresh leaves it
+        subprocess.run([sys.executable, '-m', 'backend.refresh'], cwd=config.BASE_DIR, env=env,
+                       check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(data_dir, 'site_list.json')) as f:
+            print(f"{'catalog':>10}: {len(json.load(f)):,} sites, {products} privacyspy products")
+
+        for workers in worker_counts:
+            for label, preload in [('per worker', '0'), ('preload', '1')]:
+                first, everyone, uss, pss, total = run_gunicorn(dict(env, SSM_PRELOAD=preload), workers, ready_dir)
+                print(f"{label:>10}: {workers:>2} workers, first response {first:.2f}s, all workers {everyone:.2f}s, "
+                      f"{uss / 2 ** 20:.1f} MiB private / {pss / 2 ** 20:.1f} MiB pss per worker, "
+                      f"{total / 2 ** 20:.0f} MiB total")
+
+
+BENCHMARKS = {
+    'crawl': bench_crawl,
+    'startup': bench_startup,
+    'shared_cache': bench_shared_cache,
+    'privacyspy_lookup': bench_privacyspy_lookup,
+    'fuzzy_match': bench_fuzzy_match,
+    'upstream': bench_upstream,
+    'async': bench_async,
+    'memo_keys': bench_memo_keys,
+    'snapshots': bench_snapshots,
+    'swr': bench_swr,
+    'typeahead': bench_typeahead,
+    'comparison': bench_comparison,
+    'render': bench_render,
+    'gauge': bench_gauge,
+    'service_index': bench_service_index,
+    'merge': bench_merge,
+    'products': bench_products,
+    'decode': bench_decode,
+    'preload': bench_preload,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1,176 @@
+# Precomputes the overall score of every site in the catalog so the dashboard
+# can answer from a table instead of calling the upstream apis per click
+# To run, from the root directory run: python -m backend.bulk_score
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from backend import config
+from backend.async_controller import AsyncController
+from backend.async_upstream import AsyncUpstreamClient
+from backend.data_metrics import Controller, is_tosdr_transient, privacyspy_record
+from backend.local_sqlite import LocalConnection
+
+
+# one row per site, written as soon as the site is scored so a run can be resumed
+class ScoreTable:
+
+    def __init__(self, path):
+        '''
+        path: (str) sqlite database file, created if missing
+        '''
+        self.path = path
+        self.connection = LocalConnection(path)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection().execute(
+            'CREATE TABLE IF NOT EXISTS scores ('
+            'name TEXT PRIMARY KEY, tosdr_rating TEXT, privacyspy_score REAL, overall_score REAL, '
+            'logo TEXT, policies TEXT, privacyspy_data TEXT, tosdr_data TEXT, scored REAL NOT NULL)'
+        )
+
+    def names(self):
+        return {row[0] for row in self.connection().execute('SELECT name FROM scores')}
+
+    def count(self):
+        return self.connection().execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+    def save(self, row):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO scores (name, tosdr_rating, privacyspy_score, overall_score, logo, '
+            'policies, privacyspy_data, tosdr_data, scored) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (row['name'], row['tosdr_rating'], row['privacyspy_score'], row['overall_score'], row['logo'],
+             json.dumps(row['policies']), json.dumps(row['privacyspy_data']), json.dumps(row['tosdr_data']),
+             row.get('scored') or time.time()),
+        )
+
+    def get(self, name, max_age=None):
+        '''
+        name: (str) site name as listed in the dropdowns
+        max_age: (int) seconds, older rows are treated as missing
+        '''
+        cursor = self.connection().execute('SELECT * FROM scores WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        row = dict(zip([column[0] for column in cursor.description], row))
+        if max_age is not None and time.time() - row['scored'] > max_age:
+            return None
+
+        for column in ('policies', 'privacyspy_data', 'tosdr_data'):
+            row[column] = json.loads(row[column])
+        return row
+
+
+class BulkScorer:
+
+    def __init__(self, controller, table, concurrency=16, progress_every=100):
+        '''
+        controller: (AsyncController) already loaded with privacyspy data
+        table: (ScoreTable)
+        concurrency: (int) max sites scored at once
+        progress_every: (int) sites between progress lines, 0 for none
+        '''
+        self.controller = controller
+        self.table = table
+        self.concurrency = concurrency
+        self.progress_every = progress_every
+
+        # privacyspy lookups and scoring run locally on the sync controller's index
+        self.index = Controller(load=False)
+        self.index.privacyspy = controller.privacyspy
+
+    async def score_site(self, site, product=None):
+        '''
+        product: (Product) the site's privacyspy product, as matched by find_products
+        returns the table row for the site, or None when the upstream was unavailable
+        '''
+        privacyspy_data = privacyspy_record(product, site) if self.index.privacyspy else None
+        tosdr_data = await self.controller.get_tosdr_data(site)
+
+        # left out of the table so a resumed run tries the site again
+        if is_tosdr_transient(tosdr_data):
+            return None
+
+        return {
+            'name': site,
+            'tosdr_rating': tosdr_data['rating'] if isinstance(tosdr_data, dict) else None,
+            'privacyspy_score': privacyspy_data[0]['policy_score'] if isinstance(privacyspy_data, list) else None,
+            'overall_score': Controller.overall_privacy_score.uncached(self.index, privacyspy_data, tosdr_data),
+            'logo': await self.controller.get_site_image(privacyspy_data, tosdr_data),
+            'policies': Controller.get_policy_urls.uncached(self.index, privacyspy_data, tosdr_data),
+            'privacyspy_data': privacyspy_data,
+            'tosdr_data': tosdr_data,
+        }
+
+    async def run(self, sites, refresh=False):
+        '''
+        sites: (list) site names, usually the full get_site_list catalog
+        refresh: (bool) rescore sites already in the table instead of resuming
+        returns a dict of counts and throughput
+        '''
+        done = set() if refresh else self.table.names()
+        todo = [site for site in sites if site not in done]
+        stats = {'total': len(sites), 'skipped': len(sites) - len(todo), 'scored': 0, 'failed': 0}
+        slots = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+
+        # privacyspy matches for the whole run, fuzzy matched in batches up front
+        products = self.index.find_products(todo) if self.index.privacyspy else [None] * len(todo)
+
+        async def score(site, product):
+            async with slots:
+                row = await self.score_site(site, product)
+
+            if row is None:
+                stats['failed'] += 1
+            else:
+                self.table.save(row)
+                stats['scored'] += 1
+
+            finished = stats['scored'] + stats['failed']
+            if self.progress_every and finished % self.progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{finished}/{len(todo)} sites, {stats['failed']} failed, "
+                      f"{finished / elapsed:.1f} sites/sec")
+
+        await asyncio.gather(*(score(site, product) for site, product in zip(todo, products)))
+
+        stats['elapsed'] = time.perf_counter() - start
+        stats['sites_per_sec'] = len(todo) / stats['elapsed'] if stats['elapsed'] else 0.0
+        return stats
+
+
+async def main(path, concurrency, refresh, limit=None):
+    table = ScoreTable(path)
+    client = AsyncUpstreamClient(host_limit=concurrency, pool_size=concurrency)
+
+    async with AsyncController(client, concurrency=concurrency) as controller:
+        await controller.load()
+        sites = await controller.get_site_list()
+        if not sites:
+            print('could not crawl the site list')
+            return None
+
+        stats = await BulkScorer(controller, table, concurrency).run(sites[:limit], refresh=refresh)
+
+    print(f"{stats['scored']} scored, {stats['failed']} failed, {stats['skipped']} already in the table, "
+          f"{stats['sites_per_sec']:.1f} sites/sec over {stats['elapsed']:.1f}s")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='precompute the overall score of every site')
+    parser.add_argument('--path', default=config.SCORES_PATH, help='score table to write')
+    parser.add_argument('--concurrency', type=int, default=16, help='sites scored at once')
+    parser.add_argument('--refresh', action='store_true', help='rescore sites already in the table')
+    parser.add_argument('--limit', type=int, default=None, help='only score the first n sites')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.path, args.concurrency, args.refresh, args.limit))
@@ -1,2 +1,32 @@
+import os
 from flask_caching import Cache
-cache = Cache()
\ No newline at end of file
+from backend import config
+
+cache = Cache()
+
+CACHE_TYPES = {
+    'simple': 'SimpleCache',
+    'filesystem': 'FileSystemCache',
+    'sqlite': 'backend.sqlite_cache.sqlite_cache',
+    'redis': 'RedisCache',
+}
+
+# builds the flask-caching config for the chosen backend
+def cache_config(backend=None, timeout=86400):
+    backend = backend or config.CACHE_BACKEND
+
+    if backend not in CACHE_TYPES:
+        raise ValueError(f"unknown cache backend {backend!r}, expected one of {sorted(CACHE_TYPES)}")
+
+    settings = {'CACHE_TYPE': CACHE_TYPES[backend], 'CACHE_DEFAULT_TIMEOUT': timeout}
+
+    if backend == 'filesystem':
+        settings['CACHE_DIR'] = config.CACHE_DIR
+        settings['CACHE_THRESHOLD'] = 10000
+    elif backend == 'sqlite':
+        settings['CACHE_SQLITE_PATH'] = os.path.join(config.CACHE_DIR, 'cache.sqlite3')
+    elif backend == 'redis':
+        settings['CACHE_REDIS_URL'] = config.CACHE_REDIS_URL
+        settings['CACHE_KEY_PREFIX'] = 'ssm:'
+
+    return settings
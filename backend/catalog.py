@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+import time
+from backend.search import SiteIndex
+
+
+# holds the site list shown in the dropdowns and rebuilds it off the request path
+class SiteCatalog:
+
+    def __init__(self, controller, path):
+        '''
+        controller: (Controller) used to fetch privacyspy data and the site list
+        path: (str) json file the last good site list is persisted to
+        '''
+        self.controller = controller
+        self.path = path
+        self.sites = self.load()
+        self.index = SiteIndex(self.sites)
+        self.version = 0
+        self.ready = threading.Event()
+        self.build_time = None
+        self.transfer = None
+        self.thread = None
+
+    @property
+    def state(self):
+        return 'ready' if self.ready.is_set() else 'loading'
+
+    # last persisted site list, or empty if there is none yet
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def save(self, sites):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(sites, f)
+        os.replace(tmp_path, self.path)
+
+    def build(self):
+        start = time.perf_counter()
+
+        try:
+            privacyspy = self.controller.get_privacyspy_data()
+            if privacyspy:
+                self.controller.privacyspy = privacyspy
+
+            sites = self.controller.get_site_list()
+
+            # swap in by reference so readers see either the old or the new list
+            if sites:
+                self.index = SiteIndex(sites)
+                self.sites = sites
+                self.version += 1
+
+                # persisting is best effort, the fresh list is already live
+                try:
+                    self.save(sites)
+                except OSError:
+                    pass
+        finally:
+            self.build_time = time.perf_counter() - start
+
+            # upstream bandwidth this refresh cost, when the controller keeps snapshots
+            if self.controller.snapshots:
+                self.transfer = self.controller.snapshots.take_transfer()
+            self.ready.set()
+
+    # picks up the list another process saved, like python -m backend.refresh
+    def reload(self):
+        sites = self.load()
+        if sites:
+            self.index = SiteIndex(sites)
+            self.sites = sites
+            self.version += 1
+            self.ready.set()
+        return self
+
+    def start(self):
+        self.thread = threading.Thread(target=self.build, name='catalog-build', daemon=True)
+        self.thread.start()
+        return self
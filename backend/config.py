@@ -0,0 +1,45 @@
+# Settings for the backend, each one can be overridden with an environment variable
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# where catalogs and snapshots are persisted between restarts
+DATA_DIR = os.environ.get('SSM_DATA_DIR', os.path.join(BASE_DIR, 'data'))
+
+# sqlite copy of the upstream data, loaded at startup and refreshed incrementally
+SNAPSHOT_PATH = os.environ.get('SSM_SNAPSHOTS', os.path.join(DATA_DIR, 'snapshots.sqlite'))
+
+# precomputed scores written by python -m backend.bulk_score, rows older than the max age are ignored
+SCORES_PATH = os.environ.get('SSM_SCORES', os.path.join(DATA_DIR, 'scores.sqlite'))
+
+# signs /logos/<slug> urls so every worker can read the logo url back out of the slug,
+# created in the data dir on first use when not set
+LOGO_KEY = os.environ.get('SSM_LOGO_KEY')
+LOGO_KEY_PATH = os.path.join(DATA_DIR, 'logo.key')
+SCORES_MAX_AGE = int(os.environ.get('SSM_SCORES_MAX_AGE', 7 * 86400))
+
+# upstream apis, pointed at local stubs for tests and benchmarks
+TOSDR_API = os.environ.get('SSM_TOSDR_API', 'https://api.tosdr.org').rstrip('/')
+PRIVACYSPY_API = os.environ.get('SSM_PRIVACYSPY_API', 'https://privacyspy.org').rstrip('/')
+
+PRIVACYSPY_URL = PRIVACYSPY_API + "/api/v2/products.json"
+PRIVACYSPY_ICON_URL = PRIVACYSPY_API + "/static/icons/"
+TOSDR_SERVICE_URL = TOSDR_API + "/service/v3?"
+TOSDR_SEARCH_URL = TOSDR_API + "/search/v5?"
+
+# 'background' binds immediately and builds the catalog in a thread,
+# 'blocking' builds everything before the app is served,
+# 'preload' loads the last saved catalog once in the gunicorn master (set by gunicorn.conf.py)
+STARTUP_MODE = os.environ.get('SSM_STARTUP', 'background')
+
+# last good site list, rewritten by every catalog build and by python -m backend.refresh
+SITE_LIST_PATH = os.path.join(DATA_DIR, 'site_list.json')
+
+# cache shared by every gunicorn worker: 'filesystem', 'sqlite', 'redis' or 'simple' (per process)
+CACHE_BACKEND = os.environ.get('SSM_CACHE', 'filesystem')
+CACHE_DIR = os.environ.get('SSM_CACHE_DIR', os.path.join(DATA_DIR, 'cache'))
+CACHE_REDIS_URL = os.environ.get('SSM_REDIS_URL', 'redis://localhost:6379/0')
+
+# lock files workers take before calling upstream with the filesystem cache,
+# kept out of CACHE_DIR as cachelib treats everything in there as a cache entry
+LOCK_DIR = os.environ.get('SSM_LOCK_DIR', os.path.join(DATA_DIR, 'locks'))
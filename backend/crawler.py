@@ -0,0 +1,245 @@
+import asyncio
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from backend import config
+from backend.decoding import response_json
+from backend.upstream import client as upstream_client, retry_after_seconds, RETRY_STATUSES
+
+
+class CrawlError(Exception):
+    pass
+
+
+# shared rate limiter so every worker in the pool draws from one budget
+class TokenBucket:
+
+    def __init__(self, rate, capacity=None):
+        '''
+        rate: (float) tokens added per second
+        capacity: (int) max burst size, defaults to the rate
+        '''
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    # takes a token if one is free, otherwise returns how long to wait before trying again
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            elif self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            else:
+                return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    # stop handing out tokens, used when the api answers with a 429
+    def pause(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class CrawlStats:
+
+    def __init__(self):
+        self.pages = 0
+        self.requests = 0
+        self.throttled = 0
+        self.elapsed = 0.0
+
+    @property
+    def pages_per_sec(self):
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f"CrawlStats(pages={self.pages}, requests={self.requests}, throttled={self.throttled}, "
+                f"elapsed={self.elapsed:.2f}s, pages_per_sec={self.pages_per_sec:.2f})")
+
+
+# crawls every page of the tosdr service listing
+class CatalogCrawler:
+
+    def __init__(self, base_url=config.TOSDR_SERVICE_URL, workers=4, rate=4, burst=None,
+                 max_retries=5, backoff=1.0, client=None, snapshots=None):
+        '''
+        base_url: (str) paginated service listing endpoint
+        client: (UpstreamClient) defaults to the shared pooled client
+        workers: (int) max pages in flight at once
+        rate: (float) max requests per second across all workers
+        max_retries: (int) attempts per page on 429/5xx/connection errors
+        backoff: (float) base delay when the api gives no Retry-After
+        snapshots: (SnapshotStore) optional, pages are then fetched conditionally and stored
+        '''
+        self.base_url = base_url
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = client or upstream_client
+        self.snapshots = snapshots
+        self.stats = CrawlStats()
+        self.lock = threading.Lock()
+
+    def page_url(self, page):
+        return self.base_url + urllib.parse.urlencode({'page': page})
+
+    def page_name(self, page):
+        return f"tosdr:page:{page}"
+
+    def page_headers(self, page):
+        return self.snapshots.validators(self.page_name(page)) if self.snapshots else {}
+
+    # the crawler does its own rate limiting and backoff so the client must not retry
+    def get(self, url, headers=None):
+        return self.client.get(url, retries=0, headers=headers)
+
+    # returns (page json, None) on success or (None, seconds to back off)
+    def check_response(self, page, response, attempt):
+        if response is not None and self.snapshots and response.status_code in (200, 304):
+            data = self.snapshots.record(self.page_name(page), response)
+            if data is not None:
+                with self.lock:
+                    self.stats.pages += 1
+                return data, None
+
+        if response is not None and response.status_code == 200:
+            with self.lock:
+                self.stats.pages += 1
+            return response_json(response), None
+
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            raise CrawlError(f"page {page} failed with status {response.status_code}")
+
+        # back off every worker, honouring Retry-After when the api sends one
+        delay = None
+        if response is not None and response.status_code == 429:
+            with self.lock:
+                self.stats.throttled += 1
+            delay = retry_after_seconds(response.headers.get('Retry-After'))
+
+        if delay is None:
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+        return None, delay
+
+    def fetch_page(self, page):
+        url = self.page_url(page)
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+
+            with self.lock:
+                self.stats.requests += 1
+
+            try:
+                response = self.get(url, self.page_headers(page))
+            except self.client.errors:
+                response = None
+
+            data, delay = self.check_response(page, response, attempt)
+            if delay is None:
+                return data
+
+            self.bucket.pause(delay)
+
+        raise CrawlError(f"page {page} failed after {self.max_retries} retries")
+
+    def crawl(self):
+        '''
+        returns every service entry across all pages, in page order
+        '''
+        self.stats = CrawlStats()
+        start = time.perf_counter()
+
+        # first page tells us how many pages there are
+        first = self.fetch_page(1)
+        end_page = first['page']['end']
+
+        pages = [first]
+        if end_page > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pages += list(pool.map(self.fetch_page, range(2, end_page + 1)))
+
+        self.stats.elapsed = time.perf_counter() - start
+
+        services = []
+        for page in pages:
+            services.extend(page['services'])
+
+        return services
+
+
+# same crawl on an event loop, pages in flight are coroutines instead of threads
+class AsyncCatalogCrawler(CatalogCrawler):
+
+    async def get(self, url, headers=None):
+        return await self.client.get(url, retries=0, headers=headers)
+
+    async def fetch_page(self, page):
+        url = self.page_url(page)
+
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire_async()
+            self.stats.requests += 1
+
+            try:
+                response = await self.get(url, self.page_headers(page))
+            except self.client.errors:
+                response = None
+
+            data, delay = self.check_response(page, response, attempt)
+            if delay is None:
+                return data
+
+            self.bucket.pause(delay)
+
+        raise CrawlError(f"page {page} failed after {self.max_retries} retries")
+
+    async def crawl(self):
+        self.stats = CrawlStats()
+        start = time.perf_counter()
+
+        first = await self.fetch_page(1)
+        end_page = first['page']['end']
+
+        slots = asyncio.Semaphore(self.workers)
+
+        async def fetch(page):
+            async with slots:
+                return await self.fetch_page(page)
+
+        pages = [first]
+        pages += await asyncio.gather(*(fetch(page) for page in range(2, end_page + 1)))
+
+        self.stats.elapsed = time.perf_counter() - start
+
+        services = []
+        for page in pages:
+            services.extend(page['services'])
+
+        return services
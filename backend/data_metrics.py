@@ -1,35 +1,384 @@
+import os
+import re
 import urllib.parse
-import requests
-import time
-from rapidfuzz import fuzz
 from backend.cache_setup import cache
+from backend import config
+from backend.crawler import CatalogCrawler, CrawlError
+from backend.decoding import decode_privacyspy, response_json
+from backend.logos import logos
+from backend.matching import FuzzyMatcher
+from backend.memo import memoize_by, memoize_swr, payload_field
+from backend.product_store import ProductStore
+from backend.service_index import ServiceIndex
+from backend.upstream import client
+
+# entries never shown in the site list
+FILTERED_SITES = [
+        "YouPorn",
+        "XVideos",
+        "Pornhub",
+        "Spankbang",
+        "4porn",
+        "Thumbzilla",
+        "Rule34",
+        "Danbooru",
+        "FAKKU",
+        "e621/e926",
+        "CockFile",
+        "OnlyFans",
+        "Weasyl",
+        "Pixiv",
+        "Cock.li",
+        "deprecated",
+        "depricated",
+        "deleted",
+        "discontinued",
+        "startpage.com"
+
+    ]
+
+# the parsing below is shared by Controller and AsyncController,
+# which only differ in how they talk to the apis
+
+# what get_tosdr_data returns for an unsuccessful tosdr response
+def tosdr_error(status_code, service=False):
+    if status_code == 429:
+        return 'Sent Too Many Requests...'
+    elif service and status_code == 422:
+        return 'No Points Available...'
+    else:
+        return None
+
+# get_tosdr_data results that mean tosdr was unavailable, not that the site has no data
+TOSDR_TRANSIENT = (None, 'Sent Too Many Requests...')
+
+def is_tosdr_transient(tosdr_data):
+    return tosdr_data in TOSDR_TRANSIENT
+
+# grabs first id - api data is already fuzzy search enabled
+# makes sure that it is the right search
+def tosdr_search_id(services, search):
+    search_id=''
+    for service in services:
+        if service['rating'] == 'N/A':
+            continue
+        elif service['name'].lower() == search.lower():
+            search_id = service['id']
+            break
+        elif any(search.lower() in url.lower() for url in service['urls']):
+            search_id = service['id']
+            break
+
+    return search_id
+
+# dictionary of useful data from a tosdr service
+def tosdr_record(tosdr_service_json):
+    return {
+        'name': tosdr_service_json['name'],
+        'rating': tosdr_service_json['rating'],
+        'image':tosdr_service_json['image'], 
+        'documents':tosdr_service_json['documents'],
+        'points': tosdr_service_json['points']
+    }
+
+# what get_privacyspy_info returns for a matched (or missing) privacyspy product
+def privacyspy_record(company, search):
+    list_of_rubric = []
+
+    # return msg if cannot find search in privacyspy
+    if not company:
+        return f"Analysis for {search.capitalize()} are currently unavailable..."
+
+    # get all useful data
+
+    list_of_rubric.append(
+        {
+        'company': company['name'],
+        'policy_score': company['score'],
+        'icon': company['icon'],
+        'sources': company['sources']
+        }
+    )
+
+
+    rubric = company['rubric']
+
+    # check if there is a rubric for the search
+    if not rubric:
+        return f"{search} in data but no rubric information currently..."
+    else:
+
+        for item in rubric:
+
+            question = item['question']
+            score = (
+                item['option']['percent'] / 100
+                * question['points']
+                )
+            list_of_rubric.append({
+                'question': question['text'],
+                'category': question['category'].capitalize(),
+                'option': item['option']['text'],
+                'percent': item['option']['percent'],
+                'total_points': question['points'],
+                'citations': item['citations'],
+                'score': round(score)
+                })
+
+    return list_of_rubric
+
+# blocklist compiled once, a service is dropped if its name contains any entry
+FILTERED_PATTERN = re.compile('|'.join(re.escape(site.lower()) for site in FILTERED_SITES))
+
+# products are only dropped on an exact match
+FILTERED_NAMES = set(FILTERED_SITES)
+
+# lowercased words of a name, 'Zoom.us' -> ['zoom', 'us']
+def name_tokens(name):
+    return [token for token in re.split(r'\W+', name.lower()) if token]
+
+# builds the sorted site list from the tosdr listing and privacyspy products
+def merge_site_list(services, privacyspy_data):
+    response = []
+    for search in services:
+
+        # sanitize filtered entries
+        if FILTERED_PATTERN.search(search['name'].lower()):
+            continue
+
+        if search['slug'] and search['rating'] != 'N/A':
+            response.append(search['name'].title())
+
+    # every word of every listed name, a product whose first word is in here is already listed
+    listed = {token for res in response for token in name_tokens(res)}
+
+    # if entries already in list from tosdr then dont add
+    for product in privacyspy_data or []:
+
+        tokens = name_tokens(product['name']) if product['slug'] else []
+        if not tokens or tokens[0] in listed:
+            continue
+        elif product['name'].lower() in FILTERED_NAMES:
+            continue
+        else:
+            response.append(product['name'].title())
+            listed.update(tokens)
+    
+    response.sort()
+
+    return response
+
+# privacyspy icon url, the fallback logo
+def privacyspy_icon(privacyspy_data):
+    if isinstance(privacyspy_data, list):
+        return config.PRIVACYSPY_ICON_URL + privacyspy_data[0]['icon']
+    return None
+
+# display name of a site, tosdr's name when it has one
+def site_name(privacyspy_data, tosdr_data):
+    if isinstance(tosdr_data, dict):
+        return tosdr_data['name']
+    if isinstance(privacyspy_data, list):
+        return privacyspy_data[0]['company']
+    return ""
+
+# memo keys for the methods below, built from just the fields each one reads
+# so keys stay cheap and sites with the same scores or logo share an entry
+def search_key(search):
+    return (search,)
+
+def score_key(privacyspy_data, tosdr_data):
+    return payload_field(privacyspy_data, 'policy_score'), payload_field(tosdr_data, 'rating')
+
+def image_key(privacyspy_data, tosdr_data):
+    return payload_field(privacyspy_data, 'icon'), payload_field(tosdr_data, 'image')
+
+# a logo check that could not reach the host stores no verdict, so the
+# fallback it led to is only kept until the check is retried
+def logo_unchecked(image, privacyspy_data, tosdr_data):
+    return isinstance(tosdr_data, dict) and not logos.checked(tosdr_data['image'])
+
+def policy_key(privacyspy_data, tosdr_data):
+    return payload_field(privacyspy_data, 'sources'), payload_field(tosdr_data, 'documents')
+
+# name, slug and token lookups over one version of the privacyspy data,
+# never changed after it is built so readers need no lock
+class ProductIndex:
+
+    def __init__(self, data=None):
+        '''
+        data: (ProductStore or list) privacyspy products
+        '''
+        self.products = tuple(data or ())
+        self.names = tuple(product['name'].lower() for product in self.products)
+        self.by_name = {}
+        self.by_slug = {}
+        tokens = {}
+
+        for position, (product, name) in enumerate(zip(self.products, self.names)):
+
+            # keep the first product for a name like the old linear scan did
+            self.by_name.setdefault(name, product)
+
+            if product['slug']:
+                self.by_slug.setdefault(product['slug'], product)
+
+            # same words as merge_site_list, 'Zoom.us' is found by 'zoom'
+            for token in set(name_tokens(name)):
+                tokens.setdefault(token, []).append(position)
+
+        self.tokens = {token: tuple(positions) for token, positions in tokens.items()}
+
+    # walk up to the parent company, stopping on unknown or circular parents
+    def resolve_parent(self, company):
+        seen = set()
+        while company['parent'] and company['parent'] not in seen:
+            seen.add(company['parent'])
+            parent = self.by_slug.get(company['parent'])
+            if not parent:
+                break
+            company = parent
+
+        return company
 
 class Controller:
 
-    def __init__(self):
+    def __init__(self, load=True, snapshots=None):
+        '''
+        load: (bool) fetch privacyspy now, otherwise start from the last snapshot
+              (or empty) and let the background catalog build swap the data in
+        snapshots: (SnapshotStore) optional on-disk copy of the upstream data
+        '''
+        self.matcher = FuzzyMatcher()
+        self.snapshots = snapshots
+
         #initialize class by getting full privacyspy json
-        self.privacyspy = self.get_privacyspy_data()
+        if load:
+            self.privacyspy = self.get_privacyspy_data()
+        else:
+            self.privacyspy = (snapshots.load('privacyspy', decode_privacyspy) if snapshots else None) or []
+        self.crawl_stats = None
+        self.service_index = ServiceIndex()
+        self.load_service_index()
+
+    # privacyspy data and service index as the last refresh saved them
+    def load_snapshots(self):
+        privacyspy = self.snapshots.load('privacyspy', decode_privacyspy) if self.snapshots else None
+        if privacyspy:
+            self.privacyspy = privacyspy
+        self.load_service_index()
+
+    # service index saved by the last crawl, in this or another worker
+    def load_service_index(self):
+        entries = self.snapshots.load('tosdr-index') if self.snapshots else None
+        if entries:
+            self.service_index = ServiceIndex(entries)
+
+    # memoize keys include an id for self, keep it stable so every worker shares entries
+    def __caching_id__(self):
+        return 'controller'
 
     @cache.memoize(timeout=86400)
     def get_privacyspy_data(self):
-        #gets full privacyspy json
-        PRIVACYSPY_URL = "https://privacyspy.org/api/v2/products.json"
+        # only downloads the dump again when it changed since the snapshot
+        if self.snapshots:
+            return self.snapshots.fetch('privacyspy', config.PRIVACYSPY_URL, decode_privacyspy)
 
+        #gets full privacyspy json
         try:
-            ps_response = requests.get(PRIVACYSPY_URL)
+            ps_response = client.get(config.PRIVACYSPY_URL)
         
         # return none if getting link fails for endpoint
         except Exception:
             return None
         
         # return none if the get requests is not successful
+        # the dump is decoded a product at a time, keeping only the fields used here
         if ps_response.status_code == 200:
-            privacyspy_data = ps_response.json()
+            privacyspy_data = decode_privacyspy(ps_response.content)
         else:
             return None
         
         return privacyspy_data
     
+    # privacyspy data as a ProductStore, setting it rebuilds the lookup index
+    @property
+    def privacyspy(self):
+        return self._privacyspy
+
+    @privacyspy.setter
+    def privacyspy(self, data):
+        # rubrics are mapped from a file next to the snapshots when there are any
+        directory = os.path.dirname(self.snapshots.path) if self.snapshots else None
+        self._privacyspy = ProductStore(data, directory)
+        self.build_index(self._privacyspy)
+
+    # swapped in with one assignment, lookups running during a refresh keep the old index
+    def build_index(self, data):
+        self.product_index = ProductIndex(data)
+
+    # finds the privacyspy product for a search, resolved up to its parent company
+    def find_product(self, search):
+        index = self.product_index
+        search = search.lower()
+        tokens = name_tokens(search)
+
+        if not tokens:
+            return None
+
+        company = index.by_name.get(search)
+
+        # if doesnt match on name then fuzzy search for the best match
+        # only among products sharing the first word as that tends to be parent company
+        if not company:
+            positions = index.tokens.get(tokens[0], ())
+            best = self.matcher.match(search, [index.names[i] for i in positions])
+            company = index.products[positions[best]] if best is not None else None
+
+        if not company:
+            return None
+
+        return index.resolve_parent(company)
+
+    # find_product for many searches at once, fuzzy matches scored in one batch
+    def find_products(self, searches):
+        index = self.product_index
+        results = [None] * len(searches)
+        pending = []
+
+        for i, search in enumerate(searches):
+            search = search.lower()
+            tokens = name_tokens(search)
+            if not tokens:
+                continue
+
+            company = index.by_name.get(search)
+            if company:
+                results[i] = index.resolve_parent(company)
+            else:
+                pending.append((i, search, tokens[0]))
+
+        # group searches by first word so each bucket is scored in one batch
+        groups = {}
+        for i, search, token in pending:
+            groups.setdefault(token, []).append((i, search))
+
+        for token, group in groups.items():
+            positions = index.tokens.get(token)
+            if not positions:
+                continue
+
+            # only spread big batches over every core, threads cost more than tiny batches
+            queries = [search for _, search in group]
+            workers = -1 if len(queries) * len(positions) > 50000 else 1
+            best = self.matcher.match_many(queries, [index.names[p] for p in positions], workers=workers)
+
+            for (i, _), match in zip(group, best):
+                if match is not None:
+                    results[i] = index.resolve_parent(index.products[positions[match]])
+
+        return results
+
     @cache.memoize(timeout=86400)
     def get_privacyspy_info(self, search):
         '''
@@ -46,77 +395,11 @@ class Controller:
         if not search:
             return None
 
-        list_of_rubric = []
-
-        company =''
-    
-        # if doesnt match on name then fuzzy search for match
-        for product in data:
-            if search.lower() == product['name'].lower():
-                company = product
-                break
-
-            # only fuzzy search for first word in string as that tends to be parent company
-            elif search.lower().split()[0] in product['name'].lower():
-                fuzzy = fuzz.ratio(search.lower(), product['name'].lower())
-                fuzzy1 = fuzz.partial_ratio(search.lower(), product['name'].lower())
-                if fuzzy>=51 and fuzzy1>=87:
-                    company = product
-                    break
-                
-            
-        # return msg if cannot find search in privacyspy
-        if not company:
-            return f"Analysis for {search.capitalize()} are currently unavailable..."
-        
-        while company['parent']:
-            parent_name= company['parent']
-
-            for product in data:
-                if parent_name == product['slug']:
-                    company = product
-                    break
+        return privacyspy_record(self.find_product(search), search)
 
-        
-        # get all useful data
-        
-        list_of_rubric.append(
-            {
-            'company': company['name'],
-            'policy_score': company['score'],
-            'icon': company['icon'],
-            'sources': company['sources']
-            }
-        )
-        
-
-        rubric = company['rubric']
-
-        # check if there is a rubric for the search
-        if not rubric:
-            return f"{search} in data but no rubric information currently..."
-        else:
-            
-            for item in rubric:
-                
-                question = item['question']
-                score = (
-                    item['option']['percent'] / 100
-                    * question['points']
-                    )
-                list_of_rubric.append({
-                    'question': question['text'],
-                    'category': question['category'].capitalize(),
-                    'option': item['option']['text'],
-                    'percent': item['option']['percent'],
-                    'total_points': question['points'],
-                    'citations': item['citations'],
-                    'score': round(score)
-                    })
-                
-        return list_of_rubric
-
-    @cache.memoize(timeout=86400)  
+    # expired lookups are served stale while one background call refreshes them,
+    # 429s and outages are only cached for a minute
+    @memoize_swr(search_key, is_error=is_tosdr_transient)
     def get_tosdr_data(self, search):
         '''
         search: (str)
@@ -124,162 +407,94 @@ class Controller:
         
         if not search:
             return None
-        
-        TOSDR_SERVICE_URL = "https://api.tosdr.org/service/v3?"
-        TOSDR_SEARCH_URL = "https://api.tosdr.org/search/v5?"
-        
+
+        # the site list crawl may not have run in this worker, its saved index is enough
+        if not self.service_index:
+            self.load_service_index()
+
+        # names from the dropdowns resolve locally, anything else goes through the search
+        search_id = self.service_index.resolve(search)
+        if search_id is None:
+            found, search_id = self.search_tosdr_id(search)
+            if not found:
+                return search_id
+
+        return self.get_tosdr_service(search_id)
+
+    # asks search/v5 for the service id
+    # returns (True, id), or (False, what get_tosdr_data returns) when the search fails
+    def search_tosdr_id(self, search):
         search_params = {'query': search}
 
         # check if search is in tosdr
-        search_url = TOSDR_SEARCH_URL + urllib.parse.urlencode(search_params)
+        search_url = config.TOSDR_SEARCH_URL + urllib.parse.urlencode(search_params)
 
         # return none if search endpoint fails
         try:
-            tosdr_search = requests.get(search_url)
+            tosdr_search = client.get(search_url)
         except Exception:
-            return None
+            return False, None
 
         # return none if request is unsuccessful
-        if tosdr_search.status_code == 200:
-            tosdr_search_json = tosdr_search.json()
-        elif tosdr_search.status_code == 429:
-            return 'Sent Too Many Requests...'
-        else:
-            return None
-        
+        if tosdr_search.status_code != 200:
+            return False, tosdr_error(tosdr_search.status_code)
+
+        tosdr_search_json = response_json(tosdr_search)
+
         # if succeeds but search is not in data then return msg
         if len(tosdr_search_json['services']) == 0:
-            return 'No points available...'
-        
-        # grabs first id - api data is already fuzzy search enabled
-        # makes sure that it is the right search
-        search_id=''
-        for service in tosdr_search_json['services']:
-            if service['rating'] == 'N/A':
-                continue
-            elif service['name'].lower() == search.lower():
-                search_id = service['id']
-                break
-            elif any(search.lower() in url.lower() for url in service['urls']):
-                search_id = service['id']
-                break
+            return False, 'No points available...'
+
+        return True, tosdr_search_id(tosdr_search_json['services'], search)
+
+    def get_tosdr_service(self, search_id):
+        # details of a service whose listing entry is unchanged are served from the snapshot
+        if self.snapshots:
+            snapshot = self.snapshots.service(search_id)
+            if snapshot:
+                return tosdr_record(snapshot)
 
         id_params = {'id': search_id}
         
-        service_url = TOSDR_SERVICE_URL + urllib.parse.urlencode(id_params)
+        service_url = config.TOSDR_SERVICE_URL + urllib.parse.urlencode(id_params)
 
         # return none if service url fails
         try:
-            tosdr_service = requests.get(service_url)
+            tosdr_service = client.get(service_url)
         except Exception:
             return None
         
         #return none if request fails
-        if tosdr_service.status_code == 200:
-            tosdr_service_json = tosdr_service.json()
-        elif tosdr_service.status_code == 429:
-            return 'Sent Too Many Requests...'
-        elif tosdr_service.status_code == 422:
-            return 'No Points Available...'
-        else:
-            return None
+        if tosdr_service.status_code != 200:
+            return tosdr_error(tosdr_service.status_code, service=True)
 
-        # dictionary of useful data
-        tosdr_data = {
-            'name': tosdr_service_json['name'],
-            'rating': tosdr_service_json['rating'],
-            'image':tosdr_service_json['image'], 
-            'documents':tosdr_service_json['documents'],
-            'points': tosdr_service_json['points']
-        }
+        tosdr_service_json = response_json(tosdr_service)
+        if self.snapshots and search_id:
+            self.snapshots.save_service(search_id, tosdr_service_json)
+
+        tosdr_data = tosdr_record(tosdr_service_json)
         
         return tosdr_data
     
     # gets list of all sites
     @cache.memoize(timeout=86400)
     def get_site_list(self):
-        TOSDR_ALLSERVICE_URL = "https://api.tosdr.org/service/v3?"
-
-        params = {'page':1}
-
-        filtered_sites = [
-                "YouPorn",
-                "XVideos",
-                "Pornhub",
-                "Spankbang",
-                "4porn",
-                "Thumbzilla",
-                "Rule34",
-                "Danbooru",
-                "FAKKU",
-                "e621/e926",
-                "CockFile",
-                "OnlyFans",
-                "Weasyl",
-                "Pixiv",
-                "Cock.li",
-                "deprecated",
-                "depricated",
-                "deleted",
-                "discontinued",
-                "startpage.com"
-
-            ]
-
-        response = []
-        while True:
-            # check if search is in tosdr
-            service_url = TOSDR_ALLSERVICE_URL + urllib.parse.urlencode(params)
-            time.sleep(1)
-            # return none if search endpoint fails
-            try:
-                tosdr_search = requests.get(service_url)
-            except Exception:
-                return None
-
-            # return none if request is unsuccessful
-            if tosdr_search.status_code == 200:
-                tosdr_search_json = tosdr_search.json()
-            elif tosdr_search.status_code == 429: #too many requests so pause
-                time.sleep(1)
-                
-            
-
-            for search in tosdr_search_json['services']:
-                    
-                # sanitize filtered entries
-                if any(site.lower() in search['name'].lower() for site in filtered_sites):
-                    continue
-
-                if search['slug'] and search['rating'] != 'N/A':
-                    response.append(search['name'].title())
-
-            #pagination
-            current_page = tosdr_search_json['page']['current']
-            end_page = tosdr_search_json['page']['end']
-
-            if current_page==end_page:
-                break
-
-            params['page'] +=1
-        
-        privacyspy_data = self.privacyspy
+        # pull every page of the listing through the rate limited crawler
+        crawler = CatalogCrawler(config.TOSDR_SERVICE_URL, snapshots=self.snapshots)
 
-        # if entries already in list from tosdr then dont add
-        for product in privacyspy_data:
-           
-            name = product['name'] if product['slug'] else ''
+        # return none if the crawl fails
+        try:
+            services = crawler.crawl()
+        except CrawlError:
+            return None
 
-            if any(name.lower().split()[0] in res.lower() for res in response):
-                continue
-            elif name.lower() in filtered_sites:
-                continue
-            else:
-                response.append(product['name'].title()) if product['slug'] else ''
-        
-        response.sort()
+        self.crawl_stats = crawler.stats
+        self.service_index = ServiceIndex(services)
+        if self.snapshots:
+            self.snapshots.save_listing(services)
+            self.snapshots.save('tosdr-index', self.service_index.entries)
 
-        return response
+        return merge_site_list(services, self.privacyspy)
     
     # turns tosdr grade into a num
     def grade_site(self, score):
@@ -299,7 +514,7 @@ class Controller:
     
     
     # compute overall privacy score
-    @cache.memoize(timeout=86400)
+    @memoize_by(score_key)
     def overall_privacy_score(self, privacyspy_data, tosdr_data ):
         '''
         privacyspy_data = (list)
@@ -320,33 +535,18 @@ class Controller:
 
         return overall_score
     
-    #gets the logo of the chosen site
-    @cache.memoize(timeout=86400)
+    #gets the logo of the chosen site, served locally from /logos/<slug>
+    @memoize_by(image_key, is_error=logo_unchecked)
     def get_site_image(self, privacyspy_data, tosdr_data):
         
-        if isinstance(tosdr_data, dict) and isinstance(privacyspy_data, list):
-            image_url = tosdr_data['image']
-            image_res = requests.get(image_url)
-            if image_res.status_code == 200:
-                return image_url
-            else:
-                image_url = 'https://privacyspy.org/static/icons/'
-                return image_url + privacyspy_data[0]['icon']
-        elif isinstance(tosdr_data, dict) and isinstance(privacyspy_data, str):
-            image_url = tosdr_data['image']
-            image_res = requests.get(image_url)
-            if image_res.status_code == 200:
-                return image_url
-            else:
-                return None
-        elif isinstance(tosdr_data, str) and isinstance(privacyspy_data, list):
-            url = 'https://privacyspy.org/static/icons/'
-            return url + privacyspy_data[0]['icon']
-        else:
-            return None
+        if isinstance(tosdr_data, dict) and logos.check(tosdr_data['image']):
+            return logos.local_url(tosdr_data['image'])
+
+        icon = privacyspy_icon(privacyspy_data)
+        return logos.local_url(icon) if icon else None
     
     #gets the policy links of the chosen site
-    @cache.memoize(timeout=86400)
+    @memoize_by(policy_key)
     def get_policy_urls(self, privacyspy_data, tosdr_data):
 
         if isinstance(tosdr_data, dict) and isinstance(privacyspy_data, list):
@@ -371,4 +571,22 @@ class Controller:
 
             return policies
         else:
-            return None
\ No newline at end of file
+            return None
+
+    # what a gauge shows for a site, without building the points or rubric
+    def get_site_summary(self, privacyspy_data, tosdr_data, logo=True):
+        '''
+        privacyspy_data = (list)
+        tosdr_data = (dict)
+        logo: (bool) probe for the logo, False leaves it None
+        returns dict with name, score, logo and policies, score is None without any
+        usable payload so the gauge stays empty instead of showing a 0
+        '''
+        usable = (isinstance(privacyspy_data, list) and bool(privacyspy_data)) or isinstance(tosdr_data, dict)
+
+        return {
+            'name': site_name(privacyspy_data, tosdr_data),
+            'score': self.overall_privacy_score(privacyspy_data, tosdr_data) if usable else None,
+            'logo': self.get_site_image(privacyspy_data, tosdr_data) if logo else None,
+            'policies': self.get_policy_urls(privacyspy_data, tosdr_data),
+        }
@@ -0,0 +1,66 @@
+import json
+import re
+
+# orjson decodes the small tosdr payloads about twice as fast, the stdlib is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+decoder = json.JSONDecoder()
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+def loads(body):
+    '''
+    body: (bytes or str) json document
+    '''
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def response_json(response):
+    return loads(response.content)
+
+
+# yields the items of a top level json array one at a time, so only the
+# current item is ever decoded instead of the whole document
+def iter_array(body):
+    text = body.decode() if isinstance(body, bytes) else body
+    start = text.index('[') + 1
+    pos = SEPARATOR.match(text, start).end()
+
+    while text[pos] != ']':
+        item, pos = decoder.raw_decode(text, pos)
+        yield item
+        pos = SEPARATOR.match(text, pos).end()
+
+
+# the fields Controller reads from a privacyspy product, the rubric questions
+# lose their descriptions and option lists and the rest of the product is dropped
+def privacyspy_product(product):
+    return {
+        'name': product['name'],
+        'slug': product['slug'],
+        'parent': product.get('parent'),
+        'score': product.get('score'),
+        'icon': product.get('icon'),
+        'sources': product.get('sources') or [],
+        'rubric': [
+            {
+                'question': {key: item['question'][key] for key in ('text', 'category', 'points')},
+                'option': {key: item['option'][key] for key in ('text', 'percent')},
+                'citations': item['citations'],
+            }
+            for item in product.get('rubric') or []
+        ],
+    }
+
+
+def decode_privacyspy(body):
+    '''
+    body: (bytes or str) privacyspy's products.json
+    returns the products with only the fields Controller reads
+    '''
+    return [privacyspy_product(product) for product in iter_array(body)]
@@ -0,0 +1,36 @@
+import os
+import sqlite3
+import threading
+
+# connections a forked worker inherited, kept referenced so they are never closed
+# in the child, where closing could checkpoint or remove the parent's wal files
+inherited = []
+
+
+# sqlite connections cannot be shared across threads, so keep one per thread,
+# call it to get the current thread's connection
+class LocalConnection:
+
+    def __init__(self, path):
+        '''
+        path: (str) sqlite database file
+        '''
+        self.path = path
+        self.local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self.local, 'conn', None)
+
+        # a gunicorn worker forked after the master opened this thread's connection,
+        # sqlite handles must not be used across a fork so the worker opens its own
+        if conn is not None and self.local.pid != os.getpid():
+            inherited.append(conn)
+            conn = None
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
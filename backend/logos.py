@@ -0,0 +1,181 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import time
+from flask import Response, redirect, request
+from backend import config
+from backend.cache_setup import cache
+from backend.upstream import client as upstream_client
+
+# how long a logo check and downloaded logo bytes are trusted before revalidating
+VERDICT_TIMEOUT = 86400
+MISSING_TIMEOUT = 3600
+IMAGE_MAX_AGE = 86400
+
+# browsers may keep a served logo this long without asking again
+BROWSER_MAX_AGE = 604800
+
+
+# key shared by every worker, the first process to need one writes it and the rest read it
+def load_key(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(os.urandom(32))
+
+    # link fails if another worker got there first, its key wins
+    try:
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# checks site logos with cheap HEAD requests and serves them from /logos/<slug>,
+# so a cold lookup no longer downloads the whole image just to read its status
+class LogoService:
+
+    def __init__(self, store=None, client=None, key=None):
+        '''
+        store: (cache) anything with get/set(key, value, timeout), defaults to the shared app cache
+        client: (UpstreamClient) defaults to the shared pooled client
+        key: (bytes) signs the slugs, defaults to config.LOGO_KEY or the key file
+        '''
+        self.store = store if store is not None else cache
+        self.client = client or upstream_client
+        self._key = key
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = config.LOGO_KEY.encode() if config.LOGO_KEY else load_key(config.LOGO_KEY_PATH)
+        return self._key
+
+    # short id for the cache entries of one logo
+    def digest(self, url):
+        return hashlib.sha1(url.encode()).hexdigest()[:20]
+
+    def signature(self, encoded):
+        return hmac.new(self.key, encoded.encode(), hashlib.sha256).hexdigest()[:20]
+
+    # the slug carries the url itself, so any worker can serve it without a shared
+    # mapping, the signature keeps /logos/ from fetching urls the app never handed out
+    def slug(self, url):
+        encoded = base64.urlsafe_b64encode(url.encode()).decode().rstrip('=')
+        return f"{self.signature(encoded)}.{encoded}"
+
+    # logo url inside a slug, None if it was not signed with this key
+    def url(self, slug):
+        signature, _, encoded = slug.partition('.')
+        if not encoded or not hmac.compare_digest(signature, self.signature(encoded)):
+            return None
+
+        try:
+            return base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+
+    # local url the dashboard uses in place of the upstream logo url
+    def local_url(self, url):
+        return f"/logos/{self.slug(url)}"
+
+    def verdict_key(self, url):
+        return f"logo:ok:{self.digest(url)}"
+
+    # whether a verdict is cached, a check that failed to reach the host leaves none
+    def checked(self, url):
+        return self.store.get(self.verdict_key(url)) is not None
+
+    # whether the upstream logo exists, the verdict is cached
+    def check(self, url):
+        key = self.verdict_key(url)
+        verdict = self.store.get(key)
+        if verdict is not None:
+            return verdict
+
+        try:
+            response = self.client.head(url)
+
+            # some image hosts do not support HEAD, read the status and drop the body
+            if response.status_code in (405, 501):
+                response = self.client.get(url, stream=True)
+                response.close()
+        except self.client.errors:
+            return False
+
+        verdict = response.status_code == 200
+        self.store.set(key, verdict, timeout=VERDICT_TIMEOUT if verdict else MISSING_TIMEOUT)
+        return verdict
+
+    # logo bytes, revalidated upstream with If-None-Match/If-Modified-Since once stale
+    def fetch(self, slug):
+        url = self.url(slug)
+        if not url:
+            return None
+
+        key = f"logo:image:{self.digest(url)}"
+        entry = self.store.get(key)
+
+        if entry and time.time() - entry['fetched'] < IMAGE_MAX_AGE:
+            return entry
+
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = self.client.get(url, headers=headers)
+        except self.client.errors:
+            return entry
+
+        if response.status_code == 304 and entry:
+            entry = {**entry, 'fetched': time.time()}
+        elif response.status_code == 200:
+            entry = {
+                'body': response.content,
+                'content_type': response.headers.get('Content-Type', 'image/png'),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched': time.time(),
+            }
+        else:
+            return entry
+
+        self.store.set(key, entry, timeout=0)
+        return entry
+
+    # flask response for /logos/<slug>
+    def response(self, slug):
+        entry = self.fetch(slug)
+
+        if not entry:
+            url = self.url(slug)
+            return redirect(url) if url else Response(status=404)
+
+        etag = hashlib.sha1(entry['body']).hexdigest()
+        headers = {
+            'Cache-Control': f"public, max-age={BROWSER_MAX_AGE}",
+            'ETag': f'"{etag}"',
+        }
+
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers=headers)
+
+        return Response(entry['body'], mimetype=entry['content_type'], headers=headers)
+
+
+logos = LogoService()
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+from backend import config
+from backend.data_metrics import site_name
+from backend.logos import logos
+
+# shared by every request so concurrent callbacks do not each spin up threads
+executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='site-lookup')
+
+# seconds a single upstream call may take before the lookup gives up on it
+CALL_TIMEOUT = 15
+
+
+def result_or_none(future, timeout):
+    # a slow or failing upstream is treated like an unavailable one
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        return None
+
+
+# runs the upstream lookups for one site concurrently
+def fetch_site(controller, site, timeout=CALL_TIMEOUT, scores=None):
+    '''
+    controller: (Controller)
+    site: (str) name picked in a dropdown
+    scores: (ScoreTable) optional precomputed scores, a fresh row skips every upstream call
+    returns dict with privacyspy_data and tosdr_data, plus the name, score, image
+    and policies of get_site_summary
+    '''
+    row = scores.get(site, max_age=config.SCORES_MAX_AGE) if scores else None
+    if row:
+        return {
+            'privacyspy_data': row['privacyspy_data'],
+            'tosdr_data': row['tosdr_data'],
+            'name': site_name(row['privacyspy_data'], row['tosdr_data']),
+            'score': row['overall_score'],
+            'image': logos.local_url(row['logo']) if row['logo'] else None,
+            'policies': row['policies'],
+        }
+
+    privacyspy_future = executor.submit(controller.get_privacyspy_info, site)
+    tosdr_future = executor.submit(controller.get_tosdr_data, site)
+
+    tosdr_data = result_or_none(tosdr_future, timeout)
+    privacyspy_data = result_or_none(privacyspy_future, timeout)
+
+    # the logo probe needs the tosdr image url so it starts once tosdr is back,
+    # a probe that runs out of time leaves the rest of the summary in place
+    summary_future = executor.submit(controller.get_site_summary, privacyspy_data, tosdr_data)
+    summary = result_or_none(summary_future, timeout) or controller.get_site_summary(privacyspy_data, tosdr_data, logo=False)
+
+    return {
+        'privacyspy_data': privacyspy_data,
+        'tosdr_data': tosdr_data,
+        'name': summary['name'],
+        'score': summary['score'],
+        'image': summary['logo'],
+        'policies': summary['policies'],
+    }
@@ -0,0 +1,69 @@
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# a candidate has to clear both cutoffs to count as the same company
+RATIO_CUTOFF = 51
+PARTIAL_RATIO_CUTOFF = 87
+
+
+# scores queries against candidate names in batched rapidfuzz calls
+# and picks the best acceptable candidate instead of the first one
+class FuzzyMatcher:
+
+    def __init__(self, ratio_cutoff=RATIO_CUTOFF, partial_cutoff=PARTIAL_RATIO_CUTOFF, workers=1):
+        '''
+        ratio_cutoff: (int) minimum fuzz.ratio score
+        partial_cutoff: (int) minimum fuzz.partial_ratio score
+        workers: (int) threads used by rapidfuzz, -1 uses every core
+        '''
+        self.ratio_cutoff = ratio_cutoff
+        self.partial_cutoff = partial_cutoff
+        self.workers = workers
+
+    def scores(self, queries, names, workers=None):
+        '''
+        returns (ratio, partial_ratio) score matrices of shape (queries, names),
+        scores under the cutoffs are 0
+        '''
+        workers = workers or self.workers
+        ratio = process.cdist(queries, names, scorer=fuzz.ratio, dtype=np.float32,
+                              score_cutoff=self.ratio_cutoff, workers=workers)
+        partial = process.cdist(queries, names, scorer=fuzz.partial_ratio, dtype=np.float32,
+                                score_cutoff=self.partial_cutoff, workers=workers)
+        return ratio, partial
+
+    # index of the best name for each row, or None when nothing clears the cutoffs
+    def best(self, ratio, partial):
+        accepted = (ratio >= self.ratio_cutoff) & (partial >= self.partial_cutoff)
+
+        # rank by ratio and break ties on partial ratio, earlier names win full ties
+        ranking = np.where(accepted, ratio.astype(np.float64) * 1000 + partial, -1)
+        best = ranking.argmax(axis=1)
+
+        return [int(i) if ranking[row, i] >= 0 else None for row, i in enumerate(best)]
+
+    def match(self, query, names):
+        '''
+        query: (str) lowercase search
+        names: (list) lowercase candidate names
+        returns the index of the best matching name or None
+        '''
+        if not names:
+            return None
+
+        ratio, partial = self.scores([query], names)
+        return self.best(ratio, partial)[0]
+
+    def match_many(self, queries, names, workers=-1):
+        '''
+        queries: (list) lowercase searches
+        names: (list) lowercase candidate names
+        returns the best name index (or None) for every query
+        '''
+        if not queries:
+            return []
+        if not names:
+            return [None] * len(queries)
+
+        ratio, partial = self.scores(queries, names, workers=workers)
+        return self.best(ratio, partial)
@@ -0,0 +1,127 @@
+import functools
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backend.cache_setup import cache
+from backend.singleflight import SingleFlight
+
+# refreshes stale entries off the request path
+refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix='memo-refresh')
+
+# cache misses on the same key share one call, within and across workers
+flights = SingleFlight()
+
+
+# turns a key function result into a short stable cache key part
+def fingerprint(value):
+    return hashlib.blake2b(repr(value).encode(), digest_size=12).hexdigest()
+
+
+# the field of a privacyspy list or tosdr dict a memoized method reads,
+# the type is kept so a missing payload and an error string key differently
+def payload_field(data, field):
+    if isinstance(data, list):
+        return 'list', data[0].get(field)
+    if isinstance(data, dict):
+        return 'dict', data.get(field)
+    return type(data).__name__, data
+
+
+def memoize_by(key, timeout=86400, error_timeout=60, is_error=None):
+    '''
+    memoizes a Controller method in the shared cache, keyed by what key(*args)
+    returns instead of the repr of every argument
+    key: (callable) takes the method arguments without self, returns a small tuple
+         of the only fields the method reads
+    timeout: (int) seconds
+    error_timeout: (int) seconds results matching is_error are kept
+    is_error: (callable) takes the result and the method arguments, true for results
+              that should only be cached briefly
+    '''
+    def decorator(func):
+        prefix = f"memo:{func.__qualname__}:"
+
+        # values are wrapped so a cached None is still a hit
+        def cached(cache_key):
+            hit = cache.get(cache_key)
+            return (True, hit[0]) if isinstance(hit, tuple) else (False, None)
+
+        def compute(self, cache_key, args):
+            value = func(self, *args)
+            brief = is_error and is_error(value, *args)
+            cache.set(cache_key, (value,), timeout=error_timeout if brief else timeout)
+            return value
+
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            cache_key = prefix + fingerprint(key(*args))
+
+            hit, value = cached(cache_key)
+            if hit:
+                return value
+
+            return flights.do(cache_key, lambda: compute(self, cache_key, args), lambda: cached(cache_key))
+
+        wrapper.uncached = func
+        wrapper.make_key = lambda *args: prefix + fingerprint(key(*args))
+        return wrapper
+
+    return decorator
+
+
+def memoize_swr(key, timeout=86400, stale_timeout=7 * 86400, error_timeout=60, is_error=None):
+    '''
+    memoize_by with stale-while-revalidate: once an entry is older than timeout it keeps
+    being served for up to stale_timeout while one background call refreshes it
+    key: (callable) takes the method arguments without self, returns a small tuple
+    timeout: (int) seconds an entry is fresh
+    stale_timeout: (int) seconds an expired entry may still be served
+    error_timeout: (int) seconds results matching is_error are kept
+    is_error: (callable) value -> bool for results that should only be cached briefly
+    '''
+    def decorator(func):
+        prefix = f"memo:{func.__qualname__}:"
+
+        # only a fresh entry counts as another worker's result
+        def fresh(cache_key):
+            entry = cache.get(cache_key)
+            if isinstance(entry, dict) and entry['expires'] > time.time():
+                return True, entry['value']
+            return False, None
+
+        def compute(self, cache_key, args, previous):
+            value = func(self, *args)
+            now = time.time()
+
+            if is_error and is_error(value):
+                # a failed refresh keeps serving the last good value, just retried sooner
+                if previous:
+                    value = previous['value']
+                entry = {'value': value, 'expires': now + error_timeout}
+                cache.set(cache_key, entry, timeout=error_timeout + (stale_timeout if previous else 0))
+            else:
+                entry = {'value': value, 'expires': now + timeout}
+                cache.set(cache_key, entry, timeout=timeout + stale_timeout)
+
+            return value
+
+        def flight(self, cache_key, args, previous=None):
+            return flights.do(cache_key, lambda: compute(self, cache_key, args, previous), lambda: fresh(cache_key))
+
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            cache_key = prefix + fingerprint(key(*args))
+            entry = cache.get(cache_key)
+
+            if isinstance(entry, dict):
+                if entry['expires'] <= time.time() and not flights.in_flight(cache_key):
+                    refresher.submit(flight, self, cache_key, args, entry)
+                return entry['value']
+
+            return flight(self, cache_key, args)
+
+        wrapper.uncached = func
+        wrapper.make_key = lambda *args: prefix + fingerprint(key(*args))
+        return wrapper
+
+    return decorator
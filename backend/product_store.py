@@ -0,0 +1,123 @@
+import glob
+import hashlib
+import io
+import json
+import mmap
+import os
+import sys
+
+RUBRIC_PREFIX = 'privacyspy-rubric-'
+
+
+# one privacyspy product, only the fields lookups and scoring read stay in memory
+class Product:
+    __slots__ = ('name', 'slug', 'parent', 'score', 'icon', 'sources', 'store', 'start', 'end')
+
+    def __init__(self, product, store, start, end):
+        self.name = product['name']
+
+        # slugs and parents are interned so every parent reference shares the slug string
+        self.slug = sys.intern(product['slug']) if product['slug'] else product['slug']
+        self.parent = sys.intern(product.get('parent')) if product.get('parent') else None
+        self.score = product.get('score')
+        self.icon = product.get('icon')
+        self.sources = product.get('sources') or []
+        self.store = store
+        self.start = start
+        self.end = end
+
+    # parsed from the rubric file each time, privacyspy_record reads it once per lookup
+    @property
+    def rubric(self):
+        return self.store.rubric(self.start, self.end)
+
+    # dict style access so code written against the raw dump keeps working
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return f"Product({self.slug!r})"
+
+
+# the privacyspy dump as compact records, with every rubric kept as json in one
+# memory mapped file, so workers share its pages instead of each holding nested dicts
+class ProductStore:
+
+    def __init__(self, data=None, directory=None):
+        '''
+        data: (list) products as in privacyspy's products.json
+        directory: (str) where the rubric file is written, without one the rubrics
+                   are kept in memory as one bytes object
+        '''
+        offset = 0
+        digest = hashlib.blake2b(digest_size=8)
+        self.products = []
+        self.path = None
+
+        # rubrics are streamed out as they are encoded, the whole file never sits in memory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = os.path.join(directory, f"{RUBRIC_PREFIX}{os.getpid()}-{id(self)}.tmp")
+            out = open(tmp_path, 'wb')
+        else:
+            out = io.BytesIO()
+
+        with out:
+            for product in data or []:
+                rubric = product.get('rubric')
+                chunk = json.dumps(rubric, separators=(',', ':')).encode() if rubric else b''
+                out.write(chunk)
+                digest.update(chunk)
+                self.products.append(Product(product, self, offset, offset + len(chunk)))
+                offset += len(chunk)
+
+            if not directory:
+                self.rubrics = out.getvalue()
+
+        self.products = tuple(self.products)
+
+        if directory and offset:
+            self.rubrics = self.map(tmp_path, directory, digest.hexdigest())
+        elif directory:
+            os.remove(tmp_path)
+            self.rubrics = b''
+
+    def __len__(self):
+        return len(self.products)
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __getitem__(self, i):
+        return self.products[i]
+
+    # one file per data version, workers with the same data map the same file
+    def map(self, tmp_path, directory, digest):
+        self.path = os.path.join(directory, RUBRIC_PREFIX + digest + '.bin')
+
+        if os.path.exists(self.path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, self.path)
+
+            # older versions can go, workers still mapping one keep reading it until they refresh
+            for path in glob.glob(os.path.join(directory, RUBRIC_PREFIX + '*.bin')):
+                if path != self.path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+        with open(self.path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def rubric(self, start, end):
+        if start == end:
+            return []
+        return json.loads(self.rubrics[start:end])
@@ -0,0 +1,58 @@
+import argparse
+import os
+import signal
+import sys
+import time
+from backend import config
+from backend.catalog import SiteCatalog
+from backend.data_metrics import Controller
+from backend.snapshots import SnapshotStore
+
+
+# rebuilds the catalog and the snapshots outside the web workers, the gunicorn
+# master runs it on a timer and reloads with SIGHUP so the result is shared again
+def refresh(snapshot_path, site_list_path):
+    '''
+    snapshot_path: (str) snapshot store to refresh
+    site_list_path: (str) where the site list is saved
+    returns the number of sites saved, 0 if the upstream apis failed
+    '''
+    controller = Controller(load=False, snapshots=SnapshotStore(snapshot_path))
+
+    # straight to upstream, a list memoized by a worker would skip the crawl
+    privacyspy = Controller.get_privacyspy_data.uncached(controller)
+    if privacyspy:
+        controller.privacyspy = privacyspy
+
+    sites = Controller.get_site_list.uncached(controller)
+    if not sites:
+        return 0
+
+    SiteCatalog(controller, site_list_path).save(sites)
+    return len(sites)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='rebuild the saved site list and snapshots')
+    parser.add_argument('--snapshots', default=config.SNAPSHOT_PATH, help='snapshot store to refresh')
+    parser.add_argument('--path', default=config.SITE_LIST_PATH, help='site list to write')
+    parser.add_argument('--reload', type=int, default=None, metavar='PID',
+                        help='send this gunicorn master SIGHUP once the refresh succeeded')
+    parser.add_argument('--detach', action='store_true',
+                        help='return at once and refresh in a grandchild, so the caller never waits on it')
+    args = parser.parse_args()
+
+    # the gunicorn master reaps every child it has as a worker, and halts on some exit codes,
+    # so the refresh runs in a grandchild that is not the master's to reap
+    if args.detach and os.fork():
+        os._exit(0)
+
+    start = time.perf_counter()
+    count = refresh(args.snapshots, args.path)
+    print(f"{count} sites in {time.perf_counter() - start:.1f}s")
+
+    if count and args.reload:
+        os.kill(args.reload, signal.SIGHUP)
+    elif not count:
+        print('refresh failed, keeping the current catalog', file=sys.stderr)
+    sys.exit(0 if count else 1)
@@ -0,0 +1,46 @@
+import json
+import threading
+from collections import OrderedDict
+from plotly.io.json import to_json_plotly
+from backend.memo import fingerprint
+
+
+# keeps rendered dashboard sections as the json dash sends to the browser,
+# so selecting a site again skips building and serializing its component tree
+class RenderCache:
+
+    def __init__(self, maxsize=256):
+        '''
+        maxsize: (int) sections kept per process, least recently used are dropped first
+        '''
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, section, data, make):
+        '''
+        section: (str) which part of the page, e.g. 'points'
+        data: the payload the section is rendered from, its content is the data version
+        make: (callable) make(data) -> dash components
+        returns the json form of make(data), usable anywhere dash accepts children
+        '''
+        key = (section, fingerprint(data))
+
+        with self.lock:
+            rendered = self.entries.get(key)
+            if rendered is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return rendered
+            self.misses += 1
+
+        rendered = json.loads(to_json_plotly(make(data)))
+
+        with self.lock:
+            self.entries[key] = rendered
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return rendered
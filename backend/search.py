@@ -0,0 +1,90 @@
+import bisect
+import re
+
+# most matches a typeahead request returns
+SEARCH_LIMIT = 20
+
+
+def normalize(name):
+    return ' '.join(name.lower().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# prefix and trigram index over the site catalog, so the dropdowns can ask
+# the server for a few matches instead of holding every site name
+class SiteIndex:
+
+    def __init__(self, sites):
+        '''
+        sites: (list) site names as shown in the dropdowns
+        '''
+        # tuples throughout, the index is never changed after this and tuples of strings
+        # drop out of the garbage collector, so forked workers do not rewrite their pages
+        self.sites = tuple(sites)
+        self.keys = tuple(normalize(site) for site in self.sites)
+
+        # sorted (name, position) pairs, names starting with a prefix are one bisect away
+        self.names = tuple(sorted((key, i) for i, key in enumerate(self.keys)))
+
+        # same for every later word, so 'maps' finds 'Google Maps'
+        self.words = tuple(sorted(
+            (word, i) for i, key in enumerate(self.keys) for word in re.split(r'[\s./-]+', key)[1:] if word
+        ))
+
+        # trigram -> positions of the names containing it, for matches inside a name
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(i)
+        self.trigrams = {gram: tuple(positions) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.sites)
+
+    def prefixed(self, pairs, prefix):
+        start = bisect.bisect_left(pairs, (prefix,))
+        for key, i in pairs[start:]:
+            if not key.startswith(prefix):
+                break
+            yield i
+
+    def containing(self, query):
+        if len(query) < 3:
+            return (i for i, key in enumerate(self.keys) if query in key)
+
+        postings = sorted((self.trigrams.get(gram, ()) for gram in trigrams(query)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+
+        # trigrams can match out of order, confirm the substring
+        return (i for i in sorted(candidates, key=self.keys.__getitem__) if query in self.keys[i])
+
+    def search(self, query, limit=SEARCH_LIMIT, exclude=None):
+        '''
+        query: (str) what has been typed so far
+        limit: (int) max matches
+        exclude: (str) site left out of the matches, like the one already picked
+        returns site names, names starting with the query first, then names with a word
+        starting with it, then names containing it anywhere
+        '''
+        query = normalize(query or '')
+        if not query:
+            return []
+
+        found = []
+        seen = set()
+        for matches in (self.prefixed(self.names, query), self.prefixed(self.words, query), self.containing(query)):
+            for i in matches:
+                if i not in seen and self.sites[i] != exclude:
+                    seen.add(i)
+                    found.append(self.sites[i])
+                    if len(found) == limit:
+                        return found
+
+        return found
@@ -0,0 +1,87 @@
+import urllib.parse
+from backend.search import normalize
+
+# second level labels under country code tlds, e.g. bbc.co.uk registers bbc
+SECOND_LEVEL = {'ac', 'co', 'com', 'edu', 'gov', 'ne', 'net', 'or', 'org'}
+
+
+# host part of a url or bare domain, lowercased and without www.
+def host_of(url):
+    url = url.strip().lower()
+    if '//' not in url:
+        url = '//' + url
+    host = urllib.parse.urlsplit(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+
+# the part of a host a company registers, mail.google.com -> google.com
+def registrable_domain(host):
+    labels = host.split('.')
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+# maps the names, slugs and domains of every crawled tosdr service to its id,
+# so a lookup can go straight to service/v3 instead of asking search/v5 first
+class ServiceIndex:
+
+    def __init__(self, services=None):
+        '''
+        services: (list) tosdr listing entries with id, name, slug and urls,
+                  entries rated N/A are left out like the search does
+        '''
+        self.entries = [
+            {'id': service['id'], 'name': service['name'], 'slug': service['slug'], 'urls': service['urls']}
+            for service in services or [] if service.get('rating') != 'N/A'
+        ]
+        self.by_name = {}
+        self.by_slug = {}
+        self.by_domain = {}
+
+        # first entry wins on clashes, like tosdr_search_id picks the first match
+        for entry in self.entries:
+            self.by_name.setdefault(normalize(entry['name']), entry['id'])
+            if entry['slug']:
+                self.by_slug.setdefault(entry['slug'], entry['id'])
+
+        # exact hosts before registrable domains, so a listed subdomain keeps its own service
+        hosts = [(host_of(url), entry['id']) for entry in self.entries for url in entry['urls']]
+        for host, service_id in hosts:
+            if host:
+                self.by_domain.setdefault(host, service_id)
+        for host, service_id in hosts:
+            if host:
+                self.by_domain.setdefault(registrable_domain(host), service_id)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # domain suffix match, maps.google.com tries maps.google.com then google.com
+    def find_domain(self, search):
+        host = host_of(search)
+        if '.' not in host:
+            return None
+
+        stop = registrable_domain(host)
+        while True:
+            service_id = self.by_domain.get(host)
+            if service_id is not None or host == stop:
+                return service_id
+            host = host.split('.', 1)[1]
+
+    def resolve(self, search):
+        '''
+        search: (str) site name as shown in the dropdowns, a slug or a domain
+        returns the tosdr service id, or None when only search/v5 can tell
+        '''
+        key = normalize(search or '')
+        if not key:
+            return None
+
+        service_id = self.by_name.get(key)
+        if service_id is None:
+            service_id = self.by_slug.get(key.replace(' ', '-'))
+        if service_id is None:
+            service_id = self.find_domain(key)
+        return service_id
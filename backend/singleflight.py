@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+from backend import config
+from backend.cache_setup import cache
+
+
+# lock keys in a cache whose add is atomic, like the sqlite and redis backends
+class CacheLocks:
+
+    def __init__(self, store, timeout):
+        self.store = store
+        self.timeout = timeout
+
+    def acquire(self, key):
+        return self.store.add(key, 1, timeout=self.timeout)
+
+    def release(self, key):
+        self.store.delete(key)
+
+    def held(self, key):
+        return self.store.has(key)
+
+
+# lock files created with O_EXCL, cachelib's FileSystemCache.add checks and then
+# writes, so two workers could both take a lock key stored there
+class FileLocks:
+
+    def __init__(self, directory, timeout):
+        self.directory = directory
+        self.timeout = timeout
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '.lock')
+
+    def acquire(self, key):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+
+        # one retry after clearing a lock left by a dead worker
+        for _ in range(2):
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                if self.held(key):
+                    return False
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def release(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def held(self, key):
+        try:
+            return time.time() - os.path.getmtime(self.path(key)) < self.timeout
+        except FileNotFoundError:
+            return False
+
+
+# lets concurrent identical lookups share one upstream call: threads in a worker
+# wait on the same future, and other workers wait on a lock key in the shared cache
+class SingleFlight:
+
+    def __init__(self, store=None, lock_timeout=30, poll=0.05, locks=None):
+        '''
+        store: (cache) shared cache with an atomic add, defaults to the app cache
+        lock_timeout: (int) seconds before a lock left by a dead worker is ignored
+        poll: (float) seconds between checks while another worker holds the lock
+        locks: (CacheLocks or FileLocks) defaults to lock files in config.LOCK_DIR with a
+               filesystem app cache and to lock keys in the store otherwise
+        '''
+        self.default_store = store is None
+        self.store = store if store is not None else cache
+        self._locks = locks
+        self.lock_timeout = lock_timeout
+        self.poll = poll
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    # picked on first use, so the config can still be changed after import
+    @property
+    def locks(self):
+        if self._locks is None:
+            if self.default_store and config.CACHE_BACKEND == 'filesystem':
+                self._locks = FileLocks(config.LOCK_DIR, self.lock_timeout)
+            else:
+                self._locks = CacheLocks(self.store, self.lock_timeout)
+        return self._locks
+
+    def in_flight(self, key=None):
+        with self.lock:
+            return key in self.flights if key is not None else bool(self.flights)
+
+    def do(self, key, func, cached=None):
+        '''
+        key: (str) identifies the call, usually its cache key
+        func: (callable) makes the call and stores the result where cached reads it
+        cached: (callable) returns (True, value) once a result is stored, (False, None) before,
+                without it only calls in this worker are coalesced
+        returns func's result, or the one another thread or worker produced
+        '''
+        with self.lock:
+            future = self.flights.get(key)
+            owner = future is None
+            if owner:
+                future = self.flights[key] = Future()
+
+        if owner:
+            try:
+                future.set_result(self.run_locked(key, func, cached))
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                with self.lock:
+                    del self.flights[key]
+
+        return future.result()
+
+    def run_locked(self, key, func, cached):
+        if cached is None:
+            return func()
+
+        lock_key = f"lock:{key}"
+        if self.locks.acquire(lock_key):
+            try:
+                # the worker that held the lock before may have just stored the result
+                hit, value = cached()
+                return value if hit else func()
+            finally:
+                self.locks.release(lock_key)
+
+        # another worker is already calling upstream, wait for what it stores
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll)
+
+            hit, value = cached()
+            if hit:
+                return value
+
+            # released without a usable result, make the call here instead
+            if not self.locks.held(lock_key):
+                break
+
+        return func()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from backend.decoding import loads
+from backend.local_sqlite import LocalConnection
+from backend.upstream import client as upstream_client
+
+
+def digest(value):
+    if not isinstance(value, bytes):
+        value = json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+    return hashlib.blake2b(value, digest_size=16).hexdigest()
+
+
+# last fetched copy of every upstream document in one sqlite file under the data dir,
+# so restarts start warm and refreshes only download what changed
+class SnapshotStore:
+
+    def __init__(self, path, client=None):
+        '''
+        path: (str) sqlite database file, created if missing
+        client: (UpstreamClient) defaults to the shared pooled client
+        '''
+        self.path = path
+        self.client = client or upstream_client
+        self.connection = LocalConnection(path)
+        self.lock = threading.Lock()
+        self.transfer = self.empty_transfer()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self.connection()
+        # whole documents, the privacyspy dump and every listing page
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            'name TEXT PRIMARY KEY, body BLOB NOT NULL, digest TEXT NOT NULL, '
+            'etag TEXT, last_modified TEXT, fetched REAL NOT NULL)'
+        )
+        # tosdr service details, reused while the listing entry they came from is unchanged
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS services ('
+            'id INTEGER PRIMARY KEY, listing TEXT, record_listing TEXT, record BLOB)'
+        )
+
+    def empty_transfer(self):
+        return {'requests': 0, 'bytes': 0, 'not_modified': 0, 'changed': 0, 'unchanged': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.transfer[name] += amount
+
+    # upstream traffic since the last call, for reporting one refresh at a time
+    def take_transfer(self):
+        with self.lock:
+            transfer, self.transfer = self.transfer, self.empty_transfer()
+        return transfer
+
+    def load(self, name, decode=loads):
+        '''
+        decode: (callable) body bytes -> document, e.g. decode_privacyspy for the dump
+        '''
+        row = self.connection().execute('SELECT body FROM documents WHERE name = ?', (name,)).fetchone()
+        return decode(row[0]) if row else None
+
+    # stores a document built here rather than fetched, like the tosdr service index
+    def save(self, name, value):
+        body = json.dumps(value).encode()
+        self.connection().execute(
+            'INSERT OR REPLACE INTO documents (name, body, digest, etag, last_modified, fetched) '
+            'VALUES (?, ?, ?, NULL, NULL, ?)',
+            (name, body, digest(body), time.time()),
+        )
+
+    # conditional request headers from the stored copy
+    def validators(self, name):
+        row = self.connection().execute(
+            'SELECT etag, last_modified FROM documents WHERE name = ?', (name,)
+        ).fetchone()
+
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def record(self, name, response, decode=loads):
+        '''
+        counts and stores a 200 or 304 response for the document, the raw body is kept
+        so later refreshes can be diffed, decode only shapes what is returned
+        returns the parsed document, or None for any other status
+        '''
+        self.count('requests')
+        self.count('bytes', len(response.content))
+
+        if response.status_code == 304:
+            self.count('not_modified')
+            return self.load(name, decode)
+
+        if response.status_code != 200:
+            return None
+
+        body = response.content
+        new_digest = digest(body)
+        row = self.connection().execute('SELECT digest FROM documents WHERE name = ?', (name,)).fetchone()
+
+        # apis without validators are still diffed by content
+        self.count('unchanged' if row and row[0] == new_digest else 'changed')
+
+        self.connection().execute(
+            'INSERT OR REPLACE INTO documents (name, body, digest, etag, last_modified, fetched) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (name, body, new_digest, response.headers.get('ETag'),
+             response.headers.get('Last-Modified'), time.time()),
+        )
+        return decode(body)
+
+    def fetch(self, name, url, decode=loads):
+        '''
+        conditional GET of a whole document
+        returns the fresh document, or the stored one when upstream is down or refuses,
+        None only if there is neither
+        '''
+        try:
+            response = self.client.get(url, headers=self.validators(name))
+        except self.client.errors:
+            return self.load(name, decode)
+
+        document = self.record(name, response, decode)
+        if document is None:
+            return self.load(name, decode)
+        return document
+
+    # remembers the listing entry of every crawled service
+    def save_listing(self, services):
+        rows = [(service['id'], digest(service)) for service in services]
+        conn = self.connection()
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO services (id, listing) VALUES (?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET listing = excluded.listing',
+            rows,
+        )
+        conn.execute('COMMIT')
+
+    # stored detail record, only while its listing entry has not changed since
+    def service(self, service_id):
+        row = self.connection().execute(
+            'SELECT listing, record_listing, record FROM services WHERE id = ?', (service_id,)
+        ).fetchone()
+
+        if row and row[0] and row[0] == row[1]:
+            return loads(row[2])
+        return None
+
+    def save_service(self, service_id, record):
+        self.connection().execute(
+            'INSERT INTO services (id, record, record_listing) VALUES (?, ?, NULL) '
+            'ON CONFLICT(id) DO UPDATE SET record = excluded.record, record_listing = listing',
+            (service_id, json.dumps(record)),
+        )
@@ -0,0 +1,110 @@
+import os
+import pickle
+import time
+from cachelib import BaseCache
+from backend.local_sqlite import LocalConnection
+
+
+# cache backend stored in a single sqlite file so every gunicorn worker
+# on the host shares one set of entries without running an external service
+class SQLiteCache(BaseCache):
+
+    def __init__(self, path, default_timeout=300, prune_interval=300):
+        '''
+        path: (str) sqlite database file, created if missing
+        default_timeout: (int) seconds, 0 means entries never expire
+        prune_interval: (int) seconds between deletes of the expired rows, run by writes
+        '''
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.connection = LocalConnection(path)
+        self.prune_interval = prune_interval
+        self.pruned = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def expires_at(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return 0 if timeout == 0 else time.time() + timeout
+
+    # expired rows are only skipped on reads, without this the file keeps every key ever set
+    def prune(self):
+        self.pruned = time.time()
+        self.connection().execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (self.pruned,))
+
+    def prune_due(self):
+        if time.time() - self.pruned >= self.prune_interval:
+            self.prune()
+
+    def get(self, key):
+        row = self.connection().execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        value, expires = row
+        if expires and expires <= time.time():
+            return None
+
+        try:
+            return pickle.loads(value)
+        except (pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+    def set(self, key, value, timeout=None):
+        self.prune_due()
+        self.connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.expires_at(timeout)),
+        )
+        return True
+
+    # only writes when the key is missing or expired, safe to use as a cross-worker lock
+    def add(self, key, value, timeout=None):
+        self.prune_due()
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'DELETE FROM cache WHERE key = ? AND expires != 0 AND expires <= ?',
+                (key, time.time()),
+            )
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.expires_at(timeout)),
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        cursor = self.connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def has(self, key):
+        row = self.connection().execute(
+            'SELECT expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        return row is not None and (not row[0] or row[0] > time.time())
+
+    def clear(self):
+        self.connection().execute('DELETE FROM cache')
+        return True
+
+
+# flask-caching factory, selected with CACHE_TYPE 'backend.sqlite_cache.sqlite_cache'
+def sqlite_cache(app, config, args, kwargs):
+    return SQLiteCache(config['CACHE_SQLITE_PATH'], default_timeout=kwargs.get('default_timeout', 300))
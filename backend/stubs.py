@@ -0,0 +1,364 @@
+# Local stub upstream servers used by the unit tests and benchmarks
+# so the crawler and controller can be exercised without touching the real apis
+
+import asyncio
+import hashlib
+import http
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # a deep accept backlog so bursts of new connections are not dropped and retried
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubServer:
+    '''
+    handler: (callable) handler(method, path, query, headers) -> (status, body, headers)
+    latency: (float) seconds slept before every response
+    '''
+
+    def __init__(self, handler, latency=0):
+        self.handler = handler
+        self.latency = latency
+        self.hits = []
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path=None):
+        with self.lock:
+            return len([hit for hit in self.hits if path is None or hit[1] == path])
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            # keep-alive clients otherwise stall on delayed acks between header and body writes
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def respond(self, method):
+                parsed = urllib.parse.urlparse(self.path)
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+
+                with stub.lock:
+                    stub.hits.append((method, parsed.path, query))
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                status, body, headers = stub.handler(method, parsed.path, query, dict(self.headers))
+
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                    headers = {'Content-Type': 'application/json', **(headers or {})}
+                elif isinstance(body, str):
+                    body = body.encode()
+                body = body or b''
+
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+
+                # clients that gave up (timeouts, killed processes) are not an error here
+                if method != 'HEAD':
+                    try:
+                        self.wfile.write(body)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_HEAD(self):
+                self.respond('HEAD')
+
+        self.httpd = StubHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# the same stub on an event loop, for exercising the async engine with many requests in flight
+class AsyncStubServer:
+
+    def __init__(self, handler, latency=0):
+        self.handler = handler
+        self.latency = latency
+        self.hits = []
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path=None):
+        return len([hit for hit in self.hits if path is None or hit[1] == path])
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, target, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode().split(':', 1)
+                    headers[name.strip()] = value.strip()
+
+                parsed = urllib.parse.urlparse(target)
+                query = dict(urllib.parse.parse_qsl(parsed.query))
+                self.hits.append((method, parsed.path, query))
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                status, body, response_headers = self.handler(method, parsed.path, query, headers)
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                elif isinstance(body, str):
+                    body = body.encode()
+                body = body or b''
+
+                head = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+                        f"Content-Length: {len(body)}", "Content-Type: application/json"]
+                head += [f"{name}: {value}" for name, value in (response_headers or {}).items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + (b'' if method == 'HEAD' else body))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', 0, backlog=1024)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+def make_service(service_id, name=None, rating='B'):
+    # a single entry shaped like the tosdr service/v3 listing
+    name = name or f"Service {service_id}"
+    slug = name.lower().replace(' ', '-')
+    return {
+        'id': service_id,
+        'name': name,
+        'slug': slug,
+        'rating': rating,
+        'urls': [f"{slug}.com"],
+    }
+
+
+def make_service_record(service, points=3):
+    # the service/v3?id= detail for a listing entry
+    return {
+        **service,
+        'image': f"/logos/{service['id']}.png",
+        'documents': [{'name': 'Privacy Policy', 'url': f"https://{service['urls'][0]}/privacy"}],
+        'points': [
+            {'case': {'title': f"Point {i}", 'description': f"Point {i} of {service['name']}",
+                      'classification': ['good', 'neutral', 'bad', 'blocker'][i % 4]}}
+            for i in range(points)
+        ],
+    }
+
+
+def tosdr_handler(services, points=3):
+    # serves search/v5 and service/v3?id= for the given listing entries
+    by_id = {service['id']: service for service in services}
+
+    def handler(method, path, query, headers):
+        if path == '/search/v5':
+            search = query.get('query', '').lower()
+            return 200, {'services': [s for s in services if search in s['name'].lower()]}, {}
+
+        if path == '/service/v3' and query.get('id'):
+            service = by_id.get(int(query['id']))
+            if not service:
+                return 422, {'error': 'Unprocessable'}, {}
+            return 200, make_service_record(service, points), {}
+
+        if path.startswith('/logos/'):
+            etag = f'"{path}"'
+            if headers.get('If-None-Match') == etag:
+                return 304, b'', {'ETag': etag}
+            return 200, b'PNG', {'Content-Type': 'image/png', 'ETag': etag}
+
+        return 404, {'error': 'Not Found'}, {}
+
+    return handler
+
+
+def make_catalog_pages(pages, per_page=100):
+    # builds page number -> service/v3 listing json for a fake catalog
+    catalog = {}
+    service_id = 1
+
+    for page in range(1, pages + 1):
+        services = []
+        for _ in range(per_page):
+            services.append(make_service(service_id))
+            service_id += 1
+
+        catalog[page] = {
+            'services': services,
+            'page': {'current': page, 'end': pages},
+        }
+
+    return catalog
+
+
+def make_products(count):
+    # products shaped like the privacyspy products.json dump
+    products = []
+    for i in range(1, count + 1):
+        products.append({
+            'name': f"Product {i}",
+            'slug': f"product-{i}",
+            'parent': None,
+            'score': (i % 10) + 0.5,
+            'icon': f"product-{i}.png",
+            'sources': [f"https://product-{i}.com/privacy"],
+            'rubric': [],
+        })
+    return products
+
+
+def make_named_products(count, seed=0):
+    # products with varied multi word names, closer to the real dump for lookup benchmarks
+    rng = random.Random(seed)
+    syllables = ['go', 'ka', 'lo', 'mi', 'tra', 'zen', 'fy', 'bo', 'net', 'pix', 'ly', 'sta', 'qu', 'ro']
+    suffixes = ['', '', ' Mail', ' Maps', ' Drive', ' Cloud', ' Music', ' Chat', ' Pay', ' TV']
+    names = set()
+
+    while len(names) < count:
+        word = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+        names.add(word + rng.choice(suffixes))
+
+    products = []
+    for i, name in enumerate(sorted(names)):
+        products.append({
+            'name': name,
+            'slug': name.lower().replace(' ', '-'),
+            'parent': None,
+            'score': (i % 10) + 0.5,
+            'icon': f"{i}.png",
+            'sources': [],
+            'rubric': [],
+        })
+    return products
+
+
+
+def make_full_products(count, questions=38, seed=0):
+    # products with every field of the real products.json, rubric questions carry
+    # their option list, notes and citations, for memory and decoding benchmarks
+    rng = random.Random(seed)
+    categories = ['handling', 'transparency', 'collection']
+    options = [{'id': f"option-{o}", 'text': f"Option {o} of the question", 'percent': o * 25} for o in range(5)]
+
+    products = []
+    for product in make_named_products(count, seed=seed):
+        slug = product['slug']
+        products.append({
+            **product,
+            'description': f"{product['name']} is a service. " * 8,
+            'hostnames': [f"{slug}.com", f"www.{slug}.com"],
+            'sources': [f"https://{slug}.com/privacy", f"https://{slug}.com/terms"],
+            'lastUpdated': '2024-01-01T00:00:00.000Z',
+            'contributors': [{'slug': f"user-{rng.randint(1, 50)}", 'role': 'editor'}],
+            'updates': [{'title': 'Policy updated', 'date': '2024-01-01', 'sources': [f"https://{slug}.com/news"]}],
+            'children': [],
+            'rubric': [{
+                'question': {'slug': f"question-{q}", 'text': f"Question {q} about how data is handled?",
+                             'category': categories[q % 3], 'points': rng.choice([5, 10, 15]),
+                             'description': 'What the question checks. ' * 2, 'options': options},
+                'option': rng.choice(options),
+                'notes': ['Reviewer note. ' * 4],
+                'citations': [f"The policy says that data is handled {c} ways. " * 2 for c in range(rng.randint(1, 3))],
+            } for q in range(questions)],
+        })
+    return products
+
+# answers 304 when the client already holds this body, otherwise 200 with an ETag
+def conditional(body, headers):
+    etag = '"%s"' % hashlib.md5(json.dumps(body, sort_keys=True).encode()).hexdigest()
+    if headers.get('If-None-Match') == etag:
+        return 304, b'', {'ETag': etag}
+    return 200, body, {'ETag': etag}
+
+
+def upstream_handler(catalog, products, etags=False):
+    # serves both the tosdr listing and the privacyspy dump from one stub
+    listing = catalog_handler(catalog, etags=etags)
+
+    def handler(method, path, query, headers):
+        if path == '/api/v2/products.json':
+            return conditional(products, headers) if etags else (200, products, {})
+        return listing(method, path, query, headers)
+
+    return handler
+
+
+def catalog_handler(catalog, throttle=None, etags=False):
+    '''
+    catalog: (dict) page number -> listing json, see make_catalog_pages
+    throttle: (callable) optional throttle(page) -> retry-after seconds or None to send a 429
+    etags: (bool) send ETags and answer conditional requests with 304
+    '''
+
+    def handler(method, path, query, headers):
+        page = int(query.get('page', 1))
+
+        if throttle:
+            retry_after = throttle(page)
+            if retry_after is not None:
+                return 429, {'error': 'Too Many Requests'}, {'Retry-After': str(retry_after)}
+
+        if page not in catalog:
+            return 404, {'error': 'Not Found'}, {}
+
+        if etags:
+            return conditional(catalog[page], headers)
+        return 200, catalog[page], {}
+
+    return handler
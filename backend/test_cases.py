@@ -5,8 +5,46 @@ import sys
 from unittest.mock import MagicMock, patch
 sys.modules['flask_caching'] = MagicMock()  # Mock flask_caching so that there's no import errors
 
+import os
+import tempfile
+
+# the logo key and lock files the module level logos and flights create go to a
+# throwaway data dir, set before backend.config reads it
+TEST_DATA_DIR = tempfile.TemporaryDirectory()
+os.environ['SSM_DATA_DIR'] = TEST_DATA_DIR.name
+
+import gc
+import json
+import signal
+import subprocess
+import time
 import unittest
-from backend.data_metrics import Controller
+from concurrent.futures import ThreadPoolExecutor
+from backend.data_metrics import Controller, merge_site_list, privacyspy_icon, privacyspy_record
+from backend.product_store import ProductStore
+from backend.decoding import decode_privacyspy, iter_array, loads
+from backend.crawler import CatalogCrawler, CrawlError, TokenBucket
+from backend.upstream import UpstreamClient, retry_after_seconds
+from backend.catalog import SiteCatalog
+from backend.matching import FuzzyMatcher
+from backend.search import SiteIndex
+from backend.service_index import ServiceIndex
+from backend.render_cache import RenderCache
+from dash import html
+from backend.lookup import fetch_site
+from backend.cache_setup import cache_config
+from backend.logos import LogoService, load_key
+from backend.memo import flights, memoize_by, memoize_swr
+from backend.singleflight import FileLocks, SingleFlight
+from cachelib import FileSystemCache, SimpleCache
+from flask import Flask
+from backend.sqlite_cache import SQLiteCache
+from backend.snapshots import SnapshotStore
+from backend.bulk_score import BulkScorer, ScoreTable
+from backend.async_controller import AsyncController
+from backend.async_upstream import AsyncUpstreamClient
+from backend.stubs import (AsyncStubServer, StubServer, catalog_handler, make_catalog_pages, make_full_products,
+                           make_products, make_service, tosdr_handler, upstream_handler)
 
 class TestController(unittest.TestCase):
     def setUp(self):
@@ -67,5 +105,1193 @@ class TestController(unittest.TestCase):
         self.assertTrue(isinstance(result,str))
         self.assertTrue(result.endswith(".png"))
 
+class TestPrivacySpyIndex(unittest.TestCase):
+    def setUp(self):
+        self.controller = Controller(load=False)
+        self.controller.privacyspy = [
+            {"name": "Alphabet", "slug": "alphabet", "parent": None},
+            {"name": "Google Maps", "slug": "google-maps", "parent": "google"},
+            {"name": "Google", "slug": "google", "parent": "alphabet"},
+            {"name": "Loop", "slug": "loop", "parent": "loop"},
+        ]
+
+    def test_exact_match_resolves_parent(self):
+        self.assertEqual(self.controller.find_product("google maps")["slug"], "alphabet")
+
+    def test_fuzzy_match_uses_first_token_bucket(self):
+        self.assertEqual(self.controller.find_product("Google Map")["slug"], "alphabet")
+        self.assertEqual(self.controller.product_index.tokens["google"], (1, 2))
+
+    def test_punctuated_names_share_a_bucket(self):
+        self.controller.privacyspy = [
+            {"name": "Zoom.us", "slug": "zoom", "parent": None},
+            {"name": "Yahoo!", "slug": "yahoo", "parent": None},
+        ]
+        self.assertEqual(self.controller.find_product("Zoom")["slug"], "zoom")
+        self.assertEqual(self.controller.find_product("Yahoo")["slug"], "yahoo")
+        self.assertEqual([product["slug"] for product in self.controller.find_products(["zoom", "Yahoo"])],
+                         ["zoom", "yahoo"])
+
+    def test_refresh_swaps_the_whole_index(self):
+        old = self.controller.product_index
+        self.controller.privacyspy = [{"name": "Newco", "slug": "newco", "parent": None}]
+        self.assertIsNot(self.controller.product_index, old)
+        self.assertEqual(old.names[old.tokens["google"][0]], "google maps")
+
+    def test_missing_and_circular(self):
+        self.assertIsNone(self.controller.find_product("Unlisted Site"))
+        self.assertIsNone(self.controller.find_product("   "))
+        self.assertEqual(self.controller.find_product("Loop")["slug"], "loop")
+
+    def test_index_rebuilt_on_refresh(self):
+        self.controller.privacyspy = [{"name": "Newco", "slug": "newco", "parent": None}]
+        self.assertIsNone(self.controller.find_product("Google"))
+        self.assertEqual(self.controller.find_product("newco")["slug"], "newco")
+
+    def test_find_products_matches_single_lookups(self):
+        searches = ["Google Maps", "Google Map", "unlisted", "", "Loop"]
+        expected = [self.controller.find_product(s) if s.strip() else None for s in searches]
+        self.assertEqual(self.controller.find_products(searches), expected)
+
+class TestProductStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.products = make_products(3)
+        self.products[1]['rubric'] = [{'question': {'text': 'Sold?', 'category': 'handling', 'points': 10},
+                                       'option': {'text': 'No', 'percent': 100}, 'citations': ['we never sell']}]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_records_read_like_the_dump(self):
+        for directory in (None, self.tmp.name):
+            store = ProductStore(self.products, directory)
+            product = store[1]
+
+            self.assertEqual(len(store), 3)
+            self.assertEqual((product['name'], product['slug'], product['score']), ('Product 2', 'product-2', 2.5))
+            self.assertEqual(product['rubric'], self.products[1]['rubric'])
+            self.assertEqual(store[0]['rubric'], [])
+            self.assertIsNone(product.get('missing'))
+            with self.assertRaises(KeyError):
+                product['missing']
+
+            record = privacyspy_record(product, 'product 2')
+            self.assertEqual(record, privacyspy_record(self.products[1], 'product 2'))
+
+    def test_rubric_file_shared_per_data_version(self):
+        first = ProductStore(self.products, self.tmp.name)
+        second = ProductStore(self.products, self.tmp.name)
+        self.assertEqual(first.path, second.path)
+
+        self.products[1]['rubric'][0]['citations'] = ['changed']
+        third = ProductStore(self.products, self.tmp.name)
+
+        self.assertNotEqual(third.path, first.path)
+        self.assertEqual(os.listdir(self.tmp.name), [os.path.basename(third.path)])
+        self.assertEqual(third[1]['rubric'][0]['citations'], ['changed'])
+
+    def test_controller_maps_rubrics_next_to_snapshots(self):
+        store = SnapshotStore(os.path.join(self.tmp.name, 'snapshots.sqlite'))
+        controller = Controller(load=False, snapshots=store)
+        controller.privacyspy = self.products
+
+        self.assertEqual(os.path.dirname(controller.privacyspy.path), self.tmp.name)
+        self.assertEqual(controller.find_product('Product 2')['rubric'][0]['citations'], ['we never sell'])
+
+class TestDecoding(unittest.TestCase):
+    def test_privacyspy_dump_keeps_used_fields(self):
+        products = make_full_products(3)
+        decoded = decode_privacyspy(json.dumps(products, indent=2).encode())
+
+        self.assertEqual([product['slug'] for product in decoded], [product['slug'] for product in products])
+        self.assertNotIn('description', decoded[0])
+        self.assertEqual(set(decoded[0]['rubric'][0]['question']), {'text', 'category', 'points'})
+        for raw, slim in zip(products, decoded):
+            self.assertEqual(privacyspy_record(slim, raw['name']), privacyspy_record(raw, raw['name']))
+
+    def test_iter_array(self):
+        self.assertEqual(list(iter_array(' [ ] ')), [])
+        self.assertEqual(list(iter_array('[1, {"a": "]"} ,\n[2]]')), [1, {'a': ']'}, [2]])
+        self.assertEqual(loads(b'{"a": [1]}'), loads('{"a": [1]}'))
+
+class TestSiteIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SiteIndex(['Facebook', 'Google', 'Google Maps', 'Goodreads', 'Maps.me', 'Notebook'])
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.index.search('go'), ['Goodreads', 'Google', 'Google Maps'])
+        self.assertEqual(self.index.search('MAPS'), ['Maps.me', 'Google Maps'])
+
+    def test_matches_inside_names(self):
+        self.assertEqual(self.index.search('book'), ['Facebook', 'Notebook'])
+        self.assertEqual(self.index.search('ok'), ['Facebook', 'Notebook'])
+        self.assertEqual(self.index.search('xyz'), [])
+        self.assertEqual(self.index.search(''), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search('o', limit=2)), 2)
+
+    def test_exclude_keeps_the_limit(self):
+        self.assertEqual(self.index.search('go', limit=2, exclude='Goodreads'), ['Google', 'Google Maps'])
+
+    def test_index_is_immutable_and_untracked(self):
+        # tuples of strings are untracked by the first collection, after that
+        # there is nothing for the collector to visit in forked workers
+        gc.collect()
+        self.assertIsInstance(self.index.names, tuple)
+        self.assertFalse(gc.is_tracked(self.index.keys))
+        self.assertTrue(all(isinstance(posting, tuple) for posting in self.index.trigrams.values()))
+
+class TestServiceIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ServiceIndex([
+            {'id': 1, 'name': 'Google', 'slug': 'google', 'rating': 'E', 'urls': ['google.com', 'www.google.co.uk']},
+            {'id': 2, 'name': 'Google Maps', 'slug': 'google-maps', 'rating': 'D', 'urls': ['maps.google.com']},
+            {'id': 3, 'name': 'BBC', 'slug': 'bbc', 'rating': 'B', 'urls': ['https://www.bbc.co.uk/news']},
+            {'id': 4, 'name': 'Unrated', 'slug': 'unrated', 'rating': 'N/A', 'urls': ['unrated.com']},
+        ])
+
+    def test_dropdown_names_and_slugs(self):
+        self.assertEqual(self.index.resolve('Google Maps'), 2)
+        self.assertEqual(self.index.resolve('google  maps'), 2)
+        self.assertEqual(self.index.resolve('google-maps'), 2)
+        self.assertEqual(self.index.resolve('Bbc'), 3)
+
+    def test_domain_suffix_match(self):
+        self.assertEqual(self.index.resolve('maps.google.com'), 2)
+        self.assertEqual(self.index.resolve('https://mail.google.com/inbox'), 1)
+        self.assertEqual(self.index.resolve('google.co.uk'), 1)
+        self.assertEqual(self.index.resolve('sport.bbc.co.uk'), 3)
+        self.assertIsNone(self.index.resolve('example.co.uk'))
+
+    def test_unknown_and_unrated(self):
+        self.assertIsNone(self.index.resolve('Unrated'))
+        self.assertIsNone(self.index.resolve('Nothing'))
+        self.assertIsNone(self.index.resolve(''))
+        self.assertEqual(len(self.index), 3)
+
+class TestMergeSiteList(unittest.TestCase):
+    def test_blocklist_dedupe_and_order(self):
+        services = [make_service(1, 'zoom.us'), make_service(2, 'Google'), make_service(3, 'Old App (deprecated)'),
+                    make_service(4, 'Unrated', rating='N/A'), {**make_service(5, 'No Slug'), 'slug': None}]
+        products = [{'name': 'Google Chrome', 'slug': 'chrome'}, {'name': 'Zoom Meetings', 'slug': 'zoom'},
+                    {'name': 'Brand New', 'slug': 'bn'}, {'name': 'Brand Other', 'slug': 'bo'},
+                    {'name': 'deleted', 'slug': 'deleted'}, {'name': 'Unlisted', 'slug': None}]
+
+        self.assertEqual(merge_site_list(services, products), ['Brand New', 'Google', 'Zoom.Us'])
+        self.assertEqual(merge_site_list([], None), [])
+
+class TestFuzzyMatcher(unittest.TestCase):
+    def test_best_match_not_first_acceptable(self):
+        names = ["google map", "google maps"]
+        self.assertEqual(FuzzyMatcher().match("google maps", names), 1)
+        self.assertEqual(FuzzyMatcher().match("google maps", list(reversed(names))), 0)
+
+    def test_no_match_under_cutoffs(self):
+        self.assertIsNone(FuzzyMatcher().match("google", ["microsoft"]))
+        self.assertIsNone(FuzzyMatcher().match("google", []))
+
+    def test_match_many(self):
+        names = ["twitter", "tiktok", "google maps"]
+        self.assertEqual(FuzzyMatcher().match_many(["twitter inc", "google map", "nothing"], names), [0, 2, None])
+        self.assertEqual(FuzzyMatcher().match_many([], names), [])
+
+class SlowController:
+    # stand in controller where every upstream call sleeps for a fixed latency
+    def __init__(self, latency, tosdr_latency=None):
+        self.latency = latency
+        self.tosdr_latency = latency if tosdr_latency is None else tosdr_latency
+
+    def get_privacyspy_info(self, site):
+        time.sleep(self.latency)
+        return [{"company": site, "policy_score": 8, "icon": "icon.png", "sources": []}]
+
+    def get_tosdr_data(self, site):
+        time.sleep(self.tosdr_latency)
+        return {"name": site, "rating": "B", "image": "logo.png", "documents": [], "points": []}
+
+    def get_site_image(self, privacyspy_data, tosdr_data):
+        time.sleep(0.02)
+        return tosdr_data['image']
+
+    def get_policy_urls(self, privacyspy_data, tosdr_data):
+        return {}
+
+    overall_privacy_score = Controller.overall_privacy_score.uncached
+    grade_site = Controller.grade_site
+    get_site_summary = Controller.get_site_summary
+
+class TestFetchSite(unittest.TestCase):
+    def test_upstream_calls_run_concurrently(self):
+        start = time.perf_counter()
+        lookup = fetch_site(SlowController(0.3), "TestApp")
+        elapsed = time.perf_counter() - start
+
+        # serially this would take 0.62s, concurrently the slowest call plus the logo probe
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(lookup['tosdr_data']['rating'], "B")
+        self.assertEqual(lookup['privacyspy_data'][0]['policy_score'], 8)
+        self.assertEqual(lookup['image'], "logo.png")
+        self.assertEqual(lookup['policies'], {})
+        self.assertEqual((lookup['name'], lookup['score']), ("TestApp", 7.5))
+
+    def test_timed_out_call_is_treated_as_unavailable(self):
+        lookup = fetch_site(SlowController(0, tosdr_latency=0.5), "TestApp", timeout=0.1)
+        self.assertIsNone(lookup['tosdr_data'])
+        self.assertEqual(lookup['privacyspy_data'][0]['company'], "TestApp")
+
+class TestSiteSummary(unittest.TestCase):
+    def payloads(self, points):
+        privacyspy = [{"company": "BigApp", "policy_score": 6, "icon": "icon.png",
+                       "sources": ["https://bigapp.com/privacy"], "rubric": []}]
+        tosdr = {"name": "BigApp", "rating": "C", "image": "https://bigapp.com/logo.png",
+                 "documents": [{"name": "Privacy Policy", "url": "https://bigapp.com/privacy"}],
+                 "points": [{"case": {"title": f"Point {i}", "classification": "bad"},
+                             "analysis": "x" * 500, "source": "https://bigapp.com/terms"} for i in range(points)]}
+        return privacyspy, tosdr
+
+    def test_summary_fields(self):
+        privacyspy, tosdr = self.payloads(3)
+        controller = Controller(load=False)
+        with patch('backend.data_metrics.logos') as logos:
+            logos.check.return_value = True
+            logos.local_url.side_effect = lambda url: '/logos/' + url.rsplit('/', 1)[-1]
+            summary = controller.get_site_summary(privacyspy, tosdr)
+
+        self.assertEqual(summary, {'name': 'BigApp', 'score': (6 + 5) / 2, 'logo': '/logos/logo.png',
+                                   'policies': {'Privacy Policy': 'https://bigapp.com/privacy'}})
+        self.assertEqual(controller.get_site_summary(privacyspy, None, logo=False)['name'], 'BigApp')
+        self.assertEqual(controller.get_site_summary(None, None, logo=False)['name'], '')
+
+    def test_summary_without_data_has_no_score(self):
+        # the empty selection, and privacyspy missing while tosdr failed or timed out
+        controller = Controller(load=False)
+        for privacyspy, tosdr in [(None, None), (None, 'Sent Too Many Requests...'), ('Analysis unavailable', None)]:
+            summary = controller.get_site_summary(privacyspy, tosdr, logo=False)
+            self.assertIsNone(summary['score'])
+            self.assertEqual(summary['name'], '')
+
+    def test_summary_cost_does_not_grow_with_points(self):
+        controller = Controller(load=False)
+        privacyspy, tosdr = self.payloads(5000)
+
+        start = time.perf_counter()
+        for _ in range(200):
+            controller.get_site_summary(privacyspy, tosdr, logo=False)
+        elapsed = time.perf_counter() - start
+
+        # only the score, rating and document fields are read, never the points
+        self.assertLess(elapsed, 0.5)
+
+class TestUpstreamClient(unittest.TestCase):
+    def test_connections_are_reused(self):
+        with StubServer(lambda *args: (200, {'ok': True}, {})) as stub:
+            client = UpstreamClient()
+            for _ in range(5):
+                self.assertEqual(client.get(stub.url + '/ping').json(), {'ok': True})
+            stats = client.stats()
+
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reused'], 4)
+
+    def test_retries_5xx_with_backoff(self):
+        statuses = [503, 429, 200]
+
+        def handler(*args):
+            status = statuses.pop(0)
+            return status, {'status': status}, {'Retry-After': '0'} if status == 429 else {}
+
+        with StubServer(handler) as stub:
+            client = UpstreamClient(backoff=0.01)
+            response = client.get(stub.url + '/flaky')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.stats()['retries'], 2)
+
+    def test_gives_up_after_retries(self):
+        with StubServer(lambda *args: (500, {}, {})) as stub:
+            client = UpstreamClient(retries=1, backoff=0.01)
+            self.assertEqual(client.get(stub.url + '/down').status_code, 500)
+            self.assertEqual(stub.count(), 2)
+
+    def test_read_timeout(self):
+        with StubServer(lambda *args: (200, {}, {}), latency=0.5) as stub:
+            client = UpstreamClient(read_timeout=0.1, retries=0)
+            with self.assertRaises(Exception):
+                client.get(stub.url + '/slow')
+            self.assertEqual(client.stats()['errors'], 1)
+
+class TestMemoKeys(unittest.TestCase):
+    def setUp(self):
+        self.controller = Controller(load=False)
+        self.privacyspy = [{"company": "TestApp", "policy_score": 7, "icon": "test.png", "rubric": [],
+                            "sources": ["https://example.com/policy"]}]
+        self.tosdr = {"name": "TestApp", "rating": "B", "image": "img.png",
+                      "documents": [{"name": "Privacy Policy", "url": "https://test.com/policy"}],
+                      "points": [{"case": {"title": "Point", "description": "x" * 500}}] * 50}
+
+    def test_keys_ignore_fields_the_method_does_not_read(self):
+        make_key = Controller.overall_privacy_score.make_key
+        other = {**self.tosdr, "name": "Other", "points": []}
+        self.assertEqual(make_key(self.privacyspy, self.tosdr), make_key(self.privacyspy, other))
+        self.assertNotEqual(make_key(self.privacyspy, self.tosdr), make_key(self.privacyspy, {**self.tosdr, "rating": "E"}))
+        self.assertNotEqual(make_key(None, None), make_key('None', None))
+
+    def test_equal_payloads_share_one_entry(self):
+        store = SimpleCache()
+        with patch('backend.memo.cache', store):
+            first = self.controller.get_policy_urls(self.privacyspy, self.tosdr)
+            second = self.controller.get_policy_urls(self.privacyspy, {**self.tosdr, "points": []})
+            self.controller.get_policy_urls(None, None)
+            self.controller.get_policy_urls(None, None)
+
+        self.assertEqual(first, {"Privacy Policy": "https://test.com/policy"})
+        self.assertEqual(first, second)
+        self.assertEqual(len(store._cache), 2)
+
+    def test_cached_none_is_a_hit(self):
+        calls = []
+
+        class Counter:
+            @memoize_by(lambda site: (site,))
+            def lookup(self, site):
+                calls.append(site)
+                return None
+
+        with patch('backend.memo.cache', SimpleCache()):
+            Counter().lookup('a')
+            Counter().lookup('a')
+
+        self.assertEqual(calls, ['a'])
+
+    def test_logo_fallback_cached_briefly_when_check_failed(self):
+        store = SimpleCache()
+        service = LogoService(store=SimpleCache(), client=UpstreamClient(retries=0), key=b'test')
+        privacyspy = [{"icon": "icon.png"}]
+
+        with StubServer(tosdr_handler([])) as stub, patch('backend.memo.cache', store), \
+                patch('backend.data_metrics.logos', service):
+            # nothing listens on port 1, the check fails without a verdict
+            unreachable = {"image": "http://127.0.0.1:1/logo.png"}
+            self.assertEqual(self.controller.get_site_image(privacyspy, unreachable),
+                             service.local_url(privacyspy_icon(privacyspy)))
+
+            reachable = {"image": stub.url + '/logos/1.png'}
+            self.assertEqual(self.controller.get_site_image(privacyspy, reachable),
+                             service.local_url(stub.url + '/logos/1.png'))
+
+        make_key = Controller.get_site_image.make_key
+        self.assertLessEqual(store._cache[make_key(privacyspy, unreachable)][0], time.time() + 60)
+        self.assertGreater(store._cache[make_key(privacyspy, reachable)][0], time.time() + 3600)
+
+class SlowLookup:
+    def __init__(self, results, latency=0):
+        self.results = results
+        self.latency = latency
+        self.calls = 0
+
+    @memoize_swr(lambda site: (site,), timeout=60, error_timeout=5, is_error=lambda value: value is None)
+    def lookup(self, site):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.results.pop(0)
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    def setUp(self):
+        self.store = SimpleCache()
+        self.patcher = patch('backend.memo.cache', self.store)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def later(self, seconds):
+        return patch('backend.memo.time.time', return_value=time.time() + seconds)
+
+    def wait_for_refresh(self, source, calls):
+        deadline = time.perf_counter() + 5
+        while (source.calls < calls or flights.in_flight()) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def test_expired_entry_served_while_refreshing(self):
+        source = SlowLookup(['old', 'new'], latency=0.2)
+        self.assertEqual(source.lookup('a'), 'old')
+
+        with self.later(120):
+            start = time.perf_counter()
+            self.assertEqual(source.lookup('a'), 'old')
+            self.assertLess(time.perf_counter() - start, 0.1)
+            self.wait_for_refresh(source, 2)
+            self.assertEqual(source.lookup('a'), 'new')
+        self.assertEqual(source.calls, 2)
+
+    def test_errors_cached_briefly_and_keep_last_good_value(self):
+        source = SlowLookup([None, 'good', None])
+        self.assertIsNone(source.lookup('a'))
+        self.assertIsNone(source.lookup('a'))
+
+        with self.later(10):
+            self.assertIsNone(source.lookup('a'))
+            self.wait_for_refresh(source, 2)
+            self.assertEqual(source.lookup('a'), 'good')
+
+        # a failed refresh leaves the good value in place
+        with self.later(120):
+            source.lookup('a')
+            self.wait_for_refresh(source, 3)
+            self.assertEqual(source.lookup('a'), 'good')
+        self.assertEqual(source.calls, 3)
+
+    def test_concurrent_misses_share_one_call(self):
+        source = SlowLookup(['only'], latency=0.2)
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda _: source.lookup('a'), range(10)))
+
+        self.assertEqual(results, ['only'] * 10)
+        self.assertEqual(source.calls, 1)
+
+class TestLocalConnection(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_worker_opens_its_own_connection(self):
+        # like a preloaded gunicorn master opening the table before forking a worker
+        table = ScoreTable(os.path.join(self.tmp.name, 'scores.sqlite'))
+        parent_conn = table.connection()
+        read, write = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                table.save({'name': 'Child', 'tosdr_rating': 'A', 'privacyspy_score': None, 'overall_score': 9,
+                            'logo': None, 'policies': {}, 'privacyspy_data': None, 'tosdr_data': None})
+                ok = table.connection() is not parent_conn and table.connection() is table.connection()
+                os.write(write, b'1' if ok else b'0')
+            finally:
+                os._exit(0)
+
+        os.close(write)
+        with os.fdopen(read, 'rb') as f:
+            self.assertEqual(f.read(), b'1')
+        os.waitpid(pid, 0)
+
+        self.assertIs(table.connection(), parent_conn)
+        self.assertEqual(table.get('Child')['overall_score'], 9)
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SQLiteCache(os.path.join(self.tmp.name, 'cache.sqlite'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_concurrent_selections_make_one_upstream_call(self):
+        services = [make_service(1, 'Example')]
+        store = SimpleCache()
+
+        with StubServer(tosdr_handler(services), latency=0.2) as stub, \
+                patch('backend.memo.cache', store), patch('backend.memo.flights', SingleFlight(store)), \
+                patch.multiple('backend.config', TOSDR_SEARCH_URL=stub.url + '/search/v5?',
+                               TOSDR_SERVICE_URL=stub.url + '/service/v3?'):
+            controller = Controller(load=False)
+            with ThreadPoolExecutor(max_workers=20) as pool:
+                lookups = list(pool.map(lambda _: fetch_site(controller, 'Example'), range(20)))
+
+            self.assertEqual(stub.count('/search/v5'), 1)
+            self.assertEqual(stub.count('/service/v3'), 1)
+        self.assertTrue(all(lookup['tosdr_data']['name'] == 'Example' for lookup in lookups))
+
+    def test_workers_share_one_call_through_the_lock_key(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            self.store.set('result', ('value',))
+            return 'value'
+
+        def cached():
+            hit = self.store.get('result')
+            return (True, hit[0]) if hit else (False, None)
+
+        # two workers with their own in-process state and one shared cache
+        workers = [SingleFlight(self.store, poll=0.01), SingleFlight(self.store, poll=0.01)]
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda i: workers[i % 2].do('result', fetch, cached), range(10)))
+
+        self.assertEqual(results, ['value'] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(self.store.has('lock:result'))
+
+    def test_default_filesystem_cache_locks_with_files(self):
+        # the default backend, its add is not atomic so workers take lock files instead
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+        lock_dir = os.path.join(self.tmp.name, 'locks')
+        workers = [SingleFlight(poll=0.01), SingleFlight(poll=0.01)]
+        with patch.multiple('backend.config', CACHE_BACKEND='filesystem', LOCK_DIR=lock_dir):
+            self.assertEqual([type(worker.locks) for worker in workers], [FileLocks, FileLocks])
+
+        store = FileSystemCache(cache_dir)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            store.set('result', ('value',))
+            return 'value'
+
+        def cached():
+            hit = store.get('result')
+            return (True, hit[0]) if hit else (False, None)
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda i: workers[i % 2].do('result', fetch, cached), range(10)))
+
+        self.assertEqual(results, ['value'] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(workers[0].locks.held('lock:result'))
+
+        # nothing but cache entries in the cache dir, so cachelib can still clear and prune it
+        self.assertTrue(store.clear())
+        self.assertNotIn('locks', os.listdir(cache_dir))
+
+    def test_stale_lock_file_is_taken_over(self):
+        locks = FileLocks(self.tmp.name, timeout=30)
+        self.assertTrue(locks.acquire('key'))
+        self.assertFalse(locks.acquire('key'))
+
+        os.utime(locks.path('key'), (0, 0))
+        self.assertTrue(locks.acquire('key'))
+
+    def test_result_stored_before_the_lock_is_taken_is_reused(self):
+        # a waiter arriving just after the last holder released the lock
+        self.store.set('result', ('value',))
+        fetch = MagicMock(return_value='fresh')
+        cached = lambda: (True, self.store.get('result')[0]) if self.store.get('result') else (False, None)
+
+        self.assertEqual(SingleFlight(self.store).run_locked('result', fetch, cached), 'value')
+        fetch.assert_not_called()
+
+class TestRenderCache(unittest.TestCase):
+    def test_repeat_renders_reuse_the_json(self):
+        renders = RenderCache()
+        make = MagicMock(side_effect=lambda data: html.P(data['name'], id='name'))
+
+        first = renders.render('points', {'name': 'Example'}, make)
+        second = renders.render('points', {'name': 'Example'}, make)
+
+        self.assertEqual(first, {'type': 'P', 'namespace': 'dash_html_components',
+                                 'props': {'children': 'Example', 'id': 'name'}})
+        self.assertIs(first, second)
+        self.assertEqual(make.call_count, 1)
+
+        # changed data is a new version of the section
+        renders.render('points', {'name': 'Other'}, make)
+        self.assertEqual(make.call_count, 2)
+
+    def test_least_recently_used_dropped(self):
+        renders = RenderCache(maxsize=1)
+        make = MagicMock(side_effect=lambda data: html.P(data))
+        renders.render('points', 'a', make)
+        renders.render('points', 'b', make)
+        renders.render('points', 'a', make)
+        self.assertEqual(make.call_count, 3)
+
+class TestLogoService(unittest.TestCase):
+    def setUp(self):
+        self.logos = LogoService(store=SimpleCache(), client=UpstreamClient(retries=0), key=b'test')
+
+    def test_check_uses_head_and_caches_verdict(self):
+        with StubServer(tosdr_handler([])) as stub:
+            self.assertTrue(self.logos.check(stub.url + '/logos/1.png'))
+            self.assertTrue(self.logos.check(stub.url + '/logos/1.png'))
+            self.assertFalse(self.logos.check(stub.url + '/missing.png'))
+            hits = list(stub.hits)
+
+        self.assertEqual([hit[0] for hit in hits], ['HEAD', 'HEAD'])
+
+    def test_serves_local_copy_and_revalidates(self):
+        app = Flask(__name__)
+        with StubServer(tosdr_handler([])) as stub:
+            local_url = self.logos.local_url(stub.url + '/logos/1.png')
+            slug = local_url.rsplit('/', 1)[1]
+
+            with app.test_request_context():
+                response = self.logos.response(slug)
+            self.assertEqual(response.get_data(), b'PNG')
+            self.assertIn('max-age', response.headers['Cache-Control'])
+
+            with app.test_request_context(headers={'If-None-Match': response.headers['ETag']}):
+                self.assertEqual(self.logos.response(slug).status_code, 304)
+
+            # a stale copy is revalidated upstream with its etag instead of downloaded again
+            key = f"logo:image:{self.logos.digest(stub.url + '/logos/1.png')}"
+            entry = self.logos.store.get(key)
+            self.logos.store.set(key, {**entry, 'fetched': 0})
+            self.assertEqual(self.logos.fetch(slug)['body'], b'PNG')
+            self.assertEqual(stub.count('/logos/1.png'), 2)
+
+        with app.test_request_context():
+            self.assertEqual(self.logos.response('unknown').status_code, 404)
+
+    def test_slug_is_served_by_any_worker(self):
+        # another worker shares nothing with this one but the key
+        url = 'https://example.com/logo.png'
+        slug = self.logos.local_url(url).rsplit('/', 1)[1]
+        other = LogoService(store=SimpleCache(), key=self.logos.key)
+        self.assertEqual(other.url(slug), url)
+
+        app = Flask(__name__)
+        with app.test_request_context(), patch.object(other, 'fetch', return_value=None):
+            self.assertEqual(other.response(slug).location, url)
+
+        # slugs not signed with the key are never fetched
+        self.assertIsNone(LogoService(store=SimpleCache(), key=b'other').url(slug))
+        self.assertIsNone(other.url(slug[:-2]))
+
+    def test_workers_share_one_key_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'logo.key')
+            self.assertEqual(load_key(path), load_key(path))
+            self.assertEqual(len(load_key(path)), 32)
+
+class TestCatalogCrawler(unittest.TestCase):
+
+    def test_crawl_collects_every_page_in_order(self):
+        catalog = make_catalog_pages(6, per_page=5)
+        with StubServer(catalog_handler(catalog), latency=0.01) as stub:
+            crawler = CatalogCrawler(stub.url + '/service/v3?', workers=4, rate=100)
+            services = crawler.crawl()
+
+        self.assertEqual([s['id'] for s in services], list(range(1, 31)))
+        self.assertEqual(crawler.stats.pages, 6)
+        self.assertGreater(crawler.stats.pages_per_sec, 0)
+
+    def test_crawl_retries_after_429(self):
+        throttled = set()
+
+        def throttle(page):
+            if page == 3 and page not in throttled:
+                throttled.add(page)
+                return 0.05
+            return None
+
+        catalog = make_catalog_pages(4, per_page=2)
+        with StubServer(catalog_handler(catalog, throttle)) as stub:
+            crawler = CatalogCrawler(stub.url + '/service/v3?', workers=2, rate=100)
+            services = crawler.crawl()
+            page_3_hits = len([hit for hit in stub.hits if hit[2].get('page') == '3'])
+
+        self.assertEqual(len(services), 8)
+        self.assertEqual(crawler.stats.throttled, 1)
+        self.assertEqual(page_3_hits, 2)
+
+    def test_crawl_raises_when_page_keeps_failing(self):
+        catalog = make_catalog_pages(2, per_page=1)
+        with StubServer(catalog_handler(catalog, lambda page: 0 if page == 2 else None)) as stub:
+            crawler = CatalogCrawler(stub.url + '/service/v3?', rate=100, max_retries=2)
+            with self.assertRaises(CrawlError):
+                crawler.crawl()
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.perf_counter()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+
+    def test_retry_after_seconds(self):
+        self.assertEqual(retry_after_seconds('3'), 3.0)
+        self.assertIsNone(retry_after_seconds(None))
+        self.assertIsNone(retry_after_seconds('soon'))
+
+class FakeCatalogController:
+    def __init__(self, sites):
+        self.sites = sites
+        self.privacyspy = []
+        self.snapshots = None
+
+    def get_privacyspy_data(self):
+        return [{"name": "TestApp"}]
+
+    def get_site_list(self):
+        return self.sites
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(os.path.join(self.tmp.name, 'snapshots.sqlite'), client=UpstreamClient(retries=0))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def crawl(self, stub):
+        return CatalogCrawler(stub.url + '/service/v3?', rate=100, snapshots=self.store).crawl()
+
+    def test_refresh_with_etags_downloads_nothing_new(self):
+        with StubServer(catalog_handler(make_catalog_pages(3, per_page=5), etags=True)) as stub:
+            first = self.crawl(stub)
+            cold = self.store.take_transfer()
+            second = self.crawl(stub)
+            warm = self.store.take_transfer()
+
+        self.assertEqual(first, second)
+        self.assertEqual(cold['changed'], 3)
+        self.assertEqual(warm['not_modified'], 3)
+        self.assertEqual(warm['bytes'], 0)
+
+    def test_pages_without_validators_are_diffed(self):
+        catalog = make_catalog_pages(3, per_page=5)
+        with StubServer(catalog_handler(catalog)) as stub:
+            self.crawl(stub)
+            self.store.take_transfer()
+            catalog[2]['services'][0]['rating'] = 'E'
+            services = self.crawl(stub)
+
+        self.assertEqual(services[5]['rating'], 'E')
+        transfer = self.store.take_transfer()
+        self.assertEqual((transfer['changed'], transfer['unchanged']), (1, 2))
+
+    def test_service_detail_reused_until_listing_changes(self):
+        service = make_service(1, 'Example')
+        self.store.save_listing([service])
+        self.store.save_service(1, {'id': 1, 'name': 'Example'})
+        self.assertEqual(self.store.service(1)['name'], 'Example')
+
+        self.store.save_listing([{**service, 'rating': 'E'}])
+        self.assertIsNone(self.store.service(1))
+
+    def test_fetch_falls_back_to_the_stored_copy(self):
+        url = '/api/v2/products.json'
+        with StubServer(upstream_handler({}, [{"name": "TestApp"}])) as stub:
+            self.store.fetch('privacyspy', stub.url + url)
+
+        # upstream refusing and upstream gone both leave the last good copy
+        with StubServer(lambda method, path, query, headers: (503, {}, {})) as stub:
+            down_url = stub.url + url
+            self.assertEqual(self.store.fetch('privacyspy', down_url), [{"name": "TestApp"}])
+        self.assertEqual(self.store.fetch('privacyspy', down_url), [{"name": "TestApp"}])
+        self.assertIsNone(self.store.fetch('missing', down_url))
+
+    def test_controller_starts_warm_from_snapshot(self):
+        products = [{"name": "TestApp", "slug": "testapp", "score": 8, "parent": None}]
+        with StubServer(upstream_handler({}, products)) as stub:
+            self.store.fetch('privacyspy', stub.url + '/api/v2/products.json')
+
+        controller = Controller(load=False, snapshots=self.store)
+        self.assertEqual(controller.find_product("testapp")['slug'], "testapp")
+
+    def test_controller_reloads_what_another_process_saved(self):
+        controller = Controller(load=False, snapshots=self.store)
+        self.assertIsNone(controller.find_product("testapp"))
+
+        products = [{"name": "TestApp", "slug": "testapp", "score": 8, "parent": None}]
+        with StubServer(upstream_handler({}, products)) as stub:
+            self.store.fetch('privacyspy', stub.url + '/api/v2/products.json')
+        self.store.save('tosdr-index', ServiceIndex([make_service(1, 'Example')]).entries)
+
+        controller.load_snapshots()
+        self.assertEqual(controller.find_product("testapp")['slug'], "testapp")
+        self.assertEqual(len(controller.service_index), 1)
+
+    def test_lookup_resolves_id_from_saved_index(self):
+        services = [make_service(1, 'Example'), make_service(2, 'Other')]
+        self.store.save('tosdr-index', ServiceIndex(services).entries)
+        controller = Controller(load=False, snapshots=self.store)
+
+        with StubServer(tosdr_handler(services)) as stub, \
+                patch.multiple('backend.config', TOSDR_SEARCH_URL=stub.url + '/search/v5?',
+                               TOSDR_SERVICE_URL=stub.url + '/service/v3?'):
+            self.assertEqual(controller.get_tosdr_data('Example')['name'], 'Example')
+            self.assertEqual(controller.get_tosdr_data('other.com')['name'], 'Other')
+            self.assertEqual(controller.get_tosdr_data('Nothing'), 'No points available...')
+
+            self.assertEqual(stub.count('/search/v5'), 1)
+            self.assertEqual(stub.count('/service/v3'), 2)
+
+class TestSiteCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'site_list.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_starts_empty_and_loading(self):
+        catalog = SiteCatalog(FakeCatalogController(['A']), self.path)
+        self.assertEqual(catalog.sites, [])
+        self.assertEqual(catalog.state, 'loading')
+
+    def test_background_build_swaps_and_persists(self):
+        controller = FakeCatalogController(['Alpha', 'Beta'])
+        catalog = SiteCatalog(controller, self.path).start()
+        self.assertTrue(catalog.ready.wait(5))
+
+        self.assertEqual(catalog.sites, ['Alpha', 'Beta'])
+        self.assertEqual(catalog.index.search('be'), ['Beta'])
+        self.assertEqual(catalog.version, 1)
+        self.assertEqual(controller.privacyspy, [{"name": "TestApp"}])
+        self.assertEqual(SiteCatalog(controller, self.path).sites, ['Alpha', 'Beta'])
+
+    def test_failed_build_keeps_persisted_list(self):
+        SiteCatalog(FakeCatalogController(['Alpha']), self.path).build()
+
+        catalog = SiteCatalog(FakeCatalogController(None), self.path)
+        catalog.build()
+        self.assertEqual(catalog.sites, ['Alpha'])
+        self.assertEqual(catalog.version, 0)
+        self.assertEqual(catalog.state, 'ready')
+
+    def test_reload_picks_up_a_saved_list(self):
+        catalog = SiteCatalog(FakeCatalogController(None), self.path).reload()
+        self.assertEqual(catalog.state, 'loading')
+
+        SiteCatalog(FakeCatalogController(None), self.path).save(['Alpha', 'Beta'])
+        catalog.reload()
+        self.assertEqual(catalog.index.search('al'), ['Alpha'])
+        self.assertEqual(catalog.version, 1)
+        self.assertEqual(catalog.state, 'ready')
+
+# preload mode only reads the saved site list, nothing is crawled on import
+def import_dashboard(data_dir):
+    with patch.multiple('backend.config', DATA_DIR=data_dir, CACHE_BACKEND='simple', STARTUP_MODE='preload',
+                        SNAPSHOT_PATH=os.path.join(data_dir, 'snapshots.sqlite'),
+                        SCORES_PATH=os.path.join(data_dir, 'scores.sqlite'),
+                        SITE_LIST_PATH=os.path.join(data_dir, 'site_list.json')):
+        import dashboard
+    return dashboard
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tmp.name, 'snapshots.sqlite')
+        self.site_list_path = os.path.join(self.tmp.name, 'site_list.json')
+        self.handler = upstream_handler(make_catalog_pages(2, per_page=5), make_products(3))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # python -m backend.refresh as the gunicorn master runs it, real flask-caching and all
+    def run_refresh(self, url, *args):
+        env = dict(os.environ, SSM_TOSDR_API=url, SSM_PRIVACYSPY_API=url, SSM_DATA_DIR=self.tmp.name,
+                   SSM_SNAPSHOTS=self.snapshot_path, SSM_CACHE='simple')
+        return subprocess.run([sys.executable, '-m', 'backend.refresh', *args], env=env,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              capture_output=True, timeout=60)
+
+    def test_refresh_saves_sites_and_snapshots(self):
+        with StubServer(self.handler) as stub:
+            result = self.run_refresh(stub.url)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(self.site_list_path) as f:
+            sites = json.load(f)
+        self.assertEqual(len(sites), 11)
+        self.assertIn('Product 1', sites)
+
+        store = SnapshotStore(self.snapshot_path)
+        self.assertEqual(len(store.load('privacyspy', decode_privacyspy)), 3)
+        self.assertEqual(len(ServiceIndex(store.load('tosdr-index'))), 10)
+
+    def test_reload_signal_only_after_a_successful_refresh(self):
+        received = []
+        previous = signal.signal(signal.SIGHUP, lambda *args: received.append(1))
+        try:
+            # upstream answering nothing usable, 404s fail the crawl without retries
+            with StubServer(lambda method, path, query, headers: (404, {}, {})) as stub:
+                result = self.run_refresh(stub.url, '--reload', str(os.getpid()))
+            self.assertEqual(result.returncode, 1)
+            self.assertFalse(os.path.exists(self.site_list_path))
+
+            # detached, the caller gets its exit status at once and the grandchild signals later
+            with StubServer(self.handler) as stub:
+                self.assertEqual(self.run_refresh(stub.url, '--detach', '--reload', str(os.getpid())).returncode, 0)
+                deadline = time.monotonic() + 30
+                while not received and time.monotonic() < deadline:
+                    time.sleep(0.05)
+        finally:
+            signal.signal(signal.SIGHUP, previous)
+
+        self.assertEqual(received, [1])
+        self.assertTrue(os.path.exists(self.site_list_path))
+
+    def test_master_reload_swaps_in_the_refreshed_catalog(self):
+        dashboard = import_dashboard(self.tmp.name)
+        controller = Controller(load=False, snapshots=SnapshotStore(self.snapshot_path))
+        catalog = SiteCatalog(controller, self.site_list_path).reload()
+        self.assertEqual(catalog.state, 'loading')
+
+        with StubServer(self.handler) as stub:
+            self.assertEqual(self.run_refresh(stub.url).returncode, 0)
+
+        # what gunicorn.conf.py's on_reload calls before forking the new workers
+        with patch.object(dashboard, 'controller', controller), patch.object(dashboard, 'catalog', catalog):
+            dashboard.reload_catalog()
+
+        self.assertEqual(catalog.state, 'ready')
+        self.assertEqual(catalog.index.search('product 1', limit=1), ['Product 1'])
+        self.assertEqual(controller.find_product('Product 2')['slug'], 'product-2')
+        self.assertEqual(len(controller.service_index), 10)
+
+class TestOnDemandSections(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.dashboard = import_dashboard(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        point = lambda i, case: {'case': {'classification': case, 'title': f"{case} {i}", 'description': f"about {i}"}}
+        self.tosdr = {'points': [point(i, 'good') for i in range(6)] + [point(6, 'bad')]}
+        self.rubric = [{'company': 'Example'}] + [
+            {'question': f"Question {i}", 'category': 'Handling', 'score': 5, 'total_points': 10,
+             'option': f"Answer {i}", 'citations': [f"citation {i}"]}
+            for i in range(3)
+        ]
+
+    def callback(self, name, triggered_id, *args):
+        with patch.object(self.dashboard, 'site_payloads', return_value=(self.rubric, self.tosdr)) as payloads, \
+                patch.object(self.dashboard, 'ctx', MagicMock(triggered_id=triggered_id)):
+            result = getattr(self.dashboard, name)(*args)
+        return result, payloads
+
+    def test_descriptions_only_for_the_active_item(self):
+        points = self.dashboard.group_points(self.tosdr)['Good']
+        items = self.dashboard.make_point_items(points[:4], 'Good', active_item='Good-1')
+
+        self.assertEqual([item.item_id for item in items], ['Good-0', 'Good-1', 'Good-2', 'Good-3'])
+        self.assertEqual([item.children is not None for item in items], [False, True, False, False])
+        self.assertEqual(items[1].children.children[0].children, 'about 1')
+
+    def test_more_points_keep_their_offsets(self):
+        (is_open, label, extra), _ = self.callback('toggle_collapse', {'type': 'toggle', 'index': 'Good'},
+                                                   1, False, 'Example')
+        self.assertEqual((is_open, label), (True, 'View less'))
+        self.assertEqual([item.item_id for item in extra.children], ['Good-4', 'Good-5'])
+        self.assertTrue(all(item.children is None for item in extra.children))
+
+        items, _ = self.callback('load_point_details', {'type': 'points-accordion', 'index': 'Good', 'part': 'more'},
+                                 'Good-5', 'Example')
+        self.assertEqual([item.children is not None for item in items], [False, True])
+        self.assertEqual(items[1].children.children[0].children, 'about 5')
+
+    def test_hidden_points_are_sent_on_the_first_click_only(self):
+        (is_open, label, extra), payloads = self.callback('toggle_collapse', {'type': 'toggle', 'index': 'Good'},
+                                                          2, True, 'Example')
+        self.assertEqual((is_open, label), (False, 'View more'))
+        self.assertIs(extra, self.dashboard.no_update)
+        payloads.assert_not_called()
+
+    def test_rubric_answer_loaded_when_opened(self):
+        category = 'How Is Your Information Handled?'
+        items, _ = self.callback('load_rubric_details', {'type': 'rubric-accordion', 'index': category},
+                                 f"{category}-2", 'Example')
+
+        self.assertEqual([item.children is not None for item in items], [False, False, True])
+        self.assertEqual(items[2].children.children[0].children, 'Answer: Answer 2')
+
+        closed, _ = self.callback('load_rubric_details', {'type': 'rubric-accordion', 'index': category},
+                                  None, 'Example')
+        self.assertIs(closed, self.dashboard.no_update)
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_entries_are_shared_between_instances(self):
+        SQLiteCache(self.path).set('sites', ['Alpha', 'Beta'])
+        self.assertEqual(SQLiteCache(self.path).get('sites'), ['Alpha', 'Beta'])
+
+    def test_expired_entries_are_misses(self):
+        cache = SQLiteCache(self.path)
+        cache.set('site', 'Alpha', timeout=60)
+        self.assertTrue(cache.has('site'))
+        with patch('backend.sqlite_cache.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('site'))
+            self.assertFalse(cache.has('site'))
+
+    def test_writes_prune_expired_rows(self):
+        cache = SQLiteCache(self.path, prune_interval=60)
+        cache.set('old', 'Alpha', timeout=30)
+        cache.set('kept', 'Beta', timeout=0)
+        cache.set('soon', 'Gamma', timeout=30)
+
+        rows = lambda: sorted(key for key, in cache.connection().execute('SELECT key FROM cache'))
+        with patch('backend.sqlite_cache.time.time', return_value=time.time() + 31):
+            self.assertTrue(cache.add('lock', 1))
+            self.assertEqual(rows(), ['kept', 'lock', 'old', 'soon'])
+
+        # a sweep only runs once the interval since the last one has passed
+        with patch('backend.sqlite_cache.time.time', return_value=time.time() + 61):
+            cache.set('new', 'Delta')
+        self.assertEqual(rows(), ['kept', 'lock', 'new'])
+
+    def test_add_only_writes_missing_keys(self):
+        first, second = SQLiteCache(self.path), SQLiteCache(self.path)
+        self.assertTrue(first.add('lock', 1))
+        self.assertFalse(second.add('lock', 2))
+        self.assertEqual(second.get('lock'), 1)
+        self.assertTrue(second.delete('lock'))
+        self.assertTrue(second.add('lock', 2))
+
+    def test_cache_config(self):
+        self.assertEqual(cache_config('simple')['CACHE_TYPE'], 'SimpleCache')
+        self.assertIn('CACHE_DIR', cache_config('filesystem'))
+        self.assertIn('CACHE_SQLITE_PATH', cache_config('sqlite'))
+        self.assertIn('CACHE_REDIS_URL', cache_config('redis'))
+        with self.assertRaises(ValueError):
+            cache_config('memcached')
+
+class TestBulkScore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.table = ScoreTable(os.path.join(self.tmp.name, 'scores.sqlite'))
+        self.services = [make_service(i, f"Product {i}", rating='A') for i in range(1, 6)]
+        self.sites = [service['name'] for service in self.services]
+        self.throttled = {'Product 3'}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def handler(self):
+        tosdr = tosdr_handler(self.services)
+
+        def handler(method, path, query, headers):
+            if query.get('query') in self.throttled:
+                return 429, {'error': 'Too Many Requests'}, {}
+            return tosdr(method, path, query, headers)
+
+        return handler
+
+    async def score(self, stub):
+        urls = patch.multiple('backend.config', TOSDR_SEARCH_URL=stub.url + '/search/v5?',
+                              TOSDR_SERVICE_URL=stub.url + '/service/v3?')
+        products = make_products(2)
+        products[0]['rubric'] = [{'question': {'text': 'Sells data?', 'category': 'sharing', 'points': 10},
+                                  'option': {'text': 'No', 'percent': 100}, 'citations': []}]
+        async with AsyncController(AsyncUpstreamClient(retries=0), privacyspy=products) as controller:
+            with urls:
+                return await BulkScorer(controller, self.table, progress_every=0).run(self.sites)
+
+    async def test_scores_catalog_and_resumes(self):
+        async with AsyncStubServer(self.handler()) as stub:
+            first = await self.score(stub)
+            self.throttled = set()
+            second = await self.score(stub)
+
+        self.assertEqual((first['scored'], first['failed']), (4, 1))
+        self.assertEqual((second['skipped'], second['scored']), (4, 1))
+        self.assertEqual(self.table.count(), 5)
+
+        row = self.table.get('Product 1')
+        self.assertEqual(row['tosdr_rating'], 'A')
+        self.assertEqual(row['privacyspy_score'], 1.5)
+        self.assertEqual(row['overall_score'], (1.5 + 9) / 2)
+        self.assertEqual(row['policies'], {'Privacy Policy': 'https://product-1.com/privacy'})
+
+    def test_dashboard_lookup_served_from_table(self):
+        self.table.save({'name': 'Example', 'tosdr_rating': 'B', 'privacyspy_score': None, 'overall_score': 7,
+                         'logo': None, 'policies': {}, 'privacyspy_data': None, 'tosdr_data': {'name': 'Example', 'rating': 'B'}})
+        controller = MagicMock()
+
+        lookup = fetch_site(controller, 'Example', scores=self.table)
+
+        self.assertEqual(lookup['tosdr_data'], {'name': 'Example', 'rating': 'B'})
+        self.assertEqual((lookup['name'], lookup['score']), ('Example', 7))
+        controller.get_tosdr_data.assert_not_called()
+        self.assertIsNone(self.table.get('Example', max_age=-1))
+
+class TestAsyncController(unittest.IsolatedAsyncioTestCase):
+    def stub_urls(self, stub):
+        return patch.multiple('backend.config', TOSDR_SEARCH_URL=stub.url + '/search/v5?',
+                              TOSDR_SERVICE_URL=stub.url + '/service/v3?',
+                              PRIVACYSPY_URL=stub.url + '/api/v2/products.json')
+
+    async def test_get_tosdr_data(self):
+        services = [make_service(1, 'Example'), make_service(2, 'Other')]
+        async with AsyncStubServer(tosdr_handler(services)) as stub, AsyncController() as controller:
+            with self.stub_urls(stub):
+                data = await controller.get_tosdr_data('Example')
+                missing = await controller.get_tosdr_data('Nothing')
+
+        self.assertEqual(data['name'], 'Example')
+        self.assertEqual(data['rating'], 'B')
+        self.assertEqual(len(data['points']), 3)
+        self.assertEqual(missing, 'No points available...')
+
+    async def test_site_image_checked_like_the_dashboard(self):
+        # hosts without HEAD are read with a GET, as LogoService does for the dashboard
+        def handler(method, path, query, headers):
+            if method == 'HEAD':
+                return 405, {}, {}
+            return (200, b'PNG', {}) if path == '/logo.png' else (404, {}, {})
+
+        logos = LogoService(store=SimpleCache(), client=UpstreamClient(retries=0), key=b'test')
+        async with AsyncStubServer(handler) as stub, AsyncController(logos=logos) as controller:
+            url = stub.url + '/logo.png'
+            image = await controller.get_site_image(None, {'image': url})
+            missing = await controller.get_site_image([{'icon': 'icon.png'}], {'image': stub.url + '/gone.png'})
+
+        self.assertEqual(image, url)
+        self.assertTrue(missing.endswith('icon.png'))
+
+    async def test_site_list_from_async_crawl(self):
+        products = [{"name": "Service 1 App", "slug": "s1"}, {"name": "Brand New", "slug": "bn"}]
+        handler = upstream_handler(make_catalog_pages(5, per_page=2), products)
+        async with AsyncStubServer(handler) as stub, AsyncController() as controller:
+            with self.stub_urls(stub):
+                await controller.load()
+                sites = await controller.get_site_list(rate=100)
+
+        self.assertEqual(len(sites), 11)
+        self.assertIn('Brand New', sites)
+        self.assertEqual(controller.crawl_stats.pages, 5)
+
+    async def test_crawled_names_skip_the_search(self):
+        catalog = make_catalog_pages(2, per_page=3)
+        listing = catalog_handler(catalog)
+        services = tosdr_handler([service for page in catalog.values() for service in page['services']])
+
+        def handler(method, path, query, headers):
+            if path == '/service/v3' and 'id' not in query:
+                return listing(method, path, query, headers)
+            return services(method, path, query, headers)
+
+        async with AsyncStubServer(handler) as stub, AsyncController() as controller:
+            with self.stub_urls(stub):
+                sites = await controller.get_site_list(rate=100)
+                results = await controller.get_tosdr_many(sites)
+
+        self.assertEqual([result['name'] for result in results], [f"Service {i}" for i in range(1, 7)])
+        self.assertEqual(stub.count('/search/v5'), 0)
+
+    async def test_many_lookups_share_one_loop(self):
+        services = [make_service(i, f"Site {i}") for i in range(1, 101)]
+        async with AsyncStubServer(tosdr_handler(services), latency=0.2) as stub, \
+                AsyncController(AsyncUpstreamClient(host_limit=100, pool_size=32), concurrency=100) as controller:
+            with self.stub_urls(stub):
+                start = time.perf_counter()
+                results = await controller.get_tosdr_many([f"Site {i}" for i in range(1, 101)])
+                elapsed = time.perf_counter() - start
+
+        # 200 requests of 0.2s each, serially 40s
+        self.assertLess(elapsed, 3)
+        self.assertEqual([r['name'] for r in results], [f"Site {i}" for i in range(1, 101)])
+        self.assertEqual(controller.client.stats()['requests'], 200)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,137 @@
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# turns a Retry-After header (seconds or http date) into seconds
+def retry_after_seconds(value):
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+# one pooled session shared by every upstream call, so connections to
+# tosdr and privacyspy are kept alive and reused instead of set up per request
+class UpstreamClient:
+
+    # transport errors callers should treat as the upstream being unavailable
+    errors = (requests.RequestException,)
+
+    def __init__(self, connect_timeout=3.05, read_timeout=15, retries=2, backoff=0.5,
+                 max_backoff=10, host_limit=8, pool_size=16):
+        '''
+        connect_timeout, read_timeout: (float) seconds, so a hung upstream cannot pin a worker
+        retries: (int) extra attempts on 429/5xx and connection errors
+        backoff: (float) base delay for jittered exponential backoff
+        max_backoff: (float) cap on any single wait, including Retry-After
+        host_limit: (int) max requests in flight per host
+        pool_size: (int) keep-alive connections kept per host
+        '''
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.host_limit = host_limit
+
+        self.host_slots = {}
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'errors': 0}
+        self.open_session(pool_size)
+
+    def open_session(self, pool_size):
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def slots(self, host):
+        with self.lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.host_limit)
+            return self.host_slots[host]
+
+    def delay(self, attempt, response=None):
+        delay = None
+        if response is not None:
+            delay = retry_after_seconds(response.headers.get('Retry-After'))
+        if delay is None:
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        return min(delay, self.max_backoff)
+
+    def request(self, method, url, retries=None, **kwargs):
+        '''
+        retries: (int) overrides the client default, 0 for callers doing their own backoff
+        returns the last response, or raises the last connection error
+        '''
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault('timeout', self.timeout)
+        slots = self.slots(urllib.parse.urlsplit(url).netloc)
+
+        for attempt in range(retries + 1):
+            self.count('requests')
+            response = None
+            error = None
+
+            with slots:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as exc:
+                    error = exc
+
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt == retries:
+                break
+
+            self.count('retries')
+            time.sleep(self.delay(attempt, response))
+
+        if error is not None:
+            self.count('errors')
+            raise error
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('HEAD', url, **kwargs)
+
+    # tcp connections opened by the pools, anything beyond that was a reused keep-alive
+    def connections(self):
+        pools = self.adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['connections'] = self.connections()
+        stats['reused'] = max(0, stats['requests'] - stats['connections'])
+        return stats
+
+
+client = UpstreamClient()
@@ -1,25 +1,62 @@
-from dash import Dash, dcc, ctx, html, Input, Output, State, MATCH
+import gc
+from dash import Dash, dcc, ctx, html, no_update, Input, Output, State, MATCH
 from flask import Flask
-from backend import cache_setup
+from backend import cache_setup, config
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 from dash_bootstrap_templates import load_figure_template
 from collections import OrderedDict
 from backend.data_metrics import Controller
+from backend.catalog import SiteCatalog
+from backend.lookup import fetch_site
+from backend.logos import logos
+from backend.snapshots import SnapshotStore
+from backend.bulk_score import ScoreTable
+from backend.render_cache import RenderCache
 
 # initialize flask server, cache, stylesheets
 server = Flask(__name__)
 cache = cache_setup.cache
-cache.init_app(server, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT':86400})
+cache.init_app(server, config=cache_setup.cache_config())
 
 app = Dash(__name__, server=server, external_stylesheets=[dbc.themes.CYBORG+ "?v=1", dbc.icons.BOOTSTRAP])
 load_figure_template('CYBORG')
 app.title = "Smart Social Monitor"
 
-# initialize controller
-controller = Controller()
-
-sites = controller.get_site_list()
+# site logos are proxied and cached locally so browsers can keep them across sessions
+@server.route('/logos/<slug>')
+def serve_logo(slug):
+    return logos.response(slug)
+
+# scores precomputed by python -m backend.bulk_score are served without upstream calls
+scores = ScoreTable(config.SCORES_PATH)
+
+# initialize controller and site catalog
+# in background mode the app serves the last persisted catalog straight away
+# and swaps the fresh one in once the upstream apis have been crawled
+snapshots = SnapshotStore(config.SNAPSHOT_PATH)
+
+if config.STARTUP_MODE == 'background':
+    controller = Controller(load=False, snapshots=snapshots)
+    catalog = SiteCatalog(controller, config.SITE_LIST_PATH).start()
+elif config.STARTUP_MODE == 'preload':
+    # loaded once in the gunicorn master and inherited by every worker, the
+    # crawl runs in python -m backend.refresh and arrives through reload_catalog
+    controller = Controller(load=False, snapshots=snapshots)
+    catalog = SiteCatalog(controller, config.SITE_LIST_PATH).reload()
+else:
+    controller = Controller(snapshots=snapshots)
+    catalog = SiteCatalog(controller, config.SITE_LIST_PATH)
+    catalog.build()
+
+# called by the gunicorn master on SIGHUP, before the new workers are forked
+def reload_catalog():
+    controller.load_snapshots()
+    catalog.reload()
+    gc.collect()
+
+# points, rubric and policy sections already rendered for a site's current data
+renders = RenderCache()
 
 # helper function for accordion header colors
 def grade_color(score):
@@ -32,40 +69,49 @@ def grade_color(score):
 
 # makes sure data is aligned and correct
 def helper(privacyspy_data, tosdr_data):
-    if isinstance(privacyspy_data, list) and isinstance(tosdr_data, dict):
-        
-        points_component = make_points_accordion(tosdr_data)
-        rubric_component = make_rubric_accordion(privacyspy_data)
-        privacy_score = controller.overall_privacy_score(privacyspy_data, tosdr_data)
-        name = tosdr_data['name']
-
-    elif isinstance(privacyspy_data, list) ^ isinstance(tosdr_data, dict):
-        points_component = make_points_accordion(tosdr_data)
-        rubric_component = make_rubric_accordion(privacyspy_data)
-        privacy_score = controller.overall_privacy_score(privacyspy_data, tosdr_data)
-        name = tosdr_data['name'] if isinstance(tosdr_data,dict) else privacyspy_data[0]['company']
+    if isinstance(privacyspy_data, list) or isinstance(tosdr_data, dict):
+        points_component = renders.render('points', tosdr_data, make_points_accordion)
+        rubric_component = renders.render('rubric', privacyspy_data, make_rubric_accordion)
     else:
         points_component = html.Div('Please Choose A Site...')
         rubric_component = html.Div('Please Choose A Site...')
-        privacy_score = None
-        name = ""
     
-    return points_component, rubric_component, privacy_score, name
+    return points_component, rubric_component
+
+# the gauge figure is built and validated by plotly once, as the plain dict
+# dcc.Graph accepts, callbacks only swap in the value and title
+GAUGE_TEMPLATE = go.Figure(go.Indicator(
+    mode='gauge+number',
+    gauge={
+        'axis': {'range': [0, 10], 'tickvals':[0,2,5,8,10], 'ticktext':['Abysmal','Bad', 'Tolerable', 'Good','Excellent']}, 
+        'bar': {'color': "black"},   # needle/bar color
+        'steps': [
+            {'range': [0, 2], 'color': 'red'},
+            {'range': [2, 5], 'color': 'orange'},
+            {'range': [5, 8], 'color': 'yellow'},
+            {'range': [8, 10], 'color': 'green'}
+        ],
+    }
+)).update_layout(
+    paper_bgcolor="rgba(0,0,0,0)",
+    font=dict(color = 'white'),
+).to_plotly_json()
 
-# creates accordion for tosdr data
-def make_points_accordion(points_list):
-    
-    if not points_list:
-        return html.P('No Points Available...')
-    
-    if isinstance(points_list,str):
-        return html.P(points_list)
-    
+def gauge_figure(score, name):
+    # shallow copies, the shared gauge and layout dicts are never modified
+    indicator = dict(GAUGE_TEMPLATE['data'][0], value=score, title={'text': f"{name.title()} Policy Score"})
+    return {'data': [indicator], 'layout': GAUGE_TEMPLATE['layout']}
+
+# points shown per classification before "View more"
+POINTS_SHOWN = 4
+
+# groups tosdr points by classification in display order
+def group_points(tosdr_data):
     order = ["Good", "Tolerable", "Bad", "Abysmal"]
 
     classifications = {}
 
-    for point in points_list['points']:
+    for point in tosdr_data['points']:
 
         classification = point['case']['classification'].capitalize()
 
@@ -77,13 +123,48 @@ def make_points_accordion(points_list):
         classifications.setdefault(classification, []).append(point)
 
     # Reorder into an OrderedDict according to `order`
-    ordered_classifications = OrderedDict(
+    return OrderedDict(
         sorted(
             classifications.items(),
             key=lambda kv: order.index(kv[0]) if kv[0] in order else len(order)
         )
     )
 
+# accordion items for points, only the open item gets its description
+# the rest are filled in by load_point_details when expanded
+def make_point_items(points, classification, start=0, active_item=None):
+    items = []
+
+    for i, point in enumerate(points, start):
+        item_id = f'{classification}-{i}'
+        statement = point['case']['title']
+
+        title_row = html.Div([
+            html.Span(statement, className="points-statement"),
+        ], className='points-title')
+
+        body_content = None
+        if item_id == active_item:
+            description = point['case']['description'] if point['case']['description'] else 'No description available currently'
+            body_content = html.Div([
+                html.P(description, className="points-description"),
+            ])
+
+        items.append(dbc.AccordionItem(body_content, title=title_row, id=f'{classification}', item_id=item_id))
+
+    return items
+
+# creates accordion for tosdr data
+def make_points_accordion(points_list):
+    
+    if not points_list:
+        return html.P('No Points Available...')
+    
+    if isinstance(points_list,str):
+        return html.P(points_list)
+
+    ordered_classifications = group_points(points_list)
+
     classification_columns = []
 
     #map icons to respective classifications
@@ -98,26 +179,8 @@ def make_points_accordion(points_list):
 
         emoji = icon_map[classification]
 
-        first_points = points[:4]
-        extra_points = points[4:]
-
-        def make_point_item(point):
-            statement = point['case']['title']
-            description = point['case']['description'] if point['case']['description'] else 'No description available currently'
-
-            title_row = html.Div([
-                html.Span(statement, className="points-statement"),
-            ], className='points-title')
-
-            body_content = html.Div([
-                html.P(description, className="points-description"),
-            ])
-
-            return dbc.AccordionItem(body_content, title=title_row, id=f'{classification}')
-        
-        #split points for increased UX 
-        first_items = [make_point_item(p) for p in first_points]
-        extra_items = [make_point_item(p) for p in extra_points]
+        #split points for increased UX, extra points are sent once "View more" is clicked
+        first_items = make_point_items(points[:POINTS_SHOWN], classification)
 
         collapse_id = {'type': 'collapse', 'index': classification}
         button_id = {'type': 'toggle', 'index': classification}
@@ -127,13 +190,14 @@ def make_points_accordion(points_list):
                 html.H5(classification, className="mb-2"),
                 html.I(className=f'{emoji}'),
             ], id='classification-title'),
-            dbc.Accordion(first_items, start_collapsed=True, flush=True)
+            dbc.Accordion(first_items, id={'type': 'points-accordion', 'index': classification, 'part': 'first'},
+                          start_collapsed=True, flush=True)
         ]
 
-        if extra_items:
+        if len(points) > POINTS_SHOWN:
             column_content += [
                 dbc.Collapse(
-                    dbc.Accordion(extra_items, start_collapsed=True, flush=True),
+                    html.Div(id={'type': 'collapse-body', 'index': classification}),
                     id=collapse_id,
                     is_open=False,   # start collapsed
                 ),
@@ -147,19 +211,13 @@ def make_points_accordion(points_list):
             ]
 
         classification_columns.append(
-            dbc.Col(column_content, xs=12,sm=12, md= 12 // len(classifications) if classifications else 3)
+            dbc.Col(column_content, xs=12,sm=12, md= 12 // len(ordered_classifications) if ordered_classifications else 3)
         )
 
     return classification_columns
 
-# make accordion for privacyspy data
-def make_rubric_accordion(rubric_list):
-
-    # check if rubric is available
-    if isinstance(rubric_list,str) or not rubric_list:
-        return html.P("No rubric data available.", className="text-muted")
-
-    
+# groups privacyspy rubric questions by category
+def group_rubric(rubric_list):
     rubric_items = rubric_list[1:]
     categories = {}
 
@@ -177,24 +235,28 @@ def make_rubric_accordion(rubric_list):
 
         categories.setdefault(category, []).append(item)
 
-    rubric_sections = []
+    return categories
 
-    for category, items in categories.items():
-        accordion_items = []
+# accordion items for rubric questions, only the open item gets its answer and citation
+def make_rubric_items(items, category, active_item=None):
+    accordion_items = []
 
-        for item in items:
-            question = item.get("question", "")
-            option = item.get("option", "")
+    for i, item in enumerate(items):
+        item_id = f'{category}-{i}'
+        question = item.get("question", "")
 
-            score = item['score'] / item['total_points'] * 100
+        score = item['score'] / item['total_points'] * 100
 
-            header_color = grade_color(score)
+        header_color = grade_color(score)
 
-            citations = item.get("citations")[0] if item.get("citations") else 'No citation available currently'
+        title_row = html.Div([
+            html.Span(question, className="rubric-question"),
+        ], className='rubric-title')
 
-            title_row = html.Div([
-                html.Span(question, className="rubric-question"),
-            ], className='rubric-title')
+        body_content = None
+        if item_id == active_item:
+            option = item.get("option", "")
+            citations = item.get("citations")[0] if item.get("citations") else 'No citation available currently'
 
             body_content = html.Div([
                 html.P(f"Answer: {option}", className="rubric-answer"),
@@ -202,18 +264,30 @@ def make_rubric_accordion(rubric_list):
                            className="rubric-citation")
             ])
 
-            accordion_items.append(
-                dbc.AccordionItem(body_content, title=title_row, id=f'{header_color}')
-            )
+        accordion_items.append(
+            dbc.AccordionItem(body_content, title=title_row, id=f'{header_color}', item_id=item_id)
+        )
+
+    return accordion_items
+
+# make accordion for privacyspy data
+def make_rubric_accordion(rubric_list):
+
+    # check if rubric is available
+    if isinstance(rubric_list,str) or not rubric_list:
+        return html.P("No rubric data available.", className="text-muted")
 
+    rubric_sections = []
+
+    for category, items in group_rubric(rubric_list).items():
         rubric_sections.append(
             html.Div([
                 html.Div([
                     html.H5(category, className="rubric-category"),
                     html.I(className='bi bi-search'),
                 ], id='category-title'),
-                dbc.Accordion(accordion_items, start_collapsed=True,
-                                always_open=False, flush=True, className='mb-2')
+                dbc.Accordion(make_rubric_items(items, category), id={'type': 'rubric-accordion', 'index': category},
+                              start_collapsed=True, always_open=False, flush=True, className='mb-2')
             ])
         )
 
@@ -242,7 +316,7 @@ def policy_links(policies):
     if extra_links:
         links_content += [
             dbc.Collapse(
-                html.Div(extra_links, className='mb-2'),
+                html.Div(extra_links, id={'type':'collapse-body', 'index': 'policy-link'}, className='mb-2'),
                 id={'type':'collapse', 'index': 'policy-link'},
                 is_open=False
             ),
@@ -261,131 +335,140 @@ def policy_links(policies):
      
 # -------------- Layout --------------
 
-app.layout = dbc.Container([
-
- # ------------------ HEADER ------------------
-        dbc.Row([
-            dbc.Col(html.Img(src="assets/SSM_Logo.png", id="logo"), md=2, sm=12),
-            dbc.Col(
-                html.Div(
-                    [
-                        dbc.Label('Site Selection: ', html_for='site-dropdown', className='mt-2'),
-                        dcc.Dropdown(
-                            id='site-dropdown',
-                            options = sites,
-                            placeholder="Type a site..",
-                            clearable=False,
-                        )
-                    ],
-                    className="search-bar"
+# built per page load so new visitors get the current catalog state
+def serve_layout():
+    ready = catalog.ready.is_set()
+
+    return dbc.Container([
+
+     # ------------------ HEADER ------------------
+            dbc.Row([
+                dbc.Col(html.Img(src="assets/SSM_Logo.png", id="logo"), md=2, sm=12),
+                dbc.Col(
+                    html.Div(
+                        [
+                            dbc.Label('Site Selection: ', html_for='site-dropdown', className='mt-2'),
+                            # options are filled in by search_sites as the user types
+                            dcc.Dropdown(
+                                id='site-dropdown',
+                                options = [],
+                                placeholder="Type a site.." if ready else "Loading sites..",
+                                clearable=False,
+                            ),
+                            # polls for the background catalog build until it is swapped in
+                            dcc.Interval(id='catalog-poll', interval=2000, disabled=ready),
+                        ],
+                        className="search-bar"
+                    ),
+                    md=4, sm=12, xs=12
                 ),
-                md=4, sm=12, xs=12
-            ),
-            dbc.Col(
-                html.Div(
-                    [
-                        dbc.Label('Comparison Selection: ', html_for='comparison-dropdown', className='mt-2'),
-                        dcc.Dropdown(
-                            id='comparison-dropdown',
-                            options = [],
-                            placeholder="Type a site..",
-                            disabled = True,
-                            clearable=False
-                        )
-                    ],
-                    className = 'compare-bar'
+                dbc.Col(
+                    html.Div(
+                        [
+                            dbc.Label('Comparison Selection: ', html_for='comparison-dropdown', className='mt-2'),
+                            dcc.Dropdown(
+                                id='comparison-dropdown',
+                                options = [],
+                                placeholder="Type a site..",
+                                disabled = True,
+                                clearable=False
+                            )
+                        ],
+                        className = 'compare-bar'
+                    ),
+                    id='compare-column',
+                    className="hidden",
+                    md=4, sm=12, xs=12
                 ),
-                id='compare-column',
-                className="hidden",
-                md=4, sm=12, xs=12
-            ),
 
-             # Toggle Switch
-            dbc.Col([
-                html.Div(
-                    dbc.Checklist(
-                        options=[{"label": "Compare", "value": 1}],
-                        value=[],
-                        id="switch-input",
-                        switch=True,
-                    ),
-                id='header-switch',
-                )
-            ], md=2, sm=12),
-        ], id="header"),
-
-    # ------------------ Main Content ------------------
-            html.Div(
-            id="dashboard-content",
-
-            # Placeholder layout for where components will appear
-            children=[
-                dbc.Row([
-                    dbc.Col(
-                        dcc.Loading(
-                            type="circle",
-                            color="#0d6efd",
-                            children=dbc.Card(dbc.CardBody(
-                                html.Div(id="gauge-chart-placeholder")
-                            ))
+                 # Toggle Switch
+                dbc.Col([
+                    html.Div(
+                        dbc.Checklist(
+                            options=[{"label": "Compare", "value": 1}],
+                            value=[],
+                            id="switch-input",
+                            switch=True,
                         ),
-                        id='search-gauge-column',
+                    id='header-switch',
+                    )
+                ], md=2, sm=12),
+            ], id="header"),
+
+        # ------------------ Main Content ------------------
+                html.Div(
+                id="dashboard-content",
+
+                # Placeholder layout for where components will appear
+                children=[
+                    dbc.Row([
+                        dbc.Col(
+                            dcc.Loading(
+                                type="circle",
+                                color="#0d6efd",
+                                children=dbc.Card(dbc.CardBody(
+                                    html.Div(id="gauge-chart-placeholder")
+                                ))
+                            ),
+                            id='search-gauge-column',
                         
-                    ),
-                    dbc.Col(
-                        dcc.Loading(
-                            type="circle",
-                            color="#0d6efd",
-                            delay_hide = 500 ,
-                            children=dbc.Card(dbc.CardBody(
-                                html.Div(id="comparison-gauge-placeholder")
-                            ))
                         ),
-                        id='comparison-gauge-column',
+                        dbc.Col(
+                            dcc.Loading(
+                                type="circle",
+                                color="#0d6efd",
+                                delay_hide = 500 ,
+                                children=dbc.Card(dbc.CardBody(
+                                    html.Div(id="comparison-gauge-placeholder")
+                                ))
+                            ),
+                            id='comparison-gauge-column',
                         
-                    )
-                ], className='hidden mb-3'),
-
-                # Placeholder for points accordion
-                dcc.Loading(
-                    type="circle",
-                    color="#0d6efd",
-                    delay_hide = 500 ,
-                    children=html.Div(id="points-placeholder"),
-                ),
+                        )
+                    ], className='hidden mb-3'),
+
+                    # Placeholder for points accordion
+                    dcc.Loading(
+                        type="circle",
+                        color="#0d6efd",
+                        delay_hide = 500 ,
+                        children=html.Div(id="points-placeholder"),
+                    ),
 
-                # Placeholder for rubric accordion
-                dcc.Loading(
-                    type="circle",
-                    color="#0d6efd",
-                    delay_hide = 500 ,
-                    children=html.Div(id="rubric-placeholder"),
-                ),
-            ]
-        ),
+                    # Placeholder for rubric accordion
+                    dcc.Loading(
+                        type="circle",
+                        color="#0d6efd",
+                        delay_hide = 500 ,
+                        children=html.Div(id="rubric-placeholder"),
+                    ),
+                ]
+            ),
        
 
-        html.Footer([
-                html.P("© Smart Social Monitor. All Rights Reserved."),
-                html.P([
-                    "Developed by: ",
-                    html.A("Brandon", href="https://www.linkedin.com/in/brandon-redman-209732232/", target="_blank"),
-                    " | ",
-                    html.A("Munim", href="https://www.linkedin.com/in/munimmelaque/", target="_blank"),
-                    " | ",
-                    html.A("Ayman", href="https://www.linkedin.com/in/ayman-najmuddin-406519284/", target="_blank"),
-                    " | ",
-                    html.A("Ragib", href="https://www.linkedin.com/in/ragib-ehsan", target="_blank"),
-                ]),
-                html.P([
-                    "Data Used From ",
-                    html.A("PrivacySpy", href="https://privacyspy.org", target="_blank"),
-                    " and ",
-                    html.A("TOSDR", href="https://tosdr.org", target="_blank")
-                ])
-            ], id="footer")
+            html.Footer([
+                    html.P("© Smart Social Monitor. All Rights Reserved."),
+                    html.P([
+                        "Developed by: ",
+                        html.A("Brandon", href="https://www.linkedin.com/in/brandon-redman-209732232/", target="_blank"),
+                        " | ",
+                        html.A("Munim", href="https://www.linkedin.com/in/munimmelaque/", target="_blank"),
+                        " | ",
+                        html.A("Ayman", href="https://www.linkedin.com/in/ayman-najmuddin-406519284/", target="_blank"),
+                        " | ",
+                        html.A("Ragib", href="https://www.linkedin.com/in/ragib-ehsan", target="_blank"),
+                    ]),
+                    html.P([
+                        "Data Used From ",
+                        html.A("PrivacySpy", href="https://privacyspy.org", target="_blank"),
+                        " and ",
+                        html.A("TOSDR", href="https://tosdr.org", target="_blank")
+                    ])
+                ], id="footer")
+
+            ], fluid=True, id="main-container")
 
-        ], fluid=True, id="main-container")
+app.layout = serve_layout
 
 # ------- Callbacks -----------
 @app.callback(
@@ -396,36 +479,19 @@ app.layout = dbc.Container([
 # fills dashboard with content
 def update_dashboard(site):
 
-    privacyspy_data = controller.get_privacyspy_info(site)
-    tosdr_data = controller.get_tosdr_data(site)
+    lookup = fetch_site(controller, site, scores=scores)
+    privacyspy_data = lookup['privacyspy_data']
+    tosdr_data = lookup['tosdr_data']
 
-    points_component, rubric_component, privacy_score, company_name = helper(privacyspy_data, tosdr_data)
+    points_component, rubric_component = helper(privacyspy_data, tosdr_data)
+    privacy_score = lookup['score']
+    company_name = lookup['name']
 
-    image = controller.get_site_image(privacyspy_data, tosdr_data)
-    policies = controller.get_policy_urls(privacyspy_data, tosdr_data)
+    image = lookup['image']
+    policies = lookup['policies']
 
     # search gauge chart
-    fig = go.Figure(go.Indicator(
-        mode='gauge+number',
-        value=privacy_score,
-        title={'text': f"{company_name.title()} Policy Score"},
-        gauge={
-            'axis': {'range': [0, 10], 'tickvals':[0,2,5,8,10], 'ticktext':['Abysmal','Bad', 'Tolerable', 'Good','Excellent']}, 
-            'bar': {'color': "black"},   # needle/bar color
-            'steps': [
-                {'range': [0, 2], 'color': 'red'},
-                {'range': [2, 5], 'color': 'orange'},
-                {'range': [5, 8], 'color': 'yellow'},
-                {'range': [8, 10], 'color': 'green'}
-            ],
-
-        }
-    )
-    )
-    fig.update_layout(
-        paper_bgcolor="rgba(0,0,0,0)",
-        font=dict(color = 'white'),
-    )
+    fig = gauge_figure(privacy_score, company_name)
 
     # ---------- Return dynamic dashboard content ----------
     dash_content = html.Div([
@@ -442,7 +508,7 @@ def update_dashboard(site):
                         dbc.CardBody([
                             html.Div(html.Div(html.Img(src=image, alt="") if image else None, id='site-logo'), id='site-logo-div'),
                             dcc.Graph(figure=fig, id="gauge-chart"),
-                            policy_links(policies)
+                            renders.render('policies', policies, policy_links)
                         ])
                     )
                 )
@@ -485,55 +551,155 @@ def update_dashboard(site):
     ], className='mb-4')
     return dash_content
 
+# typeahead for the site dropdown, matches come from the catalog's search index
+@app.callback(
+    Output('site-dropdown', 'options'),
+    Input('site-dropdown', 'search_value'),
+    State('site-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def search_sites(search_value, value):
+    # keep the last matches once a site is picked and the search box clears
+    if not search_value:
+        return no_update
+
+    options = catalog.index.search(search_value)
+
+    # the selected site has to stay an option or the dropdown drops it
+    if value and value not in options:
+        options.append(value)
+
+    return options
+
+# tells the site dropdown when the freshly built catalog is searchable,
+# options need no invalidating as search_sites always reads the live index
+@app.callback(
+    Output('site-dropdown', 'placeholder'),
+    Output('catalog-poll', 'disabled'),
+    Input('catalog-poll', 'n_intervals'),
+    prevent_initial_call=True
+)
+def refresh_site_options(n_intervals):
+    ready = catalog.ready.is_set()
+    placeholder = "Type a site.." if ready else "Loading sites.."
+
+    return placeholder, ready
+
+# the selected site's data for sections loaded on demand, cached by the time anything is expanded
+def site_payloads(site):
+    row = scores.get(site, max_age=config.SCORES_MAX_AGE)
+    if row:
+        return row['privacyspy_data'], row['tosdr_data']
+    return controller.get_privacyspy_info(site), controller.get_tosdr_data(site)
+
 # handles view more/less logic in points accordion
+# the hidden points are only sent the first time a classification is opened
 @app.callback(
     Output({'type': 'collapse', 'index': MATCH}, 'is_open'),
     Output({'type': 'toggle', 'index': MATCH}, 'children'),
+    Output({'type': 'collapse-body', 'index': MATCH}, 'children'),
     Input({'type': 'toggle', 'index': MATCH}, 'n_clicks'),
     State({'type': 'collapse', 'index': MATCH}, 'is_open'),
+    State('site-dropdown', 'value'),
     prevent_initial_call=True
 )
-def toggle_collapse(n_clicks, is_open):
+def toggle_collapse(n_clicks, is_open, site):
     if not n_clicks:
-        return is_open, "View more"
+        return is_open, "View more", no_update
     new_state = not is_open
     new_label = "View less" if new_state else "View more"
-    return new_state, new_label
+
+    classification = ctx.triggered_id['index']
+    if n_clicks > 1 or classification == 'policy-link':
+        return new_state, new_label, no_update
+
+    _, tosdr_data = site_payloads(site)
+    if not isinstance(tosdr_data, dict):
+        return new_state, new_label, no_update
+
+    points = group_points(tosdr_data).get(classification, [])
+    extra_items = dbc.Accordion(
+        make_point_items(points[POINTS_SHOWN:], classification, start=POINTS_SHOWN),
+        id={'type': 'points-accordion', 'index': classification, 'part': 'more'},
+        start_collapsed=True, flush=True
+    )
+    return new_state, new_label, extra_items
+
+# fills in a point's description when its accordion item is opened
+@app.callback(
+    Output({'type': 'points-accordion', 'index': MATCH, 'part': MATCH}, 'children'),
+    Input({'type': 'points-accordion', 'index': MATCH, 'part': MATCH}, 'active_item'),
+    State('site-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def load_point_details(active_item, site):
+    _, tosdr_data = site_payloads(site)
+    if not active_item or not isinstance(tosdr_data, dict):
+        return no_update
+
+    classification = ctx.triggered_id['index']
+    points = group_points(tosdr_data).get(classification, [])
+
+    if ctx.triggered_id['part'] == 'more':
+        return make_point_items(points[POINTS_SHOWN:], classification, POINTS_SHOWN, active_item)
+    return make_point_items(points[:POINTS_SHOWN], classification, 0, active_item)
+
+# fills in a rubric answer and citation when its accordion item is opened
+@app.callback(
+    Output({'type': 'rubric-accordion', 'index': MATCH}, 'children'),
+    Input({'type': 'rubric-accordion', 'index': MATCH}, 'active_item'),
+    State('site-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def load_rubric_details(active_item, site):
+    privacyspy_data, _ = site_payloads(site)
+    if not active_item or not isinstance(privacyspy_data, list):
+        return no_update
+
+    category = ctx.triggered_id['index']
+    return make_rubric_items(group_rubric(privacyspy_data).get(category, []), category, active_item)
 
 # handles header switch for when compare data appears
+# enables the compare dropdown only when a site is selected
 @app.callback(
     Output('switch-input', 'value'),
     Output('compare-column', 'className'),
+    Output('comparison-dropdown', 'disabled'),
     Input('switch-input', 'value'),
     Input('site-dropdown', 'value'),
     prevent_initial_call=True
 )
 
-def toggle_or_reset_compare(switch, n_clicks):
+def toggle_or_reset_compare(switch, site):
     trigger = ctx.triggered_id
 
     if trigger == 'site-dropdown':
-        return [0], 'hidden'
+        return [0], 'hidden', not site
 
     if 1 in switch:
-        return switch, ''
+        return switch, '', not site
     else:
-        return switch, 'hidden'
+        return switch, 'hidden', not site
 
 # handles logic for compare dropdown list
-# enables the compare dropdown only when a site is selected
+# same typeahead as the site dropdown, minus the site being compared against
 @app.callback(
     Output('comparison-dropdown', 'options'),
-    Output('comparison-dropdown', 'disabled'),
-    Input('site-dropdown', 'value'),
+    Input('comparison-dropdown', 'search_value'),
+    State('comparison-dropdown', 'value'),
+    State('site-dropdown', 'value'),
     prevent_initial_call=True
 )
-def update_comparison_dropdown(site):
-    if site:
-        comparison_sites = [s for s in sites if s != site]
-        return comparison_sites, False
-    else:
-        return sites, True
+def update_comparison_dropdown(search_value, value, site):
+    if not search_value:
+        return no_update
+
+    options = catalog.index.search(search_value, exclude=site)
+
+    if value and value not in options:
+        options.append(value)
+
+    return options
 
 
 
@@ -548,31 +714,13 @@ def update_comparison_dropdown(site):
 )
 def update_comparison_gauge(compare_site):
     
-    privacyspy_data = controller.get_privacyspy_info(compare_site)
-    tosdr_data = controller.get_tosdr_data(compare_site)
-    compare_score = helper(privacyspy_data, tosdr_data)[2]
-    compare_name = helper(privacyspy_data, tosdr_data)[3]
-    compare_image = controller.get_site_image(privacyspy_data, tosdr_data)
-    compare_policies = controller.get_policy_urls(privacyspy_data, tosdr_data)
-    fig = go.Figure(go.Indicator(
-        mode='gauge+number',
-        value=compare_score,
-        title={'text': f"{compare_name.title()} Policy Score"},
-        gauge={
-            'axis': {'range': [0, 10], 'tickvals':[0,2,5,8,10], 'ticktext':['Abysmal','Bad', 'Tolerable', 'Good','Excellent']},
-            'bar': {'color': "black"},
-            'steps': [
-                {'range': [0, 2], 'color': 'red'},
-                {'range': [2, 5], 'color': 'orange'},
-                {'range': [5, 8], 'color': 'yellow'},
-                {'range': [8, 10], 'color': 'green'}
-            ],
-        }
-    ))
-    fig.update_layout(
-        paper_bgcolor="rgba(0,0,0,0)",
-        font=dict(color = 'white'),
-    )
+    # only the gauge is shown for the comparison site, so no accordions are built
+    lookup = fetch_site(controller, compare_site, scores=scores)
+    compare_score = lookup['score']
+    compare_name = lookup['name']
+    compare_image = lookup['image']
+    compare_policies = lookup['policies']
+    fig = gauge_figure(compare_score, compare_name)
 
     return dcc.Loading(
             type="circle",
@@ -582,7 +730,7 @@ def update_comparison_gauge(compare_site):
                 dbc.CardBody([
                     html.Div(html.Div(html.Img(src=compare_image, alt='') if compare_image else None, id='site-logo'), id='site-logo-div'),
                     dcc.Graph(figure=fig, id="comparison-gauge-chart"),
-                    policy_links(compare_policies)
+                    renders.render('policies', compare_policies, policy_links)
                 ]),
                 color='secondary'
         )), '', 6
@@ -0,0 +1,74 @@
+# gunicorn settings, picked up from the working directory by: gunicorn dashboard:server
+# with preload the catalog and privacyspy data are loaded once in the master and
+# the forked workers share those pages instead of each building their own copy
+
+import gc
+import os
+import subprocess
+import sys
+import threading
+import time
+
+bind = os.environ.get('SSM_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('SSM_WORKERS', 2))
+preload_app = os.environ.get('SSM_PRELOAD', '1') != '0'
+
+# seconds between catalog refreshes run by the master, 0 turns them off
+refresh_interval = int(os.environ.get('SSM_REFRESH_INTERVAL', 86400))
+
+if preload_app:
+    raw_env = ['SSM_STARTUP=preload']
+
+    # no collections while the app loads, a full pass would touch every object
+    # and the workers' copy on write pages with them
+    gc.disable()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+
+    # one pass before the first fork, it also untracks the index tuples
+    gc.collect()
+
+    if not refresh_interval:
+        return
+
+    import dashboard
+
+    # a first run has nothing saved yet, so the first refresh starts straight away
+    delay = refresh_interval if dashboard.catalog.sites else 0
+    thread = threading.Thread(target=refresh, args=(server, delay), name='catalog-refresh', daemon=True)
+    thread.start()
+
+
+# crawls in a separate process so the master's heap stays as the workers inherited it,
+# the refresh sends the HUP itself on success: new workers fork from the fresh data,
+# old ones drain. It detaches, the master would otherwise reap it as a worker
+def refresh(server, delay):
+    while True:
+        time.sleep(delay)
+        subprocess.run([sys.executable, '-m', 'backend.refresh', '--detach', '--reload', str(server.pid)])
+        delay = refresh_interval
+
+
+def on_reload(server):
+    if not preload_app:
+        return
+
+    import dashboard
+
+    # objects frozen for the last workers can be collected again once replaced
+    gc.unfreeze()
+    dashboard.reload_catalog()
+
+
+# everything the master holds now moves to the permanent generation, the workers'
+# collections never visit it, so its pages stay shared
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()